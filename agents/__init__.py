@@ -1,3 +1,92 @@
 """
 Package degli agenti del sistema multiagente
+
+Gli agenti sono caricati in modo pigro: il modulo di un agente (con le sue
+dipendenze pesanti, es. sympy o openmeteo_requests) viene importato solo al
+primo utilizzo tramite il registro AGENT_REGISTRY
 """
+
+import importlib
+import threading
+from typing import Callable
+
+
+# Nome agente -> (modulo, funzione di esecuzione)
+AGENT_REGISTRY = {
+    "WEATHER": ("agents.weather_agent", "run_weather_agent"),
+    "HOROSCOPE": ("agents.horoscope_agent", "run_horoscope_agent"),
+    "GENERAL": ("agents.general_agent", "run_general_agent"),
+    "WIKIPEDIA": ("agents.wikipedia_agent", "run_wikipedia_agent"),
+    "CALCULATOR": ("agents.calculator_agent", "run_calculator_agent"),
+    "TRANSLATOR": ("agents.translator_agent", "run_translator_agent"),
+}
+
+# Nome agente -> funzione che estrae gli slot dalla query con l'LLM
+SLOT_EXTRACTORS = {
+    "WEATHER": "extract_weather_slots",
+    "HOROSCOPE": "extract_horoscope_slots",
+    "CALCULATOR": "extract_calculation_slots",
+    "TRANSLATOR": "extract_translation_slots",
+}
+
+_runners: dict = {}
+_lock = threading.Lock()
+
+
+def get_agent_module(agent: str):
+    """
+    Importa (al primo utilizzo) il modulo dell'agente
+
+    Args:
+        agent: Nome dell'agente (es. "WEATHER")
+
+    Returns:
+        Il modulo dell'agente
+    """
+    if agent not in AGENT_REGISTRY:
+        raise KeyError(f"Agente sconosciuto: {agent}")
+    module_name, _ = AGENT_REGISTRY[agent]
+    return importlib.import_module(module_name)
+
+
+def get_agent_runner(agent: str) -> Callable[..., dict]:
+    """
+    Restituisce la funzione run_*_agent dell'agente, importandone il modulo al primo utilizzo
+
+    Args:
+        agent: Nome dell'agente (es. "WEATHER")
+
+    Returns:
+        La funzione che esegue l'agente
+    """
+    runner = _runners.get(agent)
+    if runner is None:
+        # Il lock evita import concorrenti dello stesso modulo da più thread
+        with _lock:
+            runner = _runners.get(agent)
+            if runner is None:
+                _, function_name = AGENT_REGISTRY.get(agent, (None, None))
+                runner = getattr(get_agent_module(agent), function_name)
+                _runners[agent] = runner
+    return runner
+
+
+def get_slot_extractor(agent: str) -> Callable[[str], dict] | None:
+    """
+    Restituisce la funzione extract_*_slots dell'agente, se l'agente accetta slot pre-estratti
+
+    Args:
+        agent: Nome dell'agente (es. "WEATHER")
+
+    Returns:
+        La funzione che estrae gli slot dalla query, oppure None
+    """
+    function_name = SLOT_EXTRACTORS.get(agent)
+    if function_name is None:
+        return None
+    return getattr(get_agent_module(agent), function_name)
+
+
+def loaded_agents() -> list:
+    """Elenco degli agenti il cui modulo è già stato caricato"""
+    return sorted(_runners)
@@ -3,17 +3,22 @@ Agente Calcolatore - Parser matematico sicuro con conversioni e funzioni avanzat
 Utilizza sympy per calcoli precisi e OpenAI per l'estrazione intelligente delle espressioni
 """
 
-import os
 import json
 import re
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
-import sympy as sp
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
+import sys
+from pathlib import Path
+
+# Aggiungi il path parent per importare i moduli condivisi
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from metrics import timed_node, timed_agent
+from llm_usage import invoke_llm, PROMPT_EXTRACTION
+from llm_provider import get_llm
+from graph_rendering import render_graph_files
 
 # Carica le variabili d'ambiente
 load_dotenv()
@@ -22,6 +27,7 @@ load_dotenv()
 class CalculatorState(TypedDict):
     """Stato dell'agente calcolatore"""
     query: str
+    slots: dict | None  # Slot già estratti dal supervisore (routing combinato)
     expression: str | None
     calculation_type: str | None  # arithmetic, conversion, percentage, equation
     result: str | None
@@ -64,31 +70,20 @@ def fahrenheit_to_celsius(f):
     return (f - 32) * 5/9
 
 
-def extract_mathematical_expression(state: CalculatorState) -> CalculatorState:
+def extract_calculation_slots(query: str) -> dict:
     """
-    Estrae l'espressione matematica dalla query usando OpenAI
-    Identifica il tipo di calcolo richiesto
+    Estrae con l'LLM gli slot dell'agente dalla query
     
     Args:
-        state: Lo stato dell'agente
+        query: La domanda dell'utente
         
     Returns:
-        Lo stato aggiornato con l'espressione estratta
+        Dizionario con type, expression, description e valid
     """
-    query = state["query"]
+    # Inizializza il modello OpenAI
+    llm = get_llm(temperature=0)
     
-    # Aggiungiamo il messaggio dell'utente
-    state["messages"].append(HumanMessage(content=query))
-    
-    try:
-        # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        prompt = f"""Analizza questa query in italiano ed estrai l'operazione matematica richiesta.
+    prompt = f"""Analizza questa query in italiano ed estrai l'operazione matematica richiesta.
 
 Tipi di operazioni supportate:
 1. ARITHMETIC - Calcoli aritmetici: "quanto fa 2+2", "calcola 15*23", "(5+3)*2"
@@ -118,39 +113,102 @@ Per le conversioni usa abbreviazioni: km, mi, m, ft, cm, in, kg, lb, g, oz, l, g
 
 Se non è una richiesta matematica, metti "valid": false
 """
+    
+    # Chiama OpenAI
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un esperto nell'estrarre espressioni matematiche da testo in linguaggio naturale."),
+        HumanMessage(content=prompt)
+    ], agent="CALCULATOR", prompt=PROMPT_EXTRACTION)
+    
+    # Parsa la risposta JSON
+    try:
+        data = json.loads(response.content)
+    except json.JSONDecodeError:
+        # Prova a estrarre il JSON dalla risposta
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
+        else:
+            raise ValueError("Impossibile estrarre JSON dalla risposta")
+    
+    return data
+
+
+def apply_calculation_slots(state: CalculatorState, data: dict) -> CalculatorState:
+    """
+    Valida gli slot estratti e aggiorna lo stato
+    
+    Args:
+        state: Lo stato dell'agente
+        data: Gli slot estratti (dall'LLM dell'agente o dal supervisore)
         
-        # Chiama OpenAI
-        response = llm.invoke([
-            SystemMessage(content="Sei un esperto nell'estrarre espressioni matematiche da testo in linguaggio naturale."),
-            HumanMessage(content=prompt)
-        ])
-        
-        # Parsa la risposta JSON
-        try:
-            data = json.loads(response.content)
-        except json.JSONDecodeError:
-            # Prova a estrarre il JSON dalla risposta
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
-                raise ValueError("Impossibile estrarre JSON dalla risposta")
-        
-        if not data.get("valid", False):
-            state["expression"] = None
-            state["calculation_type"] = None
-            state["messages"].append(
-                AIMessage(content="Non riesco a identificare un'operazione matematica valida nella tua richiesta.")
-            )
-            return state
+    Returns:
+        Lo stato aggiornato con l'espressione
+    """
+    if not data.get("valid", False):
+        state["expression"] = None
+        state["calculation_type"] = None
+        state["messages"].append(
+            AIMessage(content="Non riesco a identificare un'operazione matematica valida nella tua richiesta.")
+        )
+        return state
+    
+    state["expression"] = data.get("expression", "").strip()
+    state["calculation_type"] = data.get("type", "ARITHMETIC").upper()
+    description = data.get("description", "")
+    
+    state["messages"].append(
+        AIMessage(content=f"Ho identificato: {description}. Calcolo in corso...")
+    )
+    
+    return state
+
+
+def extract_mathematical_expression(state: CalculatorState) -> CalculatorState:
+    """
+    Estrae l'espressione matematica dalla query usando OpenAI
+    Identifica il tipo di calcolo richiesto
+    
+    Args:
+        state: Lo stato dell'agente
         
-        state["expression"] = data.get("expression", "").strip()
-        state["calculation_type"] = data.get("type", "ARITHMETIC").upper()
-        description = data.get("description", "")
+    Returns:
+        Lo stato aggiornato con l'espressione estratta
+    """
+    query = state["query"]
+    
+    # Aggiungiamo il messaggio dell'utente
+    state["messages"].append(HumanMessage(content=query))
+    
+    try:
+        data = extract_calculation_slots(query)
+        apply_calculation_slots(state, data)
         
+    except Exception as e:
+        state["expression"] = None
+        state["calculation_type"] = None
         state["messages"].append(
-            AIMessage(content=f"Ho identificato: {description}. Calcolo in corso...")
+            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}")
         )
+    
+    return state
+
+
+def apply_prefilled_slots(state: CalculatorState) -> CalculatorState:
+    """
+    Usa gli slot già estratti dal supervisore (modalità routing combinato),
+    saltando la chiamata LLM di estrazione
+    
+    Args:
+        state: Lo stato dell'agente, con gli slot in "slots"
+        
+    Returns:
+        Lo stato aggiornato con l'espressione
+    """
+    state["messages"].append(HumanMessage(content=state["query"]))
+    
+    try:
+        apply_calculation_slots(state, state["slots"])
         
     except Exception as e:
         state["expression"] = None
@@ -162,6 +220,11 @@ Se non è una richiesta matematica, metti "valid": false
     return state
 
 
+def route_start(state: CalculatorState) -> str:
+    """Salta l'estrazione se il supervisore ha già fornito gli slot"""
+    return "apply_prefilled_slots" if state.get("slots") else "extract"
+
+
 def perform_calculation(state: CalculatorState) -> CalculatorState:
     """
     Esegue il calcolo in base al tipo identificato
@@ -208,6 +271,9 @@ def evaluate_expression(expression: str) -> str:
     Returns:
         Il risultato come stringa
     """
+    # Import al primo utilizzo: sympy richiede oltre 100 ms per essere caricato
+    from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
+    
     try:
         # Sostituzioni comuni per rendere l'espressione compatibile
         expr = expression.replace("^", "**")
@@ -328,6 +394,8 @@ def solve_equation(expression: str) -> str:
     Returns:
         Le soluzioni dell'equazione
     """
+    import sympy as sp
+    
     try:
         x = sp.Symbol('x')
         
@@ -406,12 +474,13 @@ def build_calculator_agent():
     workflow = StateGraph(CalculatorState)
     
     # Aggiungiamo i nodi
-    workflow.add_node("extract", extract_mathematical_expression)
-    workflow.add_node("calculate", perform_calculation)
-    workflow.add_node("format", format_result)
+    workflow.add_node("extract", timed_node("CALCULATOR", "extract")(extract_mathematical_expression))
+    workflow.add_node("apply_prefilled_slots", timed_node("CALCULATOR", "apply_prefilled_slots")(apply_prefilled_slots))
+    workflow.add_node("calculate", timed_node("CALCULATOR", "calculate")(perform_calculation))
+    workflow.add_node("format", timed_node("CALCULATOR", "format")(format_result))
     
     # Definiamo il flusso
-    workflow.add_edge(START, "extract")
+    workflow.add_conditional_edges(START, route_start, ["extract", "apply_prefilled_slots"])
     
     # Da extract a calculate se abbiamo un'espressione valida
     workflow.add_conditional_edges(
@@ -422,6 +491,15 @@ def build_calculator_agent():
             END: END
         }
     )
+    # Stessa transizione quando gli slot arrivano dal supervisore
+    workflow.add_conditional_edges(
+        "apply_prefilled_slots",
+        lambda state: "calculate" if state.get("expression") else END,
+        {
+            "calculate": "calculate",
+            END: END
+        }
+    )
     
     # Da calculate a format se abbiamo un risultato
     workflow.add_conditional_edges(
@@ -442,12 +520,14 @@ def build_calculator_agent():
     return graph
 
 
-def run_calculator_agent(query: str) -> dict:
+@timed_agent("CALCULATOR")
+def run_calculator_agent(query: str, slots: dict | None = None) -> dict:
     """
     Esegue l'agente calcolatore con la query dell'utente
     
     Args:
         query: La richiesta di calcolo
+        slots: Slot già estratti dal supervisore; se presenti l'estrazione con l'LLM viene saltata
         
     Returns:
         Il risultato dello stato finale
@@ -456,6 +536,7 @@ def run_calculator_agent(query: str) -> dict:
     
     initial_state = {
         "query": query,
+        "slots": slots,
         "expression": None,
         "calculation_type": None,
         "result": None,
@@ -474,29 +555,14 @@ def visualize_graph():
     graph = build_calculator_agent()
     
     try:
-        # Genera la rappresentazione Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
-        
-        # Salva il diagramma Mermaid
-        mermaid_path = "calculator_agent_graph.md"
-        with open(mermaid_path, "w", encoding="utf-8") as f:
-            f.write("# Grafo Agente Calcolatore\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-        print(f"✓ Diagramma Mermaid salvato in: {mermaid_path}")
-        
-         # 2. Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "calculator_agent_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(graph, "calculator_agent_graph", "Grafo Agente Calcolatore")
+        mermaid_code = rendering["mermaid"]
+        print(f"✓ Diagramma Mermaid salvato in: {rendering['md_path']}")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
         # Stampa in console
         print("\n" + "="*70)
@@ -3,14 +3,21 @@ Agente General - Gestisce small talk, saluti, presentazioni e query generiche
 Utilizza OpenAI per conversazioni naturali
 """
 
-import os
 from typing import TypedDict, Annotated
 from datetime import datetime
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# Aggiungi il path parent per importare i moduli condivisi
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from metrics import timed_node, timed_agent
+from llm_usage import invoke_llm, PROMPT_ANSWER
+from llm_provider import get_llm
+from graph_rendering import render_graph_files
 
 # Carica le variabili d'ambiente
 load_dotenv()
@@ -59,11 +66,7 @@ INFORMAZIONI DATA E ORA CORRENTE:
 """
         
         # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.7,  # Più creativo per conversazioni
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        llm = get_llm(temperature=0.7)  # Più creativo per conversazioni
         
         # System prompt per definire la personalità dell'assistente
         system_prompt = f"""Sei Alexa, un assistente virtuale amichevole e disponibile in italiano.
@@ -111,10 +114,10 @@ Mantieni le risposte brevi (2-4 frasi) a meno che non sia richiesto maggior dett
 IMPORTANTE: Non usare sempre "Come posso aiutarti oggi?". Sii creativa e varia le tue risposte!"""
 
         # Chiama OpenAI
-        response = llm.invoke([
+        response = invoke_llm(llm, [
             SystemMessage(content=system_prompt),
             HumanMessage(content=query)
-        ])
+        ], agent="GENERAL", prompt=PROMPT_ANSWER)
         
         response_text = response.content.strip()
         state["response"] = response_text
@@ -139,7 +142,7 @@ def build_general_agent():
     workflow = StateGraph(GeneralState)
     
     # Aggiungiamo il nodo
-    workflow.add_node("generate", generate_response)
+    workflow.add_node("generate", timed_node("GENERAL", "generate")(generate_response))
     
     # Definiamo il flusso
     workflow.add_edge(START, "generate")
@@ -151,6 +154,7 @@ def build_general_agent():
     return graph
 
 
+@timed_agent("GENERAL")
 def run_general_agent(query: str) -> dict:
     """
     Esegue l'agente general con una query
@@ -181,32 +185,18 @@ def visualize_graph():
     try:
         graph = build_general_agent()
         
-        # Genera il grafo Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(graph, "general_agent_graph", "Grafo Agente General")
         
         print("Grafo Mermaid dell'agente general:")
-        print(mermaid_code)
-        
-        # Salva in un file
-        with open("general_agent_graph.md", "w", encoding="utf-8") as f:
-            f.write("# Grafo Agente General\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
+        print(rendering["mermaid"])
         
-        print("\nGrafo salvato in general_agent_graph.md")
+        print(f"\nGrafo salvato in {rendering['md_path']}")
         
-        #Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "general_agent_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
     except Exception as e:
         print(f"Errore nella visualizzazione del grafo: {e}")
@@ -4,13 +4,16 @@ Utilizza OpenAI per l'estrazione intelligente e la traduzione italiano-inglese
 """
 
 import os
+import re
+import contextvars
 import requests
 import json
+import unicodedata
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import sys
 from pathlib import Path
@@ -18,18 +21,33 @@ from pathlib import Path
 # Aggiungi il path parent per importare conversation_manager
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from conversation_manager import conversation_manager
+from metrics import metrics_registry, timed_node, timed_agent, Counter
+from llm_usage import invoke_llm, describe_llm_error, PROMPT_ANSWER, PROMPT_EXTRACTION
+from llm_provider import get_llm
+from swr_cache import horoscope_cache
+from deadline import stage_timeout
+from circuit_breaker import protected
+from http_client import http_get
+from graph_rendering import render_graph_files
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
+# Endpoint di Horoscope API (sovrascrivibile, es. per i benchmark offline)
+HOROSCOPE_API_URL = os.getenv("HOROSCOPE_API_URL", "https://horoscope-app-api.vercel.app/api/v1/get-horoscope")
+
 
 class HoroscopeState(TypedDict):
     """Stato dell'agente oroscopo"""
     query: str
+    session_id: str
+    slots: dict | None  # Slot già estratti dal supervisore (routing combinato)
     zodiac_sign: str | None
     zodiac_sign_en: str | None
+    zodiac_signs: list | None  # Tutti i segni richiesti, nell'ordine (il primo è zodiac_sign)
     time_period: str | None  # daily, weekly, monthly, yearly
     horoscope_data: dict | None
+    horoscopes: list | None  # (segno, dati dell'API) di ogni segno recuperato
     messages: Annotated[list, operator.add]
 
 
@@ -67,34 +85,141 @@ PERIOD_IT_EN = {
     "annuale": "monthly"
 }
 
+# Forme flesse e nomi inglesi dei segni, normalizzati (minuscolo, senza accenti) -> segno in italiano
+ZODIAC_SIGN_FORMS = {
+    **{sign: sign for sign in ZODIAC_SIGNS_IT_EN},
+    **{sign_en: sign for sign, sign_en in ZODIAC_SIGNS_IT_EN.items()},
+    "arieti": "ariete",
+    "tori": "toro",
+    "gemello": "gemelli",
+    "cancri": "cancro",
+    "leoni": "leone",
+    "vergini": "vergine",
+    "bilance": "bilancia",
+    "scorpioni": "scorpione",
+    "sagittari": "sagittario",
+    "capricorni": "capricorno",
+    "acquari": "acquario",
+    "aquario": "acquario",
+    "pesce": "pesci",
+}
 
-def extract_zodiac_and_period(state: HoroscopeState) -> HoroscopeState:
+# Forme flesse dei periodi, normalizzate -> parola di PERIOD_IT_EN
+PERIOD_FORMS = {
+    **{word: word for word in PERIOD_IT_EN},
+    "odierno": "oggi",
+    "giornaliera": "giornaliero",
+    "quotidiano": "giornaliero",
+    "settimane": "settimana",
+    "settimanali": "settimanale",
+    "mesi": "mese",
+    "mensili": "mensile",
+    "anni": "anno",
+    "annuali": "annuale",
+}
+
+# Descrizione del periodo usata nelle risposte
+PERIOD_DESCRIPTIONS = {"daily": "di oggi", "weekly": "della settimana", "monthly": "del mese"}
+
+# Intestazione delle sezioni della traduzione di più oroscopi in una sola chiamata (es. "[[ARIETE]]")
+SECTION_MARKER = "[[{}]]"
+_SECTION = re.compile(r"^\s*\[\[([A-Z]+)\]\]\s*$", re.MULTILINE)
+
+# Separatori di parola: apostrofi ("dell'ariete"), punteggiatura e spazi
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def slot_extractions() -> Counter:
+    """Estrazioni degli slot per percorso: regole locali (rules) o LLM (llm)"""
+    return metrics_registry.counter(
+        "alexa_slot_extractions_total",
+        "Estrazioni degli slot per agente e percorso (regole o LLM)",
+        ("agent", "path")
+    )
+
+
+def normalize_words(query: str) -> list:
+    """
+    Divide la query in parole normalizzate
+
+    Args:
+        query: La domanda dell'utente
+
+    Returns:
+        Le parole in minuscolo e senza accenti; gli articoli apostrofati restano separati ("dell", "ariete")
+    """
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(" ", text).split()
+
+
+def match_horoscope_slots(query: str) -> dict | None:
     """
-    Estrae il segno zodiacale e il periodo dalla query dell'utente usando OpenAI
+    Estrae segno e periodo con il vocabolario dell'agente, senza chiamare l'LLM
     
     Args:
-        state: Lo stato dell'agente
+        query: La domanda dell'utente
         
     Returns:
-        Lo stato aggiornato con il segno zodiacale e il periodo estratti
+        Gli slot nello stesso formato di extract_horoscope_slots, oppure None se la query
+        non nomina alcun segno
     """
-    query = state["query"]
+    words = normalize_words(query)
+    # Tutti i segni nominati, nell'ordine e senza duplicati ("ariete, leone e pesci")
+    signs = list(dict.fromkeys(ZODIAC_SIGN_FORMS[word] for word in words if word in ZODIAC_SIGN_FORMS))
+    if not signs:
+        return None
     
-    # Aggiungiamo il messaggio dell'utente
-    state["messages"].append(HumanMessage(content=query))
+    # Una settimana o un mese nominati prevalgono su "oggi" ("oggi vorrei l'oroscopo settimanale");
+    # senza indicazioni l'oroscopo è quello del giorno, come per l'LLM
+    periods = [PERIOD_IT_EN[PERIOD_FORMS[word]] for word in words if word in PERIOD_FORMS]
+    time_period = next((period for period in periods if period != "daily"), "daily")
+    return {
+        "zodiac_sign": signs[0],
+        "zodiac_signs": signs,
+        "time_period": time_period,
+        "time_description": PERIOD_DESCRIPTIONS[time_period],
+        "validity": "VALIDO"
+    }
+
+
+def extract_horoscope_slots(query: str) -> dict:
+    """
+    Estrae gli slot dell'agente dalla query: con le regole locali se la query nomina
+    un segno, altrimenti con l'LLM
     
-    try:
-        # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+    Args:
+        query: La domanda dell'utente
         
-        # Lista dei segni per il prompt
-        segni_lista = ", ".join(ZODIAC_SIGNS_IT_EN.keys())
+    Returns:
+        Dizionario con zodiac_sign, zodiac_signs, time_period, time_description e validity
+    """
+    data = match_horoscope_slots(query)
+    if data is not None:
+        slot_extractions().inc(agent="HOROSCOPE", path="rules")
+        return data
+    
+    slot_extractions().inc(agent="HOROSCOPE", path="llm")
+    return llm_horoscope_slots(query)
+
+
+def llm_horoscope_slots(query: str) -> dict:
+    """
+    Estrae con l'LLM gli slot dell'agente dalla query
+    
+    Args:
+        query: La domanda dell'utente
         
-        prompt = f"""Analizza questa query in italiano ed estrai il segno zodiacale e l'indicazione temporale.
+    Returns:
+        Dizionario con zodiac_sign, time_period, time_description e validity
+    """
+    # Inizializza il modello OpenAI
+    llm = get_llm(temperature=0)
+    
+    # Lista dei segni per il prompt
+    segni_lista = ", ".join(ZODIAC_SIGNS_IT_EN.keys())
+    
+    prompt = f"""Analizza questa query in italiano ed estrai il segno zodiacale e l'indicazione temporale.
 
 Segni zodiacali validi: {segni_lista}
 
@@ -111,6 +236,7 @@ Query: {query}
 Rispondi in JSON con questo formato esatto:
 {{
     "zodiac_sign": "nome segno in italiano (minuscolo)",
+    "zodiac_signs": ["tutti i segni citati, in italiano (minuscolo), nell'ordine"],
     "time_period": "daily|weekly|monthly",
     "time_description": "descrizione breve (es. 'di oggi', 'della settimana', 'del mese')",
     "validity": "VALIDO" o "INVALIDO"
@@ -119,139 +245,334 @@ Rispondi in JSON con questo formato esatto:
 Se non trovi un segno zodiacale rispondi con "zodiac_sign": "NESSUNO"
 Se il periodo non è riconoscibile rispondi con "time_period": "daily"
 """
+    
+    # Chiama OpenAI
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un assistente che estrae segni zodiacali e periodi temporali da testo italiano. Rispondi sempre in JSON."),
+        HumanMessage(content=prompt)
+    ], agent="HOROSCOPE", prompt=PROMPT_EXTRACTION)
+    
+    # Parsa la risposta JSON
+    try:
+        data = json.loads(response.content)
+    except json.JSONDecodeError:
+        # Se non riesce a parsare, prova a estrarre il JSON dalla risposta
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
+        else:
+            raise ValueError("Impossibile estrarre JSON dalla risposta")
+    
+    return data
+
+
+def join_signs(signs: list) -> str:
+    """Elenco leggibile dei segni ("Ariete, Leone e Pesci")"""
+    names = [sign.capitalize() for sign in signs]
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} e {names[-1]}"
+
+
+def apply_horoscope_slots(state: HoroscopeState, data: dict) -> HoroscopeState:
+    """
+    Valida gli slot estratti e aggiorna lo stato
+    
+    Args:
+        state: Lo stato dell'agente
+        data: Gli slot estratti (dall'LLM dell'agente o dal supervisore)
         
-        # Chiama OpenAI
-        response = llm.invoke([
-            SystemMessage(content="Sei un assistente che estrae segni zodiacali e periodi temporali da testo italiano. Rispondi sempre in JSON."),
-            HumanMessage(content=prompt)
-        ])
-        
-        # Parsa la risposta JSON
-        try:
-            data = json.loads(response.content)
-        except json.JSONDecodeError:
-            # Se non riesce a parsare, prova a estrarre il JSON dalla risposta
-            import re
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
-                raise ValueError("Impossibile estrarre JSON dalla risposta")
-        
-        zodiac_sign = data.get("zodiac_sign", "NESSUNO").strip().lower()
-        time_period = data.get("time_period", "daily").strip().lower()
-        validity = data.get("validity", "INVALIDO")
-        time_description = data.get("time_description", "di oggi")
+    Returns:
+        Lo stato aggiornato con il segno zodiacale e il periodo
+    """
+    query = state["query"]
+    
+    zodiac_sign = data.get("zodiac_sign", "NESSUNO").strip().lower()
+    time_period = data.get("time_period", "daily").strip().lower()
+    validity = data.get("validity", "INVALIDO")
+    time_description = data.get("time_description", "di oggi")
+    
+    # Più segni nella stessa richiesta (solo quelli validi, senza duplicati)
+    signs = []
+    for name in data.get("zodiac_signs") or [zodiac_sign]:
+        name = (name or "").strip().lower()
+        if name in ZODIAC_SIGNS_IT_EN and name not in signs:
+            signs.append(name)
+    if zodiac_sign not in ZODIAC_SIGNS_IT_EN and signs:
+        zodiac_sign = signs[0]
+    
+    # Validazione segno zodiacale
+    if zodiac_sign.upper() == "NESSUNO" or zodiac_sign not in ZODIAC_SIGNS_IT_EN:
+        state["zodiac_sign"] = None
+        state["zodiac_sign_en"] = None
         
-        # Validazione segno zodiacale
-        if zodiac_sign.upper() == "NESSUNO" or zodiac_sign not in ZODIAC_SIGNS_IT_EN:
-            state["zodiac_sign"] = None
-            state["zodiac_sign_en"] = None
-            
-            # Salva la richiesta incompleta
-            conversation_manager.save_pending_request(
-                agent_type="HOROSCOPE",
-                original_query=query,
-                missing_info="zodiac_sign",
-                partial_data={"time_description": time_description, "time_period": time_period}
-            )
-            
-            state["messages"].append(
-                AIMessage(content=f"Non ho riconosciuto un segno zodiacale nella tua richiesta. Puoi dirmi per quale segno vuoi l'oroscopo? (es. {', '.join(list(ZODIAC_SIGNS_IT_EN.keys())[:3])}, ...)")
-            )
-            return state
+        # Salva la richiesta incompleta
+        conversation_manager.save_pending_request(
+            agent_type="HOROSCOPE",
+            original_query=query,
+            missing_info="zodiac_sign",
+            partial_data={"time_description": time_description, "time_period": time_period},
+            session_id=state.get("session_id", "default")
+        )
         
-        # Validazione periodo è tra quelli supportati
-        if time_period not in VALID_PERIODS:
-            state["zodiac_sign"] = None
-            state["zodiac_sign_en"] = None
-            state["messages"].append(
-                AIMessage(content=f"Periodo non valido. Posso fornirti l'oroscopo: giornaliero, settimanale o mensile. (L'oroscopo annuale non è al momento disponibile)")
-            )
-            return state
+        state["messages"].append(
+            AIMessage(content=f"Non ho riconosciuto un segno zodiacale nella tua richiesta. Puoi dirmi per quale segno vuoi l'oroscopo? (es. {', '.join(list(ZODIAC_SIGNS_IT_EN.keys())[:3])}, ...)")
+        )
+        return state
+    
+    # Validazione periodo è tra quelli supportati
+    if time_period not in VALID_PERIODS:
+        state["zodiac_sign"] = None
+        state["zodiac_sign_en"] = None
+        state["messages"].append(
+            AIMessage(content=f"Periodo non valido. Posso fornirti l'oroscopo: giornaliero, settimanale o mensile. (L'oroscopo annuale non è al momento disponibile)")
+        )
+        return state
+    
+    state["zodiac_sign"] = zodiac_sign
+    state["zodiac_sign_en"] = ZODIAC_SIGNS_IT_EN[zodiac_sign]
+    state["zodiac_signs"] = signs or [zodiac_sign]
+    state["time_period"] = time_period
+    
+    if len(state["zodiac_signs"]) > 1:
+        identified = f"segni {join_signs(state['zodiac_signs'])}"
+    else:
+        identified = f"segno {zodiac_sign.capitalize()}"
+    state["messages"].append(
+        AIMessage(content=f"Ho identificato: {identified}, oroscopo {time_description}. Sto recuperando i dati...")
+    )
+    
+    return state
+
+
+def extract_zodiac_and_period(state: HoroscopeState) -> HoroscopeState:
+    """
+    Estrae il segno zodiacale e il periodo dalla query dell'utente (regole locali, poi OpenAI)
+    
+    Args:
+        state: Lo stato dell'agente
         
-        state["zodiac_sign"] = zodiac_sign
-        state["zodiac_sign_en"] = ZODIAC_SIGNS_IT_EN[zodiac_sign]
-        state["time_period"] = time_period
+    Returns:
+        Lo stato aggiornato con il segno zodiacale e il periodo estratti
+    """
+    query = state["query"]
+    
+    # Aggiungiamo il messaggio dell'utente
+    state["messages"].append(HumanMessage(content=query))
+    
+    try:
+        data = extract_horoscope_slots(query)
+        apply_horoscope_slots(state, data)
         
+    except Exception as e:
+        state["zodiac_sign"] = None
+        state["zodiac_sign_en"] = None
+        state["time_period"] = None
         state["messages"].append(
-            AIMessage(content=f"Ho identificato: segno {zodiac_sign.capitalize()}, oroscopo {time_description}. Sto recuperando i dati...")
+            AIMessage(content=f"Errore nell'analisi della richiesta: {describe_llm_error(e)}")
         )
+    
+    return state
+
+
+def apply_prefilled_slots(state: HoroscopeState) -> HoroscopeState:
+    """
+    Usa gli slot già estratti dal supervisore (modalità routing combinato),
+    saltando la chiamata LLM di estrazione
+    
+    Args:
+        state: Lo stato dell'agente, con gli slot in "slots"
+        
+    Returns:
+        Lo stato aggiornato con il segno zodiacale e il periodo
+    """
+    state["messages"].append(HumanMessage(content=state["query"]))
+    
+    try:
+        apply_horoscope_slots(state, state["slots"])
         
     except Exception as e:
         state["zodiac_sign"] = None
         state["zodiac_sign_en"] = None
         state["time_period"] = None
         state["messages"].append(
-            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}. Controlla la tua API key di OpenAI.")
+            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}")
         )
     
     return state
 
 
+def route_start(state: HoroscopeState) -> str:
+    """Salta l'estrazione se il supervisore ha già fornito gli slot"""
+    return "apply_prefilled_slots" if state.get("slots") else "extract"
+
+
+# A circuito aperto si usa l'ultimo oroscopo ottenuto per lo stesso segno e periodo
+@protected("horoscope", key=lambda url: url)
+def fetch_horoscope_json(url: str) -> dict:
+    """
+    Interroga l'API Horoscope
+    
+    Args:
+        url: URL completo della richiesta (segno e periodo)
+        
+    Returns:
+        La risposta JSON dell'API
+    """
+    # Timeout ridotto al tempo rimanente del turno, se inferiore; la connessione è riusata
+    response = http_get(url, timeout=stage_timeout(10))
+    response.raise_for_status()
+    
+    return response.json()
+
+
+def horoscope_url(zodiac_sign_en: str, time_period: str) -> str:
+    """URL di Horoscope API per segno e periodo"""
+    # Mappa i periodi: daily richiede anche il parametro day
+    if time_period == "daily":
+        # Per daily, usiamo TODAY come parametro day
+        return f"{HOROSCOPE_API_URL}/{time_period}?sign={zodiac_sign_en}&day=TODAY"
+    # Per weekly, monthly, yearly non serve il parametro day
+    return f"{HOROSCOPE_API_URL}/{time_period}?sign={zodiac_sign_en}"
+
+
+def fetch_sign_horoscope(zodiac_sign_en: str, time_period: str) -> dict:
+    """
+    Recupera l'oroscopo di un segno, dalla cache o da Horoscope API
+    
+    Args:
+        zodiac_sign_en: Segno in inglese
+        time_period: daily, weekly o monthly
+        
+    Returns:
+        I dati dell'oroscopo ({"date": ..., "horoscope_data": ...})
+    """
+    url = horoscope_url(zodiac_sign_en, time_period)
+    
+    # Oroscopo in cache per segno e periodo: se scaduto da poco è restituito subito e
+    # aggiornato in background; le richieste concorrenti condividono una sola chiamata
+    data = horoscope_cache.get(url, fetch_horoscope_json, url)
+    
+    # L'API restituisce {"data": {"date": ..., "horoscope_data": ...}, "status": 200, "success": true}
+    if data.get("success") and "data" in data:
+        return data["data"]
+    raise ValueError("Formato risposta API non valido")
+
+
+def describe_fetch_error(error: Exception) -> str:
+    """Messaggio per l'utente relativo a un errore di Horoscope API"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        if "404" in str(error):
+            return "L'API Horoscope non supporta questa richiesta. Verifica che il periodo sia tra: giornaliero, settimanale, mensile."
+        return f"Errore HTTP dall'API Horoscope: {str(error)}"
+    if isinstance(error, requests.exceptions.RequestException):
+        return f"Errore di connessione all'API Horoscope: {str(error)}"
+    return f"Errore imprevisto: {str(error)}"
+
+
 def get_horoscope_data(state: HoroscopeState) -> HoroscopeState:
     """
-    Recupera i dati dell'oroscopo da Horoscope API
+    Recupera i dati dell'oroscopo da Horoscope API, in parallelo se i segni sono più di uno
     
     Args:
         state: Lo stato dell'agente
         
     Returns:
-        Lo stato aggiornato con i dati dell'oroscopo
+        Lo stato aggiornato con i dati dell'oroscopo di ogni segno recuperato
     """
     if not state.get("zodiac_sign_en"):
         return state
     
-    try:
-        zodiac_sign_en = state["zodiac_sign_en"]
-        time_period = state.get("time_period", "daily")
-        
-        # Mappa i periodi: daily richiede anche il parametro day
-        if time_period == "daily":
-            # Per daily, usiamo TODAY come parametro day
-            url = f"https://horoscope-app-api.vercel.app/api/v1/get-horoscope/{time_period}?sign={zodiac_sign_en}&day=TODAY"
-        else:
-            # Per weekly, monthly, yearly non serve il parametro day
-            url = f"https://horoscope-app-api.vercel.app/api/v1/get-horoscope/{time_period}?sign={zodiac_sign_en}"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+    signs = state.get("zodiac_signs") or [state["zodiac_sign"]]
+    time_period = state.get("time_period", "daily")
+    
+    if len(signs) > 1:
+        # Ogni richiesta gira nel contesto del turno, così rispetta la sua scadenza
+        with ThreadPoolExecutor(max_workers=len(signs), thread_name_prefix="horoscope") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, fetch_sign_horoscope, ZODIAC_SIGNS_IT_EN[sign], time_period)
+                for sign in signs
+            ]
+        results = [future.result for future in futures]
+    else:
+        results = [lambda: fetch_sign_horoscope(state["zodiac_sign_en"], time_period)]
+    
+    horoscopes = []
+    for sign, result in zip(signs, results):
+        try:
+            horoscopes.append((sign, result()))
+        except Exception as e:
+            prefix = f"{sign.capitalize()}: " if len(signs) > 1 else ""
+            state["messages"].append(AIMessage(content=prefix + describe_fetch_error(e)))
+    
+    state["horoscopes"] = horoscopes
+    state["horoscope_data"] = horoscopes[0][1] if horoscopes else None
+    return state
+
+
+def translate_horoscope(description: str) -> str:
+    """
+    Traduce un oroscopo dall'inglese all'italiano
+    
+    Args:
+        description: Il testo dell'oroscopo in inglese
         
-        # L'API restituisce {"data": {"date": ..., "horoscope_data": ...}, "status": 200, "success": true}
-        if data.get("success") and "data" in data:
-            state["horoscope_data"] = data["data"]
-        else:
-            raise ValueError("Formato risposta API non valido")
+    Returns:
+        Il testo tradotto
+    """
+    # Inizializza il modello OpenAI per la traduzione
+    llm = get_llm(temperature=0.3)
+    
+    # Traduci la descrizione principale
+    translation_prompt = f"""Traduci questo oroscopo dall'inglese all'italiano in modo fluente e naturale:
+
+{description}
+
+Mantieni lo stesso tono e stile, ma rendilo scorrevole in italiano."""
+    
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un traduttore esperto dall'inglese all'italiano, specializzato in oroscopi."),
+        HumanMessage(content=translation_prompt)
+    ], agent="HOROSCOPE", prompt=PROMPT_ANSWER)
+    
+    return response.content.strip()
+
+
+def translate_horoscopes(descriptions: dict) -> dict:
+    """
+    Traduce più oroscopi con una sola chiamata LLM, un oroscopo per sezione
+    
+    Args:
+        descriptions: Segno in italiano -> testo dell'oroscopo in inglese
         
-    except requests.exceptions.HTTPError as e:
-        state["horoscope_data"] = None
-        if "404" in str(e):
-            state["messages"].append(
-                AIMessage(content=f"L'API Horoscope non supporta questa richiesta. Verifica che il periodo sia tra: giornaliero, settimanale, mensile.")
-            )
-        else:
-            state["messages"].append(
-                AIMessage(content=f"Errore HTTP dall'API Horoscope: {str(e)}")
-            )
-    except requests.exceptions.RequestException as e:
-        state["horoscope_data"] = None
-        state["messages"].append(
-            AIMessage(content=f"Errore di connessione all'API Horoscope: {str(e)}")
-        )
-    except Exception as e:
-        state["horoscope_data"] = None
-        state["messages"].append(
-            AIMessage(content=f"Errore imprevisto: {str(e)}")
-        )
+    Returns:
+        Segno -> testo tradotto; le sezioni mancanti nella risposta restano in inglese
+    """
+    llm = get_llm(temperature=0.3)
     
-    return state
+    sections = "\n\n".join(
+        f"{SECTION_MARKER.format(sign.upper())}\n{description}" for sign, description in descriptions.items()
+    )
+    translation_prompt = f"""Traduci questi oroscopi dall'inglese all'italiano in modo fluente e naturale.
+Ogni oroscopo inizia con una riga di intestazione tra doppie parentesi quadre: ripeti ogni intestazione invariata, su una riga da sola, seguita dalla sua traduzione.
+
+{sections}
+
+Mantieni lo stesso tono e stile, ma rendili scorrevoli in italiano."""
+    
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un traduttore esperto dall'inglese all'italiano, specializzato in oroscopi."),
+        HumanMessage(content=translation_prompt)
+    ], agent="HOROSCOPE", prompt=PROMPT_ANSWER)
+    
+    # re.split con il gruppo alterna intestazioni e testi: [prima, SEGNO, testo, SEGNO, testo, ...]
+    parts = _SECTION.split(response.content)
+    translated = {parts[i].lower(): parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+    return {sign: translated.get(sign) or description for sign, description in descriptions.items()}
 
 
 def translate_and_format_horoscope(state: HoroscopeState) -> HoroscopeState:
     """
-    Traduce l'oroscopo dall'inglese all'italiano usando OpenAI e formatta il risultato
+    Traduce gli oroscopi dall'inglese all'italiano usando OpenAI (una sola chiamata anche
+    per più segni) e formatta il risultato in un'unica risposta
     
     Args:
         state: Lo stato dell'agente
@@ -263,47 +584,28 @@ def translate_and_format_horoscope(state: HoroscopeState) -> HoroscopeState:
         return state
     
     try:
-        data = state["horoscope_data"]
-        zodiac_sign = state["zodiac_sign"].capitalize()
+        horoscopes = state.get("horoscopes") or [(state["zodiac_sign"], state["horoscope_data"])]
         time_period = state.get("time_period", "daily")
         
         # Estrai i campi principali dall'API Horoscope
         # Formato: {"date": "...", "horoscope_data": "..."}
-        description = data.get("horoscope_data", "")
-        date_info = data.get("date", "")
-        
-        # Inizializza il modello OpenAI per la traduzione
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.3,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        # Traduci la descrizione principale
-        translation_prompt = f"""Traduci questo oroscopo dall'inglese all'italiano in modo fluente e naturale:
-
-{description}
-
-Mantieni lo stesso tono e stile, ma rendilo scorrevole in italiano."""
-        
-        response = llm.invoke([
-            SystemMessage(content="Sei un traduttore esperto dall'inglese all'italiano, specializzato in oroscopi."),
-            HumanMessage(content=translation_prompt)
-        ])
-        
-        description_it = response.content.strip()
+        descriptions = {sign: data.get("horoscope_data", "") for sign, data in horoscopes}
+        date_info = horoscopes[0][1].get("date", "")
         
         # Mappa i periodi per la descrizione
-        period_label = {
-            "daily": "di oggi",
-            "weekly": "della settimana",
-            "monthly": "del mese"
-        }.get(time_period, "di oggi")
+        period_label = PERIOD_DESCRIPTIONS.get(time_period, "di oggi")
         
         # Formatta il messaggio finale
-        final_message = f""" Oroscopo {period_label} per {zodiac_sign}
+        if len(horoscopes) == 1:
+            zodiac_sign, description = next(iter(descriptions.items()))
+            final_message = f""" Oroscopo {period_label} per {zodiac_sign.capitalize()}
 
-{description_it}"""
+{translate_horoscope(description)}"""
+        else:
+            translations = translate_horoscopes(descriptions)
+            final_message = f" Oroscopo {period_label} per {join_signs(list(translations))}"
+            for sign, description_it in translations.items():
+                final_message += f"\n\n{sign.capitalize()}:\n{description_it}"
         
         if date_info:
             final_message += f"\n\n Periodo: {date_info}"
@@ -328,12 +630,13 @@ def build_horoscope_agent():
     workflow = StateGraph(HoroscopeState)
     
     # Aggiungiamo i nodi
-    workflow.add_node("extract", extract_zodiac_and_period)
-    workflow.add_node("fetch_horoscope", get_horoscope_data)
-    workflow.add_node("translate", translate_and_format_horoscope)
+    workflow.add_node("extract", timed_node("HOROSCOPE", "extract")(extract_zodiac_and_period))
+    workflow.add_node("apply_prefilled_slots", timed_node("HOROSCOPE", "apply_prefilled_slots")(apply_prefilled_slots))
+    workflow.add_node("fetch_horoscope", timed_node("HOROSCOPE", "fetch_horoscope")(get_horoscope_data))
+    workflow.add_node("translate", timed_node("HOROSCOPE", "translate")(translate_and_format_horoscope))
     
     # Definiamo il flusso
-    workflow.add_edge(START, "extract")
+    workflow.add_conditional_edges(START, route_start, ["extract", "apply_prefilled_slots"])
     
     # Da extract a fetch_horoscope se abbiamo il segno zodiacale
     workflow.add_conditional_edges(
@@ -344,6 +647,15 @@ def build_horoscope_agent():
             "end": END
         }
     )
+    # Stessa transizione quando gli slot arrivano dal supervisore
+    workflow.add_conditional_edges(
+        "apply_prefilled_slots",
+        lambda state: "fetch" if state.get("zodiac_sign_en") else "end",
+        {
+            "fetch": "fetch_horoscope",
+            "end": END
+        }
+    )
     
     # Da fetch_horoscope a translate se abbiamo i dati
     workflow.add_conditional_edges(
@@ -364,12 +676,15 @@ def build_horoscope_agent():
     return graph
 
 
-def run_horoscope_agent(query: str) -> dict:
+@timed_agent("HOROSCOPE")
+def run_horoscope_agent(query: str, session_id: str = "default", slots: dict | None = None) -> dict:
     """
     Esegue l'agente oroscopo con una query
     
     Args:
         query: La query dell'utente (es. "oroscopo dell'ariete oggi")
+        session_id: ID della conversazione a cui associare eventuali richieste in sospeso
+        slots: Slot già estratti dal supervisore; se presenti l'estrazione con l'LLM viene saltata
         
     Returns:
         Un dizionario con lo stato finale
@@ -378,10 +693,14 @@ def run_horoscope_agent(query: str) -> dict:
     
     initial_state = {
         "query": query,
+        "slots": slots,
+        "session_id": session_id,
         "zodiac_sign": None,
         "zodiac_sign_en": None,
+        "zodiac_signs": None,
         "time_period": None,
         "horoscope_data": None,
+        "horoscopes": None,
         "messages": []
     }
     
@@ -395,35 +714,18 @@ def visualize_graph():
     Visualizza il grafo dell'agente oroscopo (per debug e documentazione)
     """
     try:
-        import matplotlib.pyplot as plt
-        from langgraph.graph import StateGraph
-        
         graph = build_horoscope_agent()
         
-        # Genera il grafo Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(graph, "horoscope_agent_graph", "Grafo Agente Oroscopo")
         
         print("Grafo Mermaid dell'agente oroscopo:")
-        print(mermaid_code)
+        print(rendering["mermaid"])
         
-        # Salva in un file
-        with open("horoscope_agent_graph.md", "w", encoding="utf-8") as f:
-            f.write("# Grafo Agente Oroscopo\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-            
-        # 2. Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "horoscope_agent_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
         print("\nGrafo salvato in horoscope_agent_graph.md")
         
@@ -6,12 +6,24 @@ Supporta rilevamento automatico della lingua di origine e oltre 100 lingue
 import os
 import json
 import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# Aggiungi il path parent per importare i moduli condivisi
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from metrics import timed_node, timed_agent
+from llm_usage import invoke_llm, PROMPT_ANSWER, PROMPT_EXTRACTION
+from llm_provider import get_llm
+from partial_response import publish_partial
+from bilingual_dictionary import bilingual_dictionary
+from graph_rendering import render_graph_files
 
 # Carica le variabili d'ambiente
 load_dotenv()
@@ -20,6 +32,7 @@ load_dotenv()
 class TranslatorState(TypedDict):
     """Stato dell'agente traduttore"""
     query: str
+    slots: dict | None  # Slot già estratti dal supervisore (routing combinato)
     text_to_translate: str | None
     source_language: str | None
     target_language: str | None
@@ -69,34 +82,43 @@ SUPPORTED_LANGUAGES = {
     "estone": "et"
 }
 
+# Parole e frasi brevi sono cercate prima nel dizionario bilingue su disco ("0" lo disattiva)
+DICTIONARY_ENABLED = os.getenv("ALEXA_TRANSLATION_DICTIONARY", "1") != "0"
 
-def extract_translation_request(state: TranslatorState) -> TranslatorState:
+# Testi più lunghi sono divisi in blocchi di al più CHUNK_CHARS caratteri, tradotti in parallelo
+CHUNK_CHARS = int(os.getenv("ALEXA_TRANSLATION_CHUNK_CHARS", "1200"))
+
+# Blocchi tradotti contemporaneamente (chiamate LLM in parallelo per turno)
+TRANSLATION_PARALLELISM = int(os.getenv("ALEXA_TRANSLATION_PARALLELISM", "4"))
+
+# Termini al più nel glossario condiviso tra i blocchi
+GLOSSARY_MAX_TERMS = 30
+
+# Separatori tra paragrafi (righe vuote) e tra frasi, conservati per ricomporre il testo
+_PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?…;])(\s+)")
+
+# Sequenze di parole con l'iniziale maiuscola (nomi propri, sigle, termini tecnici)
+_TERM = re.compile(r"\b[A-ZÀ-Ý][\w'’-]*(?:\s+[A-ZÀ-Ý][\w'’-]*)*")
+
+
+def extract_translation_slots(query: str) -> dict:
     """
-    Estrae il testo da tradurre e le lingue dalla query usando OpenAI
+    Estrae con l'LLM gli slot dell'agente dalla query
     
     Args:
-        state: Lo stato dell'agente
+        query: La domanda dell'utente
         
     Returns:
-        Lo stato aggiornato con i dettagli della traduzione
+        Dizionario con text, source_lang, target_lang e valid
     """
-    query = state["query"]
+    # Inizializza il modello OpenAI
+    llm = get_llm(temperature=0)
     
-    # Aggiungiamo il messaggio dell'utente
-    state["messages"].append(HumanMessage(content=query))
+    # Lista lingue per il prompt
+    lingue_lista = ", ".join(list(SUPPORTED_LANGUAGES.keys())[:20]) + ", e altre..."
     
-    try:
-        # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        # Lista lingue per il prompt
-        lingue_lista = ", ".join(list(SUPPORTED_LANGUAGES.keys())[:20]) + ", e altre..."
-        
-        prompt = f"""Analizza questa query in italiano ed estrai i dettagli della traduzione richiesta.
+    prompt = f"""Analizza questa query in italiano ed estrai i dettagli della traduzione richiesta.
 
 Lingue principali supportate: {lingue_lista}
 
@@ -124,73 +146,109 @@ Esempi:
 
 Se non è una richiesta di traduzione, metti "valid": false
 """
-        
-        # Chiama OpenAI
-        response = llm.invoke([
-            SystemMessage(content="Sei un esperto nell'estrarre richieste di traduzione da testo in linguaggio naturale."),
-            HumanMessage(content=prompt)
-        ])
-        
-        # Parsa la risposta JSON
-        try:
-            data = json.loads(response.content)
-        except json.JSONDecodeError:
-            # Prova a estrarre il JSON dalla risposta
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
-                raise ValueError("Impossibile estrarre JSON dalla risposta")
-        
-        if not data.get("valid", False):
-            state["text_to_translate"] = None
-            state["messages"].append(
-                AIMessage(content="Non riesco a identificare una richiesta di traduzione valida. Prova con: 'traduci [testo] in [lingua]' o 'come si dice [testo] in [lingua]'")
-            )
-            return state
-        
-        state["text_to_translate"] = data.get("text", "").strip()
-        source_lang = data.get("source_lang", "auto").lower()
-        target_lang = data.get("target_lang", "").lower()
-        
-        # Normalizza i nomi delle lingue
-        if source_lang != "auto":
-            # Cerca nei nomi delle lingue supportate
-            source_lang_matched = None
-            for lang_name, lang_code in SUPPORTED_LANGUAGES.items():
-                if source_lang in lang_name or lang_name in source_lang:
-                    source_lang_matched = lang_name
-                    break
-            state["source_language"] = source_lang_matched if source_lang_matched else source_lang
+    
+    # Chiama OpenAI
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un esperto nell'estrarre richieste di traduzione da testo in linguaggio naturale."),
+        HumanMessage(content=prompt)
+    ], agent="TRANSLATOR", prompt=PROMPT_EXTRACTION)
+    
+    # Parsa la risposta JSON
+    try:
+        data = json.loads(response.content)
+    except json.JSONDecodeError:
+        # Prova a estrarre il JSON dalla risposta
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
         else:
-            state["source_language"] = "auto"
+            raise ValueError("Impossibile estrarre JSON dalla risposta")
+    
+    return data
+
+
+def apply_translation_slots(state: TranslatorState, data: dict) -> TranslatorState:
+    """
+    Valida gli slot estratti e aggiorna lo stato
+    
+    Args:
+        state: Lo stato dell'agente
+        data: Gli slot estratti (dall'LLM dell'agente o dal supervisore)
         
-        # Target language
-        target_lang_matched = None
+    Returns:
+        Lo stato aggiornato con i dettagli della traduzione
+    """
+    if not data.get("valid", False):
+        state["text_to_translate"] = None
+        state["messages"].append(
+            AIMessage(content="Non riesco a identificare una richiesta di traduzione valida. Prova con: 'traduci [testo] in [lingua]' o 'come si dice [testo] in [lingua]'")
+        )
+        return state
+    
+    state["text_to_translate"] = data.get("text", "").strip()
+    source_lang = data.get("source_lang", "auto").lower()
+    target_lang = data.get("target_lang", "").lower()
+    
+    # Normalizza i nomi delle lingue
+    if source_lang != "auto":
+        # Cerca nei nomi delle lingue supportate
+        source_lang_matched = None
         for lang_name, lang_code in SUPPORTED_LANGUAGES.items():
-            if target_lang in lang_name or lang_name in target_lang:
-                target_lang_matched = lang_name
+            if source_lang in lang_name or lang_name in source_lang:
+                source_lang_matched = lang_name
                 break
-        
-        if not target_lang_matched:
-            state["target_language"] = None
-            state["messages"].append(
-                AIMessage(content=f"Lingua di destinazione '{target_lang}' non riconosciuta. Lingue supportate: {', '.join(list(SUPPORTED_LANGUAGES.keys())[:10])}, ...")
-            )
-            return state
-        
-        state["target_language"] = target_lang_matched
-        
-        if not state["text_to_translate"]:
-            state["messages"].append(
-                AIMessage(content="Non ho identificato il testo da tradurre. Puoi riformulare la richiesta?")
-            )
-            return state
-        
-        source_display = state["source_language"] if state["source_language"] != "auto" else "rilevamento automatico"
+        state["source_language"] = source_lang_matched if source_lang_matched else source_lang
+    else:
+        state["source_language"] = "auto"
+    
+    # Target language
+    target_lang_matched = None
+    for lang_name, lang_code in SUPPORTED_LANGUAGES.items():
+        if target_lang in lang_name or lang_name in target_lang:
+            target_lang_matched = lang_name
+            break
+    
+    if not target_lang_matched:
+        state["target_language"] = None
+        state["messages"].append(
+            AIMessage(content=f"Lingua di destinazione '{target_lang}' non riconosciuta. Lingue supportate: {', '.join(list(SUPPORTED_LANGUAGES.keys())[:10])}, ...")
+        )
+        return state
+    
+    state["target_language"] = target_lang_matched
+    
+    if not state["text_to_translate"]:
         state["messages"].append(
-            AIMessage(content=f"Traduzione da {source_display} a {state['target_language']} in corso...")
+            AIMessage(content="Non ho identificato il testo da tradurre. Puoi riformulare la richiesta?")
         )
+        return state
+    
+    source_display = state["source_language"] if state["source_language"] != "auto" else "rilevamento automatico"
+    state["messages"].append(
+        AIMessage(content=f"Traduzione da {source_display} a {state['target_language']} in corso...")
+    )
+    
+    return state
+
+
+def extract_translation_request(state: TranslatorState) -> TranslatorState:
+    """
+    Estrae il testo da tradurre e le lingue dalla query usando OpenAI
+    
+    Args:
+        state: Lo stato dell'agente
+        
+    Returns:
+        Lo stato aggiornato con i dettagli della traduzione
+    """
+    query = state["query"]
+    
+    # Aggiungiamo il messaggio dell'utente
+    state["messages"].append(HumanMessage(content=query))
+    
+    try:
+        data = extract_translation_slots(query)
+        apply_translation_slots(state, data)
         
     except Exception as e:
         state["text_to_translate"] = None
@@ -201,64 +259,301 @@ Se non è una richiesta di traduzione, metti "valid": false
     return state
 
 
-def perform_translation(state: TranslatorState) -> TranslatorState:
+def apply_prefilled_slots(state: TranslatorState) -> TranslatorState:
     """
-    Esegue la traduzione usando OpenAI
+    Usa gli slot già estratti dal supervisore (modalità routing combinato),
+    saltando la chiamata LLM di estrazione
     
     Args:
-        state: Lo stato dell'agente
+        state: Lo stato dell'agente, con gli slot in "slots"
         
     Returns:
-        Lo stato aggiornato con il testo tradotto
+        Lo stato aggiornato con i dettagli della traduzione
     """
-    if not state.get("text_to_translate") or not state.get("target_language"):
-        return state
+    state["messages"].append(HumanMessage(content=state["query"]))
     
     try:
-        text = state["text_to_translate"]
-        source_lang = state.get("source_language", "auto")
-        target_lang = state["target_language"]
+        apply_translation_slots(state, state["slots"])
         
-        # Inizializza il modello OpenAI per traduzione
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.3,
-            api_key=os.getenv("OPENAI_API_KEY")
+    except Exception as e:
+        state["text_to_translate"] = None
+        state["messages"].append(
+            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}")
         )
+    
+    return state
+
+
+def route_start(state: TranslatorState) -> str:
+    """Salta l'estrazione se il supervisore ha già fornito gli slot"""
+    return "apply_prefilled_slots" if state.get("slots") else "extract"
+
+
+def _text_pieces(text: str, max_chars: int):
+    """Paragrafi (o frasi e parti di frase, se troppo lunghi) con il separatore che li segue"""
+    parts = _PARAGRAPH_BREAK.split(text)
+    for i in range(0, len(parts), 2):
+        paragraph = parts[i]
+        paragraph_break = parts[i + 1] if i + 1 < len(parts) else ""
+        if len(paragraph) <= max_chars:
+            yield paragraph, paragraph_break
+            continue
         
-        # Costruisci il prompt di traduzione
-        if source_lang == "auto":
-            translation_prompt = f"""Traduci il seguente testo in {target_lang}. 
-Rileva automaticamente la lingua di origine e fornisci una traduzione accurata e naturale.
+        sentences = _SENTENCE_BREAK.split(paragraph)
+        for j in range(0, len(sentences), 2):
+            sentence = sentences[j]
+            separator = sentences[j + 1] if j + 1 < len(sentences) else paragraph_break
+            # Una frase più lunga del limite è divisa sugli spazi (o, senza spazi, al limite)
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                if cut > 0:
+                    yield sentence[:cut], " "
+                    sentence = sentence[cut + 1:]
+                else:
+                    yield sentence[:max_chars], ""
+                    sentence = sentence[max_chars:]
+            yield sentence, separator
+
+
+def split_text(text: str, max_chars: int = CHUNK_CHARS) -> list:
+    """
+    Divide un testo in blocchi rispettando paragrafi e frasi
+    
+    Args:
+        text: Il testo da tradurre
+        max_chars: Lunghezza massima di un blocco
+        
+    Returns:
+        Lista di (blocco, separatore che lo segue); unendo blocchi e separatori si riottiene il testo
+    """
+    chunks = []
+    current, current_break = "", ""
+    for piece, separator in _text_pieces(text, max_chars):
+        # Paragrafi e frasi consecutivi sono raggruppati finché il blocco resta entro il limite
+        if current and len(current) + len(current_break) + len(piece) > max_chars:
+            chunks.append((current, current_break))
+            current = ""
+        current = current + current_break + piece if current else piece
+        current_break = separator
+    if current:
+        chunks.append((current, current_break))
+    return chunks
+
+
+def join_chunks(chunks: list, translations: list) -> str:
+    """Ricompone le traduzioni dei blocchi, nell'ordine, con i separatori del testo originale"""
+    return "".join(translation + separator for (_, separator), translation in zip(chunks, translations)).strip()
+
+
+def glossary_terms(chunks: list) -> list:
+    """
+    Termini da tradurre allo stesso modo in tutti i blocchi: nomi propri, sigle e
+    termini con l'iniziale maiuscola a metà frase, presenti in almeno due blocchi
+    
+    Args:
+        chunks: I testi dei blocchi
+        
+    Returns:
+        I termini, dai più frequenti, al più GLOSSARY_MAX_TERMS
+    """
+    found = {}
+    for index, chunk in enumerate(chunks):
+        for match in _TERM.finditer(chunk):
+            before = chunk[:match.start()].rstrip()
+            # A inizio frase la maiuscola non distingue un nome proprio
+            if not before or before[-1] in ".!?…:;\"'«(":
+                continue
+            found.setdefault(match.group(), set()).add(index)
+    shared = [term for term, indexes in found.items() if len(indexes) > 1]
+    return sorted(shared, key=lambda term: len(found[term]), reverse=True)[:GLOSSARY_MAX_TERMS]
+
+
+def build_glossary(terms: list, source_lang: str, target_lang: str) -> dict:
+    """
+    Traduce una volta sola i termini ricorrenti, per usarli in tutti i blocchi
+    
+    Args:
+        terms: I termini di glossary_terms
+        source_lang: Lingua di origine (o "auto")
+        target_lang: Lingua di destinazione
+        
+    Returns:
+        Termine -> traduzione (vuoto se non ci sono termini o la risposta non è valida)
+    """
+    if not terms:
+        return {}
+    
+    llm = get_llm(temperature=0)
+    source = "dalla lingua del testo" if source_lang == "auto" else f"da {source_lang}"
+    prompt = f"""Traduci {source} a {target_lang} questi termini, che compaiono in più parti dello stesso testo.
+I nomi propri che non si traducono restano invariati.
 
-Testo da tradurre:
-{text}
+Termini:
+{chr(10).join(terms)}
 
-Fornisci SOLO la traduzione, senza spiegazioni o note aggiuntive."""
-        else:
-            translation_prompt = f"""Traduci il seguente testo da {source_lang} a {target_lang}.
-Fornisci una traduzione accurata e naturale.
+Rispondi in JSON con questo formato: {{"termine": "traduzione"}}"""
+    
+    try:
+        response = invoke_llm(llm, [
+            SystemMessage(content="Sei un terminologo: prepari glossari per traduzioni coerenti. Rispondi sempre in JSON."),
+            HumanMessage(content=prompt)
+        ], agent="TRANSLATOR", prompt=PROMPT_EXTRACTION)
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        data = json.loads(json_match.group()) if json_match else {}
+    except Exception:
+        # Senza glossario i blocchi sono tradotti comunque, solo con meno coerenza
+        return {}
+    
+    return {term: data[term] for term in terms if isinstance(data.get(term), str) and data[term].strip()}
 
+
+def translate_text(text: str, source_lang: str, target_lang: str, glossary: dict | None = None) -> str:
+    """
+    Traduce un testo (o un blocco di un testo lungo) con una chiamata LLM
+    
+    Args:
+        text: Il testo da tradurre
+        source_lang: Lingua di origine (o "auto")
+        target_lang: Lingua di destinazione
+        glossary: Traduzioni dei termini da usare (blocchi di un testo lungo)
+        
+    Returns:
+        Il testo tradotto
+    """
+    # Inizializza il modello OpenAI per traduzione
+    llm = get_llm(temperature=0.3)
+    
+    # Costruisci il prompt di traduzione
+    if source_lang == "auto":
+        translation_prompt = f"""Traduci il seguente testo in {target_lang}. 
+Rileva automaticamente la lingua di origine e fornisci una traduzione accurata e naturale.
+"""
+    else:
+        translation_prompt = f"""Traduci il seguente testo da {source_lang} a {target_lang}.
+Fornisci una traduzione accurata e naturale.
+"""
+    if glossary:
+        # Il testo è una parte di un testo più lungo: stessi termini in tutte le parti
+        terms = "\n".join(f"- {term} -> {translation}" for term, translation in glossary.items())
+        translation_prompt += f"""Il testo è una parte di un testo più lungo: usa sempre queste traduzioni dei termini.
+{terms}
+"""
+    translation_prompt += f"""
 Testo da tradurre:
 {text}
 
 Fornisci SOLO la traduzione, senza spiegazioni o note aggiuntive."""
+    
+    # Chiama OpenAI per la traduzione
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un traduttore professionale esperto in molteplici lingue. Fornisci traduzioni accurate, fluenti e contestualmente appropriate."),
+        HumanMessage(content=translation_prompt)
+    ], agent="TRANSLATOR", prompt=PROMPT_ANSWER)
+    
+    translated_text = response.content.strip()
+    
+    # Rimuovi eventuali virgolette aggiunte
+    if translated_text.startswith('"') and translated_text.endswith('"'):
+        translated_text = translated_text[1:-1]
+    if translated_text.startswith("'") and translated_text.endswith("'"):
+        translated_text = translated_text[1:-1]
+    
+    return translated_text
+
+
+def translate_chunks(chunks: list, source_lang: str, target_lang: str) -> str:
+    """
+    Traduce in parallelo i blocchi di un testo lungo e ne ricompone la traduzione
+    
+    Args:
+        chunks: I blocchi di split_text
+        source_lang: Lingua di origine (o "auto")
+        target_lang: Lingua di destinazione
+        
+    Returns:
+        Il testo tradotto, con i blocchi nell'ordine originale
+    """
+    glossary = build_glossary(glossary_terms([chunk for chunk, _ in chunks]), source_lang, target_lang)
+    
+    translations = [None] * len(chunks)
+    published = 0
+    # Al più TRANSLATION_PARALLELISM chiamate insieme, ognuna nel contesto del turno (scadenza, token)
+    with ThreadPoolExecutor(max_workers=min(TRANSLATION_PARALLELISM, len(chunks)), thread_name_prefix="translation") as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, translate_text, chunk, source_lang, target_lang, glossary): index
+            for index, (chunk, _) in enumerate(chunks)
+        }
+        try:
+            for future in as_completed(futures):
+                translations[futures[future]] = future.result()
+                
+                # All'interfaccia arriva la parte iniziale già completa, sempre nell'ordine del testo
+                ready = published
+                while ready < len(chunks) and translations[ready] is not None:
+                    ready += 1
+                if ready > published and ready < len(chunks):
+                    published = ready
+                    publish_partial(
+                        f" Traduzione in {target_lang} ({published}/{len(chunks)} parti):\n\n"
+                        f"{join_chunks(chunks[:published], translations[:published])}"
+                    )
+        except Exception:
+            # Un blocco fallito rende inutile la traduzione: i blocchi non ancora avviati sono annullati
+            for pending in futures:
+                pending.cancel()
+            raise
+    
+    return join_chunks(chunks, translations)
+
+
+def dictionary_translation(text: str, source_lang: str, target_lang: str) -> str | None:
+    """
+    Traduce con il dizionario bilingue su disco, senza chiamare l'LLM
+    
+    Args:
+        text: Il testo da tradurre
+        source_lang: Lingua di origine (nome italiano o "auto")
+        target_lang: Lingua di destinazione (nome italiano)
         
-        # Chiama OpenAI per la traduzione
-        response = llm.invoke([
-            SystemMessage(content="Sei un traduttore professionale esperto in molteplici lingue. Fornisci traduzioni accurate, fluenti e contestualmente appropriate."),
-            HumanMessage(content=translation_prompt)
-        ])
+    Returns:
+        La traduzione, oppure None se il testo non è nel dizionario
+    """
+    target = SUPPORTED_LANGUAGES.get(target_lang)
+    source = None if source_lang == "auto" else SUPPORTED_LANGUAGES.get(source_lang)
+    if target is None or (source is None and source_lang != "auto"):
+        return None
+    return bilingual_dictionary.lookup(text, source, target, SUPPORTED_LANGUAGES.values())
+
+
+def perform_translation(state: TranslatorState) -> TranslatorState:
+    """
+    Esegue la traduzione: parole e frasi brevi con il dizionario su disco, altrimenti con
+    OpenAI (un testo lungo è diviso in blocchi tradotti in parallelo)
+    
+    Args:
+        state: Lo stato dell'agente
         
-        translated_text = response.content.strip()
+    Returns:
+        Lo stato aggiornato con il testo tradotto
+    """
+    if not state.get("text_to_translate") or not state.get("target_language"):
+        return state
+    
+    try:
+        text = state["text_to_translate"]
+        source_lang = state.get("source_language", "auto")
+        target_lang = state["target_language"]
         
-        # Rimuovi eventuali virgolette aggiunte
-        if translated_text.startswith('"') and translated_text.endswith('"'):
-            translated_text = translated_text[1:-1]
-        if translated_text.startswith("'") and translated_text.endswith("'"):
-            translated_text = translated_text[1:-1]
+        translated_text = dictionary_translation(text, source_lang, target_lang) if DICTIONARY_ENABLED else None
+        if translated_text is not None:
+            state["translated_text"] = translated_text
+            return state
         
-        state["translated_text"] = translated_text
+        chunks = split_text(text)
+        if len(chunks) > 1:
+            state["translated_text"] = translate_chunks(chunks, source_lang, target_lang)
+        else:
+            state["translated_text"] = translate_text(text, source_lang, target_lang)
         
     except Exception as e:
         state["translated_text"] = None
@@ -308,12 +603,13 @@ def build_translator_agent():
     workflow = StateGraph(TranslatorState)
     
     # Aggiungiamo i nodi
-    workflow.add_node("extract", extract_translation_request)
-    workflow.add_node("translate", perform_translation)
-    workflow.add_node("format", format_translation_result)
+    workflow.add_node("extract", timed_node("TRANSLATOR", "extract")(extract_translation_request))
+    workflow.add_node("apply_prefilled_slots", timed_node("TRANSLATOR", "apply_prefilled_slots")(apply_prefilled_slots))
+    workflow.add_node("translate", timed_node("TRANSLATOR", "translate")(perform_translation))
+    workflow.add_node("format", timed_node("TRANSLATOR", "format")(format_translation_result))
     
     # Definiamo il flusso
-    workflow.add_edge(START, "extract")
+    workflow.add_conditional_edges(START, route_start, ["extract", "apply_prefilled_slots"])
     
     # Da extract a translate se abbiamo i dettagli necessari
     workflow.add_conditional_edges(
@@ -324,6 +620,15 @@ def build_translator_agent():
             END: END
         }
     )
+    # Stessa transizione quando gli slot arrivano dal supervisore
+    workflow.add_conditional_edges(
+        "apply_prefilled_slots",
+        lambda state: "translate" if state.get("text_to_translate") and state.get("target_language") else END,
+        {
+            "translate": "translate",
+            END: END
+        }
+    )
     
     # Da translate a format se abbiamo la traduzione
     workflow.add_conditional_edges(
@@ -344,12 +649,14 @@ def build_translator_agent():
     return graph
 
 
-def run_translator_agent(query: str) -> dict:
+@timed_agent("TRANSLATOR")
+def run_translator_agent(query: str, slots: dict | None = None) -> dict:
     """
     Esegue l'agente traduttore con la query dell'utente
     
     Args:
         query: La richiesta di traduzione
+        slots: Slot già estratti dal supervisore; se presenti l'estrazione con l'LLM viene saltata
         
     Returns:
         Il risultato dello stato finale
@@ -358,6 +665,7 @@ def run_translator_agent(query: str) -> dict:
     
     initial_state = {
         "query": query,
+        "slots": slots,
         "text_to_translate": None,
         "source_language": None,
         "target_language": None,
@@ -377,29 +685,14 @@ def visualize_graph():
     graph = build_translator_agent()
     
     try:
-        # Genera la rappresentazione Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
-        
-        # Salva il diagramma Mermaid
-        mermaid_path = "translator_agent_graph.md"
-        with open(mermaid_path, "w", encoding="utf-8") as f:
-            f.write("# Grafo Agente Traduttore\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-        print(f"✓ Diagramma Mermaid salvato in: {mermaid_path}")
-        
-         # 2. Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "translator_agent_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(graph, "translator_agent_graph", "Grafo Agente Traduttore")
+        mermaid_code = rendering["mermaid"]
+        print(f"✓ Diagramma Mermaid salvato in: {rendering['md_path']}")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
         # Stampa in console
         print("\n" + "="*70)
@@ -4,69 +4,153 @@ Utilizza OpenAI per l'estrazione intelligente e coordinate geografiche
 """
 
 import os
-import requests
 import json
-from datetime import datetime, timedelta
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from datetime import datetime, timedelta, time as day_time
+from zoneinfo import ZoneInfo
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
 import sys
 from pathlib import Path
 
 # Aggiungi il path parent per importare conversation_manager
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from conversation_manager import conversation_manager
+from metrics import timed_node, timed_agent
+from llm_usage import invoke_llm, describe_llm_error, PROMPT_EXTRACTION
+from llm_provider import get_llm
+from swr_cache import forecast_cache, hourly_forecast_cache, geocoding_cache
+from rate_limiter import nominatim_queue, PRIORITY_PREFETCH
+from deadline import stage_timeout
+from circuit_breaker import protected
+from http_client import http_get, mount_pool, TimeoutSession
+from graph_rendering import render_graph_files
+from weather_formatting import (
+    describe_weathercode, describe_weathercodes, day_label, format_day, format_summary,
+    daily_report, hourly_report, hour_rows, comparison_report, DAILY_FIELDS
+)
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
+# Endpoint dei servizi esterni (sovrascrivibili, es. per i benchmark offline)
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+# Fuso orario delle previsioni e delle date: giorni, fasce e orari sono quelli italiani,
+# indipendentemente dal fuso del server
+FORECAST_TIMEZONE = "Europe/Rome"
+LOCAL_TZ = ZoneInfo(FORECAST_TIMEZONE)
+
+# Tentativi e backoff delle chiamate a Open-Meteo
+OPEN_METEO_RETRIES = 5
+OPEN_METEO_BACKOFF = 0.2
+
+# Sessioni Open-Meteo con cache e pool di connessioni, una per numero di tentativi:
+# create una volta sola così le connessioni restano aperte tra le chiamate
+_open_meteo_sessions: dict = {}
+_open_meteo_lock = threading.Lock()
+
+# Registro delle ultime località richieste: le più frequenti vengono geocodificate
+# in anticipo, con priorità bassa, se mancano dalla cache o stanno per scadere
+TRENDING_WINDOW = 500
+PREFETCH_TOP_N = int(os.getenv("ALEXA_GEOCODING_PREFETCH_TOP", "10"))
+PREFETCH_INTERVAL_S = float(os.getenv("ALEXA_GEOCODING_PREFETCH_INTERVAL_S", "60"))
+PREFETCH_REFRESH_AFTER = 0.8  # frazione della validità oltre la quale si aggiorna
+_location_log: deque = deque(maxlen=TRENDING_WINDOW)
+_location_names: dict = {}
+_location_log_lock = threading.Lock()
+_last_prefetch = float("-inf")
+
+# Variabili giornaliere richieste a Open-Meteo, nell'ordine della risposta
+DAILY_VARIABLES = [
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "precipitation_sum",
+    "precipitation_probability_max",
+    "windspeed_10m_max",
+    "weathercode"
+]
+
+# Variabili orarie richieste a Open-Meteo (modalità oraria), nell'ordine della risposta
+HOURLY_VARIABLES = [
+    "temperature_2m",
+    "precipitation_probability",
+    "precipitation",
+    "weathercode",
+    "windspeed_10m"
+]
+
+# Fasce del giorno: (ora di inizio, ora di fine, nome se riferite a oggi).
+# La notte è quella che segue il giorno indicato
+TIME_WINDOWS = {
+    "mattina": (6, 12, "stamattina"),
+    "pomeriggio": (12, 18, "oggi pomeriggio"),
+    "sera": (18, 24, "stasera"),
+    "notte": (24, 30, "stanotte"),
+}
+
+# Probabilità di precipitazione (%) oltre la quale la pioggia è considerata probabile
+RAIN_PROBABILITY_THRESHOLD = 50
+
+# Località confrontabili in una sola richiesta
+MAX_LOCATIONS = 5
+
 
 class AgentState(TypedDict):
     """Stato dell'agente meteo"""
     query: str
+    session_id: str
+    slots: dict | None  # Slot già estratti dal supervisore (routing combinato)
     location: str | None
     latitude: float | None
     longitude: float | None
+    locations: list | None  # Tutte le località richieste (più di una: confronto)
+    coordinates: list | None  # (latitudine, longitudine) per località, None se non trovata
     days_offset: int | None
+    time_of_day: str | None  # Fascia del giorno (chiave di TIME_WINDOWS): modalità oraria
+    hours_ahead: int | None  # Ore da adesso ("tra 3 ore"): modalità oraria
     date_str: str | None
     weather_data: dict | None
     messages: Annotated[list, operator.add]
 
 
-def extract_location_and_date(state: AgentState) -> AgentState:
+def period_label(days_offset: int, time_of_day: str | None = None, hours_ahead: int | None = None) -> str:
+    """Descrizione leggibile del periodo richiesto (es. "domani", "stasera", "domani sera", "tra 3 ore")"""
+    if hours_ahead is not None:
+        return "tra un'ora" if hours_ahead == 1 else f"tra {hours_ahead} ore"
+    if time_of_day is None:
+        return day_label(days_offset)
+    if days_offset == 0:
+        return TIME_WINDOWS[time_of_day][2]
+    return f"{day_label(days_offset)} {time_of_day}"
+
+
+def extract_weather_slots(query: str) -> dict:
     """
-    Estrae la località e il tempo dalla query dell'utente usando OpenAI
-    Valida che il tempo sia entro 7 giorni da oggi
+    Estrae con l'LLM gli slot dell'agente meteo dalla query
     
     Args:
-        state: Lo stato dell'agente
+        query: La domanda dell'utente
         
     Returns:
-        Lo stato aggiornato con la località e il tempo estratti
+        Dizionario con location, locations, days_offset, time_of_day, hours_ahead,
+        time_description e validity
     """
-    query = state["query"]
+    # Inizializza il modello OpenAI
+    llm = get_llm(temperature=0)
     
-    # Aggiungiamo il messaggio dell'utente
-    state["messages"].append(HumanMessage(content=query))
+    # Prompt per l'estrazione della città e del tempo
+    today = datetime.now(LOCAL_TZ).strftime("%d/%m/%Y")
     
-    try:
-        # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        # Prompt per l'estrazione della città e del tempo
-        today = datetime.now().strftime("%d/%m/%Y")
-        
-        prompt = f"""Analizza questa query in italiano ed estrai il nome della città e l'indicazione temporale.
+    prompt = f"""Analizza questa query in italiano ed estrai il nome della città e l'indicazione temporale.
 
 Data odierna: {today}
 
@@ -76,13 +160,19 @@ Regole:
 - Calcola i giorni da oggi (0=oggi, 1=domani, 2=dopodomani, etc.)
 - Massimo 7 giorni da oggi. Se la data è nel passato o oltre 7 giorni, rispondi "INVALIDO"
 - Giorni della settimana vanno calcolati come il prossimo (es. se oggi è martedì e dice "martedì", intende martedì prossimo)
+- Se la query cita più città (es. "Roma, Milano e Napoli"), elencale tutte in "locations" nell'ordine della query
+- Se la query indica una fascia del giorno ("stamattina", "domani pomeriggio", "stasera", "stanotte"), indicala in "time_of_day" con "mattina", "pomeriggio", "sera" o "notte", altrimenti null
+- Se la query indica un numero di ore da adesso (es. "tra 3 ore"), indicalo in "hours_ahead", altrimenti null
 
 Query: {query}
 
 Rispondi in JSON con questo formato esatto:
 {{
     "location": "nome città",
+    "locations": ["nome città", ...],
     "days_offset": 0-7 (numero di giorni da oggi),
+    "time_of_day": "mattina" | "pomeriggio" | "sera" | "notte" | null,
+    "hours_ahead": numero di ore da adesso o null,
     "time_description": "descrizione breve del tempo (es. 'oggi', 'domani', 'giovedì prossimo')",
     "validity": "VALIDO" o "INVALIDO"
 }}
@@ -90,85 +180,315 @@ Rispondi in JSON con questo formato esatto:
 Se non trovi una città rispondi con "location": "NESSUNA"
 Se il tempo è invalido rispondi con "validity": "INVALIDO"
 """
+    
+    # Chiama OpenAI
+    response = invoke_llm(llm, [
+        SystemMessage(content="Sei un assistente che estrae città e date da testo italiano. Rispondi sempre in JSON."),
+        HumanMessage(content=prompt)
+    ], agent="WEATHER", prompt=PROMPT_EXTRACTION)
+    
+    # Parsa la risposta JSON
+    try:
+        data = json.loads(response.content)
+    except json.JSONDecodeError:
+        # Se non riesce a parsare, prova a estrarre il JSON dalla risposta
+        import re
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
+        else:
+            raise ValueError("Impossibile estrarre JSON dalla risposta")
+    
+    return data
+
+
+def apply_weather_slots(state: AgentState, data: dict) -> AgentState:
+    """
+    Valida gli slot estratti e aggiorna lo stato (o salva la richiesta in sospeso)
+    Valida che il tempo sia entro 7 giorni da oggi
+    
+    Args:
+        state: Lo stato dell'agente
+        data: Gli slot estratti (dall'LLM dell'agente o dal supervisore)
         
-        # Chiama OpenAI
-        response = llm.invoke([
-            SystemMessage(content="Sei un assistente che estrae città e date da testo italiano. Rispondi sempre in JSON."),
-            HumanMessage(content=prompt)
-        ])
-        
-        # Parsa la risposta JSON
-        try:
-            data = json.loads(response.content)
-        except json.JSONDecodeError:
-            # Se non riesce a parsare, prova a estrarre il JSON dalla risposta
-            import re
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
-                raise ValueError("Impossibile estrarre JSON dalla risposta")
-        
-        location = data.get("location", "NESSUNA").strip()
-        days_offset = data.get("days_offset", 0)
-        validity = data.get("validity", "INVALIDO")
-        time_description = data.get("time_description", "oggi")
-        
-        # Validazione
-        if location.upper() == "NESSUNA":
-            state["location"] = None
-            
-            # Salva la richiesta incompleta
-            conversation_manager.save_pending_request(
-                agent_type="WEATHER",
-                original_query=query,
-                missing_info="location",
-                partial_data={"time_description": time_description, "days_offset": days_offset}
-            )
-            
-            state["messages"].append(
-                AIMessage(content="Non ho riconosciuto una località specifica nella tua richiesta. Puoi indicarmi una città?")
-            )
-            return state
-        
-        if validity.upper() == "INVALIDO" or not (0 <= days_offset <= 7):
-            state["location"] = None
-            state["days_offset"] = None
-            state["messages"].append(
-                AIMessage(content=f"Scusa, posso fornire il meteo solo per i prossimi 7 giorni da oggi, non nel passato. {location} quale giorno?")
-            )
-            return state
+    Returns:
+        Lo stato aggiornato con la località e il tempo
+    """
+    query = state["query"]
+    
+    location = data.get("location", "NESSUNA").strip()
+    days_offset = data.get("days_offset", 0)
+    validity = data.get("validity", "INVALIDO")
+    time_description = data.get("time_description", "oggi")
+    
+    # Fascia del giorno o ore da adesso: modalità oraria
+    time_of_day = (data.get("time_of_day") or "").strip().lower()
+    time_of_day = time_of_day if time_of_day in TIME_WINDOWS else None
+    hours_ahead = data.get("hours_ahead")
+    hours_ahead = int(hours_ahead) if isinstance(hours_ahead, (int, float)) and 0 <= hours_ahead <= 7 * 24 else None
+    if hours_ahead is not None:
+        now = datetime.now(LOCAL_TZ)
+        days_offset = ((now + timedelta(hours=hours_ahead)).date() - now.date()).days
+    
+    # Più città nella stessa query: confronto (senza duplicati, al più MAX_LOCATIONS)
+    locations = []
+    for name in data.get("locations") or [location]:
+        name = (name or "").strip()
+        if name and name.upper() != "NESSUNA" and name.lower() not in [l.lower() for l in locations]:
+            locations.append(name)
+    locations = locations[:MAX_LOCATIONS]
+    if location.upper() == "NESSUNA" and locations:
+        location = locations[0]
+    
+    # Validazione
+    if location.upper() == "NESSUNA":
+        state["location"] = None
         
-        state["location"] = location
-        state["days_offset"] = days_offset
+        # Salva la richiesta incompleta
+        conversation_manager.save_pending_request(
+            agent_type="WEATHER",
+            original_query=query,
+            missing_info="location",
+            partial_data={"time_description": time_description, "days_offset": days_offset},
+            session_id=state.get("session_id", "default")
+        )
         
-        # Calcola la data
-        target_date = datetime.now() + timedelta(days=days_offset)
-        state["date_str"] = target_date.strftime("%d/%m/%Y")
+        state["messages"].append(
+            AIMessage(content="Non ho riconosciuto una località specifica nella tua richiesta. Puoi indicarmi una città?")
+        )
+        return state
+    
+    if validity.upper() == "INVALIDO" or not (0 <= days_offset <= 7):
+        state["location"] = None
+        state["days_offset"] = None
+        state["messages"].append(
+            AIMessage(content=f"Scusa, posso fornire il meteo solo per i prossimi 7 giorni da oggi, non nel passato. {location} quale giorno?")
+        )
+        return state
+    
+    state["location"] = location
+    state["locations"] = locations or [location]
+    state["days_offset"] = days_offset
+    state["time_of_day"] = time_of_day
+    state["hours_ahead"] = hours_ahead
+    
+    # Calcola la data
+    target_date = datetime.now(LOCAL_TZ) + timedelta(days=days_offset)
+    state["date_str"] = target_date.strftime("%d/%m/%Y")
+    
+    if len(state["locations"]) > 1:
+        cities = ", ".join(state["locations"][:-1]) + f" e {state['locations'][-1]}"
+        identified = f"città {cities} (confronto)"
+    else:
+        identified = f"città {location}"
+    
+    state["messages"].append(
+        AIMessage(content=f"Ho identificato: {identified}, meteo per {period_label(days_offset, time_of_day, hours_ahead)}. Sto recuperando i dati...")
+    )
+    
+    return state
+
+
+def extract_location_and_date(state: AgentState) -> AgentState:
+    """
+    Estrae la località e il tempo dalla query dell'utente usando OpenAI
+    Valida che il tempo sia entro 7 giorni da oggi
+    
+    Args:
+        state: Lo stato dell'agente
         
-        if days_offset == 0:
-            time_label = "oggi"
-        elif days_offset == 1:
-            time_label = "domani"
-        elif days_offset == 2:
-            time_label = "dopodomani"
-        else:
-            time_label = f"tra {days_offset} giorni"
+    Returns:
+        Lo stato aggiornato con la località e il tempo estratti
+    """
+    query = state["query"]
+    
+    # Aggiungiamo il messaggio dell'utente
+    state["messages"].append(HumanMessage(content=query))
+    
+    try:
+        data = extract_weather_slots(query)
+        apply_weather_slots(state, data)
         
+    except Exception as e:
+        state["location"] = None
+        state["days_offset"] = None
         state["messages"].append(
-            AIMessage(content=f"Ho identificato: città {location}, meteo per {time_label}. Sto recuperando i dati...")
+            AIMessage(content=f"Errore nell'analisi della richiesta: {describe_llm_error(e)}")
         )
+    
+    return state
+
+
+def apply_prefilled_slots(state: AgentState) -> AgentState:
+    """
+    Usa gli slot già estratti dal supervisore (modalità routing combinato),
+    saltando la chiamata LLM di estrazione
+    
+    Args:
+        state: Lo stato dell'agente, con gli slot in "slots"
+        
+    Returns:
+        Lo stato aggiornato con la località e il tempo
+    """
+    state["messages"].append(HumanMessage(content=state["query"]))
+    
+    try:
+        apply_weather_slots(state, state["slots"])
         
     except Exception as e:
         state["location"] = None
         state["days_offset"] = None
         state["messages"].append(
-            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}. Controlla la tua API key di OpenAI.")
+            AIMessage(content=f"Errore nell'analisi della richiesta: {str(e)}")
         )
     
     return state
 
 
+def route_start(state: AgentState) -> str:
+    """Salta l'estrazione se il supervisore ha già fornito gli slot"""
+    return "apply_prefilled_slots" if state.get("slots") else "extract_location_and_date"
+
+
+# A circuito aperto si usano le ultime coordinate ottenute per la località
+@protected("nominatim", key=lambda location: location.strip().lower())
+def geocode_location(location: str) -> list:
+    """
+    Interroga Nominatim (OpenStreetMap) per le coordinate di una località
+    
+    Args:
+        location: Nome della località
+        
+    Returns:
+        I risultati JSON di Nominatim (al più uno)
+    """
+    # Usa Nominatim per geocoding (gratuito, no API key)
+    url = NOMINATIM_URL
+    params = {
+        "q": f"{location}, Italia",
+        "format": "json",
+        "limit": 1
+    }
+    headers = {
+        "User-Agent": "WeatherAgent/1.0"
+    }
+    
+    # Timeout ridotto al tempo rimanente del turno, se inferiore; la connessione è riusata
+    response = http_get(url, params=params, headers=headers, timeout=stage_timeout(10))
+    response.raise_for_status()
+    
+    return response.json()
+
+
+def queued_geocode(location: str) -> list:
+    """
+    Geocodifica una località passando dalla coda con limite di frequenza di Nominatim
+    
+    Args:
+        location: Nome della località
+        
+    Returns:
+        I risultati JSON di Nominatim (al più uno)
+    """
+    # L'attesa in coda non può superare il tempo rimanente del turno; se scade, la richiesta
+    # resta in coda e le coordinate ottenute dopo finiscono comunque in cache
+    key = location.strip().lower()
+    return nominatim_queue.call(
+        key, geocode_location, location, timeout=stage_timeout(),
+        on_late_result=lambda data: geocoding_cache.put(key, data)
+    )
+
+
+def record_location_request(location: str):
+    """Registra una località richiesta nel registro delle ricerche recenti"""
+    key = location.strip().lower()
+    with _location_log_lock:
+        _location_log.append(key)
+        _location_names[key] = location
+        if len(_location_names) > 2 * TRENDING_WINDOW:
+            # Dimentica i nomi usciti dal registro
+            recent = set(_location_log)
+            for stale_key in [k for k in _location_names if k not in recent]:
+                del _location_names[stale_key]
+
+
+def trending_locations(limit: int = PREFETCH_TOP_N) -> list:
+    """
+    Restituisce le località più richieste di recente
+    
+    Args:
+        limit: Numero massimo di località
+        
+    Returns:
+        I nomi delle località, dalla più richiesta
+    """
+    with _location_log_lock:
+        counts = Counter(_location_log)
+        return [_location_names[key] for key, _ in counts.most_common(limit)]
+
+
+def _store_prefetched(key: str, future):
+    """Salva in cache le coordinate ottenute da un prefetch riuscito"""
+    if future.exception() is None:
+        geocoding_cache.put(key, future.result())
+
+
+def prefetch_trending_locations(limit: int = PREFETCH_TOP_N) -> int:
+    """
+    Mette in coda, con priorità bassa, la geocodifica delle località più richieste
+    assenti dalla cache o prossime alla scadenza
+    
+    Args:
+        limit: Numero di località più richieste da considerare
+        
+    Returns:
+        Il numero di geocodifiche messe in coda
+    """
+    queued = 0
+    for location in trending_locations(limit):
+        key = location.strip().lower()
+        age = geocoding_cache.age(key)
+        if age is not None and age < geocoding_cache.ttl * PREFETCH_REFRESH_AFTER:
+            continue
+        future = nominatim_queue.submit(key, geocode_location, location, priority=PRIORITY_PREFETCH)
+        if future is None:
+            break
+        future.add_done_callback(lambda done, key=key: _store_prefetched(key, done))
+        queued += 1
+    return queued
+
+
+def _maybe_prefetch_trending():
+    """Avvia il prefetch delle località più richieste al più una volta ogni PREFETCH_INTERVAL_S"""
+    global _last_prefetch
+    now = time.monotonic()
+    with _location_log_lock:
+        if now - _last_prefetch < PREFETCH_INTERVAL_S:
+            return
+        _last_prefetch = now
+    prefetch_trending_locations()
+
+
+def resolve_coordinates(location: str) -> tuple | None:
+    """
+    Restituisce le coordinate di una località, dalla cache o dalla coda di Nominatim
+    
+    Args:
+        location: Nome della località
+        
+    Returns:
+        (latitudine, longitudine), oppure None se la località non è stata trovata
+    """
+    record_location_request(location)
+    
+    # Le località in cache non passano dalla coda di Nominatim; le richieste
+    # concorrenti per la stessa località condividono una sola chiamata
+    data = geocoding_cache.get(location.strip().lower(), queued_geocode, location)
+    if not data:
+        return None
+    return float(data[0]["lat"]), float(data[0]["lon"])
+
+
 def get_coordinates(state: AgentState) -> AgentState:
     """
     Ottiene le coordinate geografiche della località usando Nominatim (OpenStreetMap)
@@ -185,25 +505,11 @@ def get_coordinates(state: AgentState) -> AgentState:
     try:
         location = state["location"]
         
-        # Usa Nominatim per geocoding (gratuito, no API key)
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": f"{location}, Italia",
-            "format": "json",
-            "limit": 1
-        }
-        headers = {
-            "User-Agent": "WeatherAgent/1.0"
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        coordinates = resolve_coordinates(location)
+        _maybe_prefetch_trending()
         
-        if data and len(data) > 0:
-            state["latitude"] = float(data[0]["lat"])
-            state["longitude"] = float(data[0]["lon"])
+        if coordinates is not None:
+            state["latitude"], state["longitude"] = coordinates
             
             state["messages"].append(
                 AIMessage(content=f"Coordinate trovate: {state['latitude']:.4f}°N, {state['longitude']:.4f}°E")
@@ -225,6 +531,344 @@ def get_coordinates(state: AgentState) -> AgentState:
     return state
 
 
+def get_all_coordinates(state: AgentState) -> AgentState:
+    """
+    Ottiene in parallelo le coordinate di tutte le località da confrontare
+    
+    Args:
+        state: Lo stato dell'agente
+        
+    Returns:
+        Lo stato aggiornato con le coordinate di ogni località (None se non trovata)
+    """
+    locations = state["locations"]
+    
+    # Ogni ricerca gira nel contesto del turno, così rispetta la sua scadenza
+    with ThreadPoolExecutor(max_workers=len(locations), thread_name_prefix="geocoding") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, resolve_coordinates, location) for location in locations]
+    
+    coordinates = []
+    for location, future in zip(locations, futures):
+        try:
+            coordinates.append(future.result())
+        except Exception as e:
+            coordinates.append(None)
+            state["messages"].append(
+                AIMessage(content=f"Errore nel recupero delle coordinate di {location}: {str(e)}")
+            )
+            continue
+        if coordinates[-1] is None:
+            state["messages"].append(
+                AIMessage(content=f"Non riesco a trovare le coordinate per {location}. Verifica il nome della città.")
+            )
+    _maybe_prefetch_trending()
+    
+    state["coordinates"] = coordinates
+    return state
+
+
+def get_open_meteo_session(retries: int):
+    """
+    Restituisce la sessione Open-Meteo (cache HTTP, retry e pool di connessioni) per il numero di tentativi
+    
+    Args:
+        retries: Numero massimo di tentativi
+        
+    Returns:
+        La sessione condivisa, creata al primo utilizzo
+    """
+    session = _open_meteo_sessions.get(retries)
+    if session is None:
+        with _open_meteo_lock:
+            session = _open_meteo_sessions.get(retries)
+            if session is None:
+                # Import al primo utilizzo: requests_cache è lento da caricare
+                import requests_cache
+                from urllib3 import Retry
+                
+                session = requests_cache.CachedSession('.cache', expire_after=3600)
+                # Stessa politica di retry di retry_requests, con il pool di connessioni condiviso
+                mount_pool(session, max_retries=Retry(
+                    total=retries, read=retries, connect=retries,
+                    backoff_factor=OPEN_METEO_BACKOFF,
+                    status_forcelist=(500, 502, 504), allowed_methods=None
+                ))
+                _open_meteo_sessions[retries] = session
+    return session
+
+
+def open_meteo_client():
+    """
+    Crea il client Open-Meteo con tentativi e timeout ricavati dal tempo rimanente del turno
+    
+    Returns:
+        Il client, che usa la sessione condivisa con cache e pool di connessioni
+    """
+    # Import al primo utilizzo: openmeteo_requests è lento da caricare
+    import openmeteo_requests
+    
+    # Con una scadenza, tentativi e attese di backoff devono stare nel tempo rimanente del turno
+    budget = stage_timeout()
+    retries = OPEN_METEO_RETRIES
+    if budget is not None:
+        while retries and OPEN_METEO_BACKOFF * (2 ** retries - 1) > budget / 2:
+            retries -= 1
+    
+    # Il client Open-Meteo non accetta un timeout: lo applica la vista sulla sessione condivisa,
+    # diviso tra i tentativi
+    timeout = budget / (retries + 1) if budget is not None else None
+    return openmeteo_requests.Client(session=TimeoutSession(get_open_meteo_session(retries), timeout))
+
+
+def request_daily_forecasts(coordinates: list) -> list:
+    """
+    Recupera le previsioni giornaliere da Open-Meteo API con una sola chiamata per tutte le coordinate
+    
+    Args:
+        coordinates: Lista di (latitudine, longitudine)
+        
+    Returns:
+        Per ogni coordinata, nello stesso ordine, il dizionario variabile -> array numpy
+        con i valori degli 8 giorni di previsione
+    """
+    openmeteo = open_meteo_client()
+    
+    # Parametri per Open-Meteo API: più località come liste separate da virgole
+    url = OPEN_METEO_URL
+    params = {
+        "latitude": ",".join(str(latitude) for latitude, _ in coordinates),
+        "longitude": ",".join(str(longitude) for _, longitude in coordinates),
+        "daily": DAILY_VARIABLES,
+        "timezone": FORECAST_TIMEZONE,
+        "forecast_days": 8
+    }
+    
+    # Chiama l'API: una risposta per località, nell'ordine delle coordinate
+    responses = openmeteo.weather_api(url, params=params)
+    
+    # Processa i dati giornalieri
+    forecasts = []
+    for response in responses:
+        daily = response.Daily()
+        forecasts.append({name: daily.Variables(i).ValuesAsNumpy() for i, name in enumerate(DAILY_VARIABLES)})
+    return forecasts
+
+
+# A circuito aperto si usano le ultime previsioni ottenute per le stesse coordinate
+@protected("open_meteo", key=lambda latitude, longitude: (round(latitude, 4), round(longitude, 4)))
+def fetch_daily_forecast(latitude: float, longitude: float) -> dict:
+    """
+    Recupera le previsioni giornaliere di una località da Open-Meteo API
+    
+    Args:
+        latitude: Latitudine
+        longitude: Longitudine
+        
+    Returns:
+        Dizionario variabile -> array numpy con i valori degli 8 giorni di previsione
+    """
+    return request_daily_forecasts([(latitude, longitude)])[0]
+
+
+@protected("open_meteo", key=lambda coordinates: tuple(coordinates))
+def fetch_daily_forecasts(coordinates: list) -> list:
+    """
+    Recupera con una sola chiamata le previsioni giornaliere di più località
+    
+    Args:
+        coordinates: Lista di (latitudine, longitudine)
+        
+    Returns:
+        I dizionari variabile -> array numpy, nell'ordine delle coordinate
+    """
+    return request_daily_forecasts(coordinates)
+
+
+class HourlyForecast:
+    """
+    Previsioni orarie in formato colonnare: un array numpy float32 per variabile,
+    più l'istante del primo valore e il passo in secondi. Le finestre temporali
+    sono slice degli array (viste, senza copie) ricavate dall'indice dell'ora
+    """
+    
+    __slots__ = ("start", "interval", "columns")
+    
+    def __init__(self, start: int, interval: int, columns: dict):
+        self.start = start
+        self.interval = interval
+        self.columns = columns
+    
+    def __len__(self) -> int:
+        return len(self.columns[HOURLY_VARIABLES[0]])
+    
+    def window(self, start: float, end: float) -> dict:
+        """
+        Restituisce i valori orari compresi tra due istanti
+        
+        Args:
+            start: Inizio della finestra (timestamp Unix, incluso)
+            end: Fine della finestra (timestamp Unix, escluso)
+            
+        Returns:
+            Dizionario variabile -> slice dell'array (vuoto se la finestra è fuori dalle previsioni)
+        """
+        first = max(0, int((start - self.start) // self.interval))
+        last = min(len(self), -int(-(end - self.start) // self.interval))
+        return {name: values[first:max(first, last)] for name, values in self.columns.items()}
+
+
+def request_hourly_forecasts(coordinates: list) -> list:
+    """
+    Recupera le previsioni orarie degli 8 giorni da Open-Meteo API con una sola chiamata per tutte le coordinate
+    
+    Args:
+        coordinates: Lista di (latitudine, longitudine)
+        
+    Returns:
+        Le previsioni orarie in formato colonnare, nell'ordine delle coordinate
+    """
+    # Import al primo utilizzo: numpy è già caricato da openmeteo_requests
+    import numpy as np
+    
+    openmeteo = open_meteo_client()
+    params = {
+        "latitude": ",".join(str(latitude) for latitude, _ in coordinates),
+        "longitude": ",".join(str(longitude) for _, longitude in coordinates),
+        "hourly": HOURLY_VARIABLES,
+        "timezone": FORECAST_TIMEZONE,
+        "forecast_days": 8
+    }
+    responses = openmeteo.weather_api(OPEN_METEO_URL, params=params)
+    
+    forecasts = []
+    for response in responses:
+        hourly = response.Hourly()
+        columns = {
+            name: hourly.Variables(i).ValuesAsNumpy().astype(np.float32, copy=False)
+            for i, name in enumerate(HOURLY_VARIABLES)
+        }
+        forecasts.append(HourlyForecast(hourly.Time(), hourly.Interval(), columns))
+    return forecasts
+
+
+# A circuito aperto si usano le ultime previsioni orarie ottenute per le stesse coordinate
+@protected("open_meteo", key=lambda latitude, longitude: ("hourly", round(latitude, 4), round(longitude, 4)))
+def fetch_hourly_forecast(latitude: float, longitude: float) -> HourlyForecast:
+    """
+    Recupera le previsioni orarie degli 8 giorni di una località da Open-Meteo API
+    
+    Args:
+        latitude: Latitudine
+        longitude: Longitudine
+        
+    Returns:
+        Le previsioni orarie in formato colonnare
+    """
+    return request_hourly_forecasts([(latitude, longitude)])[0]
+
+
+@protected("open_meteo", key=lambda coordinates: ("hourly", tuple(coordinates)))
+def fetch_hourly_forecasts(coordinates: list) -> list:
+    """
+    Recupera con una sola chiamata le previsioni orarie di più località
+    
+    Args:
+        coordinates: Lista di (latitudine, longitudine)
+        
+    Returns:
+        Le previsioni orarie in formato colonnare, nell'ordine delle coordinate
+    """
+    return request_hourly_forecasts(coordinates)
+
+
+def summarize_window(window: dict) -> dict:
+    """
+    Riassume i valori orari di una finestra con riduzioni numpy
+    
+    Args:
+        window: Dizionario variabile -> valori orari della finestra
+        
+    Returns:
+        Temperature minima e massima, precipitazioni totali, probabilità e vento
+        massimi e il codice meteo più severo
+    """
+    return {
+        "temperature_min": float(window["temperature_2m"].min()),
+        "temperature_max": float(window["temperature_2m"].max()),
+        "precipitation": float(window["precipitation"].sum()),
+        "precipitation_probability": float(window["precipitation_probability"].max()),
+        "windspeed": float(window["windspeed_10m"].max()),
+        # I codici WMO crescono con l'intensità del fenomeno
+        "weathercode": int(window["weathercode"].max()),
+    }
+
+
+def mark_extremes(day: dict) -> dict:
+    """
+    Aggiunge al confronto gli indici delle località più calda, più fredda e più piovosa
+    
+    Args:
+        day: Variabile giornaliera -> array con un valore per località
+        
+    Returns:
+        Lo stesso dizionario, con gli indici (None se i valori sono tutti uguali)
+    """
+    # Import al primo utilizzo: numpy è già caricato da openmeteo_requests
+    import numpy as np
+    
+    for label, name, pick in (
+        ("warmest", "temperature_2m_max", np.argmax),
+        ("coldest", "temperature_2m_min", np.argmin),
+        ("wettest", "precipitation_probability_max", np.argmax),
+    ):
+        values = day[name]
+        day[label] = int(pick(values)) if np.ptp(values) > 0 else None
+    return day
+
+
+def compare_forecasts(forecasts: list, days_offset: int) -> dict:
+    """
+    Estrae il giorno richiesto per tutte le località con operazioni vettoriali numpy
+    
+    Args:
+        forecasts: Le previsioni giornaliere delle località
+        days_offset: Giorni da oggi
+        
+    Returns:
+        Dizionario variabile -> array con un valore per località, più gli indici
+        delle località più calda, più fredda e più piovosa (None se i valori sono tutti uguali)
+    """
+    # Import al primo utilizzo: numpy è già caricato da openmeteo_requests
+    import numpy as np
+    
+    # Matrice località x giorni per variabile, poi la colonna del giorno richiesto
+    day = {name: np.stack([forecast[name] for forecast in forecasts])[:, days_offset] for name in DAILY_VARIABLES}
+    return mark_extremes(day)
+
+
+def compare_windows(windows: list) -> dict:
+    """
+    Confronta la stessa finestra oraria di più località
+    
+    Args:
+        windows: Per ogni località, dizionario variabile oraria -> valori della finestra
+        
+    Returns:
+        Come compare_forecasts: il riassunto di ogni finestra sotto il nome della variabile
+        giornaliera corrispondente, più gli indici delle località estreme
+    """
+    # Import al primo utilizzo: numpy è già caricato da openmeteo_requests
+    import numpy as np
+    
+    summaries = [summarize_window(window) for window in windows]
+    day = {
+        variable: np.array([summary[field] for summary in summaries], dtype=np.float32)
+        for field, variable, _ in DAILY_FIELDS
+    }
+    day["weathercode"] = np.array([summary["weathercode"] for summary in summaries])
+    return mark_extremes(day)
+
+
 def fetch_weather(state: AgentState) -> AgentState:
     """
     Recupera i dati meteo da Open-Meteo API
@@ -247,80 +891,16 @@ def fetch_weather(state: AgentState) -> AgentState:
         longitude = state["longitude"]
         days_offset = state.get("days_offset", 0)
         
-        # Setup Open-Meteo API client con cache e retry
-        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        openmeteo = openmeteo_requests.Client(session=retry_session)
-        
-        # Parametri per Open-Meteo API
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "daily": [
-                "temperature_2m_max",
-                "temperature_2m_min",
-                "precipitation_sum",
-                "precipitation_probability_max",
-                "windspeed_10m_max",
-                "weathercode"
-            ],
-            "timezone": "Europe/Rome",
-            "forecast_days": 8
-        }
-        
-        # Chiama l'API
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        
-        # Processa i dati giornalieri
-        daily = response.Daily()
-        daily_temperature_max = daily.Variables(0).ValuesAsNumpy()
-        daily_temperature_min = daily.Variables(1).ValuesAsNumpy()
-        daily_precipitation = daily.Variables(2).ValuesAsNumpy()
-        daily_precipitation_probability = daily.Variables(3).ValuesAsNumpy()
-        daily_windspeed = daily.Variables(4).ValuesAsNumpy()
-        daily_weathercode = daily.Variables(5).ValuesAsNumpy()
+        # Previsioni in cache per coordinate: se scadute da poco sono restituite subito e
+        # aggiornate in background; le richieste concorrenti condividono una sola chiamata
+        forecast = forecast_cache.get((round(latitude, 4), round(longitude, 4)), fetch_daily_forecast, latitude, longitude)
         
         # Estrai i dati per il giorno richiesto
-        if days_offset < len(daily_temperature_max):
+        if days_offset < len(forecast["temperature_2m_max"]):
             # Decodifica il weather code
-            weather_descriptions = {
-                0: "Cielo sereno",
-                1: "Prevalentemente sereno",
-                2: "Parzialmente nuvoloso",
-                3: "Nuvoloso",
-                45: "Nebbia",
-                48: "Nebbia con brina",
-                51: "Pioviggine leggera",
-                53: "Pioviggine moderata",
-                55: "Pioviggine intensa",
-                61: "Pioggia leggera",
-                63: "Pioggia moderata",
-                65: "Pioggia forte",
-                71: "Neve leggera",
-                73: "Neve moderata",
-                75: "Neve intensa",
-                80: "Rovesci leggeri",
-                81: "Rovesci moderati",
-                82: "Rovesci violenti",
-                95: "Temporale",
-                96: "Temporale con grandine leggera",
-                99: "Temporale con grandine"
-            }
-            
-            weathercode = int(daily_weathercode[days_offset])
-            condition = weather_descriptions.get(weathercode, f"Codice {weathercode}")
-            
-            # Determina il giorno in formato leggibile
-            if days_offset == 0:
-                time_label = "oggi"
-            elif days_offset == 1:
-                time_label = "domani"
-            elif days_offset == 2:
-                time_label = "dopodomani"
-            else:
-                time_label = f"tra {days_offset} giorni"
+            weathercode = int(forecast["weathercode"][days_offset])
+            condition = describe_weathercode(weathercode)
+            fields = format_day(forecast, days_offset)
             
             weather_data = {
                 "location": location,
@@ -328,11 +908,7 @@ def fetch_weather(state: AgentState) -> AgentState:
                 "longitude": longitude,
                 "days_offset": days_offset,
                 "date": state.get("date_str"),
-                "temperature_max": f"{daily_temperature_max[days_offset]:.1f}°C",
-                "temperature_min": f"{daily_temperature_min[days_offset]:.1f}°C",
-                "precipitation": f"{daily_precipitation[days_offset]:.1f} mm",
-                "precipitation_probability": f"{daily_precipitation_probability[days_offset]:.0f}%",
-                "windspeed": f"{daily_windspeed[days_offset]:.1f} km/h",
+                **fields,
                 "condition": condition,
                 "weathercode": weathercode,
                 "status": "recuperato",
@@ -342,15 +918,10 @@ def fetch_weather(state: AgentState) -> AgentState:
             state["weather_data"] = weather_data
             
             # Crea la risposta formattata
-            response_text = ""  # Inizializza response_text
-            response_text += f"METEO A {location.upper()}\n"
-            response_text += f"{time_label.capitalize()} ({state.get('date_str')})\n"
-            response_text += f"Coordinate: {latitude:.4f}°N, {longitude:.4f}°E\n\n"
-            response_text += f"Condizione: {condition}\n"
-            response_text += f"Temperatura: Min {weather_data['temperature_min']} / Max {weather_data['temperature_max']}\n"
-            response_text += f"Precipitazioni: {weather_data['precipitation']} (probabilità {weather_data['precipitation_probability']})\n"
-            response_text += f"Vento: {weather_data['windspeed']}\n"
-            response_text += f"\nFonte: Open-Meteo API\n"
+            response_text = daily_report(
+                location, day_label(days_offset), state.get("date_str"), latitude, longitude,
+                condition, fields
+            )
             
             state["messages"].append(AIMessage(content=response_text))
         else:
@@ -368,6 +939,332 @@ def fetch_weather(state: AgentState) -> AgentState:
     return state
 
 
+def local_time(timestamp: float) -> datetime:
+    """Data e ora di un timestamp Unix nel fuso orario delle previsioni"""
+    return datetime.fromtimestamp(timestamp, LOCAL_TZ)
+
+
+def hourly_window_bounds(forecast: HourlyForecast, days_offset: int, time_of_day: str | None,
+                         hours_ahead: int | None, now: float) -> tuple:
+    """
+    Calcola inizio e fine (timestamp Unix) della finestra oraria richiesta
+    
+    Args:
+        forecast: Le previsioni orarie (iniziano alla mezzanotte di oggi in FORECAST_TIMEZONE)
+        days_offset: Giorni da oggi
+        time_of_day: Fascia del giorno (chiave di TIME_WINDOWS) o None
+        hours_ahead: Ore da adesso o None
+        now: Istante attuale (timestamp Unix)
+        
+    Returns:
+        (inizio, fine): l'ora indicata da hours_ahead, oppure la fascia del giorno;
+        per oggi la fascia parte dall'ora attuale
+    """
+    if hours_ahead is not None:
+        start = now + hours_ahead * 3600
+        start -= (start - forecast.start) % forecast.interval
+        return start, start + forecast.interval
+    
+    # Mezzanotte del giorno richiesto nel fuso delle previsioni, a partire dalla data di oggi
+    # in quel fuso: con il cambio dell'ora un giorno non dura 86400 secondi
+    first_hour, last_hour, _ = TIME_WINDOWS[time_of_day]
+    day = local_time(now).date() + timedelta(days=days_offset)
+    midnight = datetime.combine(day, day_time(), LOCAL_TZ)
+    start = (midnight + timedelta(hours=first_hour)).timestamp()
+    end = (midnight + timedelta(hours=last_hour)).timestamp()
+    if days_offset == 0:
+        start = max(start, now - (now - forecast.start) % forecast.interval)
+    return start, end
+
+
+def fetch_hourly_weather(state: AgentState) -> AgentState:
+    """
+    Risponde a domande su una fascia del giorno o un'ora precisa ("pioverà stasera?",
+    "tra 3 ore") sezionando le previsioni orarie, richieste una sola volta per località
+    
+    Args:
+        state: Lo stato dell'agente
+        
+    Returns:
+        Lo stato aggiornato con i dati meteo della finestra oraria
+    """
+    if not state.get("location") or state.get("latitude") is None or state.get("longitude") is None:
+        state["messages"].append(
+            AIMessage(content="Non posso recuperare i dati meteo senza coordinate valide.")
+        )
+        return state
+    
+    try:
+        location = state["location"]
+        latitude = state["latitude"]
+        longitude = state["longitude"]
+        days_offset = state.get("days_offset") or 0
+        time_of_day = state.get("time_of_day")
+        hours_ahead = state.get("hours_ahead")
+        label = period_label(days_offset, time_of_day, hours_ahead)
+        
+        # Le previsioni orarie degli 8 giorni sono in cache per coordinate: le altre
+        # fasce e ore della stessa località non richiedono nuove chiamate
+        forecast = hourly_forecast_cache.get(
+            (round(latitude, 4), round(longitude, 4)), fetch_hourly_forecast, latitude, longitude
+        )
+        start, end = hourly_window_bounds(forecast, days_offset, time_of_day, hours_ahead, time.time())
+        window = forecast.window(start, end)
+        
+        if not len(window["temperature_2m"]):
+            message = (
+                f"La fascia di {label} è già passata." if end <= time.time()
+                else f"Dati meteo orari non disponibili per {label}."
+            )
+            state["messages"].append(AIMessage(content=message))
+            state["weather_data"] = {"error": "Fascia oraria non disponibile"}
+            return state
+        
+        summary = summarize_window(window)
+        weathercode = summary["weathercode"]
+        condition = describe_weathercode(weathercode)
+        rain_likely = summary["precipitation_probability"] >= RAIN_PROBABILITY_THRESHOLD
+        hours = f"{local_time(start):%H:%M}-{local_time(end):%H:%M}"
+        fields = format_summary(summary)
+        
+        weather_data = {
+            "location": location,
+            "latitude": latitude,
+            "longitude": longitude,
+            "days_offset": days_offset,
+            "date": state.get("date_str"),
+            "period": label,
+            "hours": hours,
+            **fields,
+            "rain_likely": rain_likely,
+            "condition": condition,
+            "weathercode": weathercode,
+            "status": "recuperato",
+            "source": "Open-Meteo API"
+        }
+        state["weather_data"] = weather_data
+        
+        # Dettaglio ora per ora, formattato per colonna
+        detail = ""
+        if len(window["temperature_2m"]) > 1:
+            first = int(max(start, forecast.start))
+            hours_labels = [
+                f"{local_time(first + i * forecast.interval):%H:%M}"
+                for i in range(len(window["temperature_2m"]))
+            ]
+            detail = "\nOra per ora:\n" + hour_rows(hours_labels, window)
+        
+        # Crea la risposta formattata
+        response_text = hourly_report(
+            location, label, state.get("date_str"), hours, latitude, longitude,
+            rain_likely, condition, fields, detail
+        )
+        
+        state["messages"].append(AIMessage(content=response_text))
+        
+    except Exception as e:
+        state["messages"].append(
+            AIMessage(content=f"Scusa, non riesco a recuperare i dati meteo per {state['location']}. Errore: {str(e)}")
+        )
+        state["weather_data"] = {"error": str(e)}
+    
+    return state
+
+
+def fetch_weather_comparison(state: AgentState) -> AgentState:
+    """
+    Recupera con una sola chiamata a Open-Meteo i dati meteo di più località e li confronta
+    
+    Args:
+        state: Lo stato dell'agente
+        
+    Returns:
+        Lo stato aggiornato con i dati meteo di ogni località
+    """
+    found = [
+        (location, coordinates)
+        for location, coordinates in zip(state["locations"], state.get("coordinates") or [])
+        if coordinates is not None
+    ]
+    if not found:
+        state["messages"].append(
+            AIMessage(content="Non posso recuperare i dati meteo senza coordinate valide.")
+        )
+        return state
+    
+    try:
+        days_offset = state.get("days_offset", 0)
+        
+        # Previsioni in cache per coordinate: quelle mancanti sono richieste tutte insieme
+        keys = [(round(latitude, 4), round(longitude, 4)) for _, (latitude, longitude) in found]
+        forecasts = forecast_cache.get_many(keys, fetch_daily_forecasts)
+        
+        if any(days_offset >= len(forecast["temperature_2m_max"]) for forecast in forecasts):
+            state["messages"].append(
+                AIMessage(content=f"Dati meteo non disponibili per il giorno richiesto.")
+            )
+            state["weather_data"] = {"error": "Giorno non disponibile"}
+            return state
+        
+        day = compare_forecasts(forecasts, days_offset)
+        
+        conditions = describe_weathercodes(day["weathercode"])
+        locations_data = [
+            {
+                "location": location,
+                "latitude": latitude,
+                "longitude": longitude,
+                **format_day(day, i),
+                "condition": conditions[i],
+                "weathercode": int(day["weathercode"].item(i))
+            }
+            for i, (location, (latitude, longitude)) in enumerate(found)
+        ]
+        
+        extremes = {label: day[label] for label in ("warmest", "coldest", "wettest")}
+        missing = [location for location, coordinates in zip(state["locations"], state["coordinates"]) if coordinates is None]
+        
+        state["weather_data"] = {
+            "locations": locations_data,
+            "days_offset": days_offset,
+            "date": state.get("date_str"),
+            **{label: None if index is None else locations_data[index]["location"] for label, index in extremes.items()},
+            "not_found": missing,
+            "status": "recuperato",
+            "source": "Open-Meteo API"
+        }
+        
+        # Crea la risposta formattata: le righe delle località sono formattate per colonna
+        response_text = comparison_report(
+            [location for location, _ in found], day_label(days_offset), state.get("date_str"), day, extremes, missing
+        )
+        
+        state["messages"].append(AIMessage(content=response_text))
+        
+    except Exception as e:
+        cities = ", ".join(location for location, _ in found)
+        state["messages"].append(
+            AIMessage(content=f"Scusa, non riesco a recuperare i dati meteo per {cities}. Errore: {str(e)}")
+        )
+        state["weather_data"] = {"error": str(e)}
+    
+    return state
+
+
+def fetch_hourly_comparison(state: AgentState) -> AgentState:
+    """
+    Confronta più località su una fascia del giorno o un'ora precisa ("pioverà stasera
+    a Roma e Milano?"), con le previsioni orarie mancanti richieste in una sola chiamata
+    
+    Args:
+        state: Lo stato dell'agente
+        
+    Returns:
+        Lo stato aggiornato con i dati meteo della finestra oraria di ogni località
+    """
+    found = [
+        (location, coordinates)
+        for location, coordinates in zip(state["locations"], state.get("coordinates") or [])
+        if coordinates is not None
+    ]
+    if not found:
+        state["messages"].append(
+            AIMessage(content="Non posso recuperare i dati meteo senza coordinate valide.")
+        )
+        return state
+    
+    try:
+        days_offset = state.get("days_offset") or 0
+        time_of_day = state.get("time_of_day")
+        hours_ahead = state.get("hours_ahead")
+        label = period_label(days_offset, time_of_day, hours_ahead)
+        
+        # Previsioni orarie in cache per coordinate, condivise con le richieste per una sola località
+        keys = [(round(latitude, 4), round(longitude, 4)) for _, (latitude, longitude) in found]
+        forecasts = hourly_forecast_cache.get_many(keys, fetch_hourly_forecasts)
+        
+        now = time.time()
+        bounds = [hourly_window_bounds(forecast, days_offset, time_of_day, hours_ahead, now) for forecast in forecasts]
+        windows = [forecast.window(start, end) for forecast, (start, end) in zip(forecasts, bounds)]
+        
+        if any(not len(window["temperature_2m"]) for window in windows):
+            start, end = bounds[0]
+            message = (
+                f"La fascia di {label} è già passata." if end <= now
+                else f"Dati meteo orari non disponibili per {label}."
+            )
+            state["messages"].append(AIMessage(content=message))
+            state["weather_data"] = {"error": "Fascia oraria non disponibile"}
+            return state
+        
+        day = compare_windows(windows)
+        start, end = bounds[0]
+        hours = f"{local_time(start):%H:%M}-{local_time(end):%H:%M}"
+        
+        conditions = describe_weathercodes(day["weathercode"])
+        locations_data = [
+            {
+                "location": location,
+                "latitude": latitude,
+                "longitude": longitude,
+                **format_day(day, i),
+                "rain_likely": day["precipitation_probability_max"].item(i) >= RAIN_PROBABILITY_THRESHOLD,
+                "condition": conditions[i],
+                "weathercode": int(day["weathercode"].item(i))
+            }
+            for i, (location, (latitude, longitude)) in enumerate(found)
+        ]
+        
+        extremes = {key: day[key] for key in ("warmest", "coldest", "wettest")}
+        missing = [location for location, coordinates in zip(state["locations"], state["coordinates"]) if coordinates is None]
+        
+        state["weather_data"] = {
+            "locations": locations_data,
+            "days_offset": days_offset,
+            "date": state.get("date_str"),
+            "period": label,
+            "hours": hours,
+            **{key: None if index is None else locations_data[index]["location"] for key, index in extremes.items()},
+            "not_found": missing,
+            "status": "recuperato",
+            "source": "Open-Meteo API"
+        }
+        
+        response_text = comparison_report(
+            [location for location, _ in found], label, f"{state.get('date_str')}, {hours}", day, extremes, missing
+        )
+        
+        state["messages"].append(AIMessage(content=response_text))
+        
+    except Exception as e:
+        cities = ", ".join(location for location, _ in found)
+        state["messages"].append(
+            AIMessage(content=f"Scusa, non riesco a recuperare i dati meteo per {cities}. Errore: {str(e)}")
+        )
+        state["weather_data"] = {"error": str(e)}
+    
+    return state
+
+
+def route_locations(state: AgentState) -> str:
+    """Con più località la richiesta diventa un confronto, con coordinate e previsioni ottenute insieme"""
+    return "get_all_coordinates" if len(state.get("locations") or []) > 1 else "get_coordinates"
+
+
+def route_forecast_mode(state: AgentState) -> str:
+    """Con una fascia del giorno o un numero di ore si usano le previsioni orarie"""
+    if state.get("time_of_day") or state.get("hours_ahead") is not None:
+        return "fetch_hourly_weather"
+    return "fetch_weather"
+
+
+def route_comparison_mode(state: AgentState) -> str:
+    """Anche il confronto tra località usa le previsioni orarie con una fascia del giorno o un numero di ore"""
+    if state.get("time_of_day") or state.get("hours_ahead") is not None:
+        return "fetch_hourly_comparison"
+    return "fetch_weather_comparison"
+
+
 def build_weather_agent():
     """
     Costruisce il grafo dell'agente meteo usando LangGraph
@@ -378,15 +1275,25 @@ def build_weather_agent():
     workflow = StateGraph(AgentState)
     
     # Aggiungiamo i nodi
-    workflow.add_node("extract_location_and_date", extract_location_and_date)
-    workflow.add_node("get_coordinates", get_coordinates)
-    workflow.add_node("fetch_weather", fetch_weather)
+    workflow.add_node("extract_location_and_date", timed_node("WEATHER", "extract_location_and_date")(extract_location_and_date))
+    workflow.add_node("apply_prefilled_slots", timed_node("WEATHER", "apply_prefilled_slots")(apply_prefilled_slots))
+    workflow.add_node("get_coordinates", timed_node("WEATHER", "get_coordinates")(get_coordinates))
+    workflow.add_node("fetch_weather", timed_node("WEATHER", "fetch_weather")(fetch_weather))
+    workflow.add_node("fetch_hourly_weather", timed_node("WEATHER", "fetch_hourly_weather")(fetch_hourly_weather))
+    workflow.add_node("get_all_coordinates", timed_node("WEATHER", "get_all_coordinates")(get_all_coordinates))
+    workflow.add_node("fetch_weather_comparison", timed_node("WEATHER", "fetch_weather_comparison")(fetch_weather_comparison))
+    workflow.add_node("fetch_hourly_comparison", timed_node("WEATHER", "fetch_hourly_comparison")(fetch_hourly_comparison))
     
     # Definiamo il flusso
-    workflow.add_edge(START, "extract_location_and_date")
-    workflow.add_edge("extract_location_and_date", "get_coordinates")
-    workflow.add_edge("get_coordinates", "fetch_weather")
+    workflow.add_conditional_edges(START, route_start, ["extract_location_and_date", "apply_prefilled_slots"])
+    workflow.add_conditional_edges("extract_location_and_date", route_locations, ["get_coordinates", "get_all_coordinates"])
+    workflow.add_conditional_edges("apply_prefilled_slots", route_locations, ["get_coordinates", "get_all_coordinates"])
+    workflow.add_conditional_edges("get_coordinates", route_forecast_mode, ["fetch_weather", "fetch_hourly_weather"])
     workflow.add_edge("fetch_weather", END)
+    workflow.add_edge("fetch_hourly_weather", END)
+    workflow.add_conditional_edges("get_all_coordinates", route_comparison_mode, ["fetch_weather_comparison", "fetch_hourly_comparison"])
+    workflow.add_edge("fetch_weather_comparison", END)
+    workflow.add_edge("fetch_hourly_comparison", END)
     
     # Compiliamo il grafo
     graph = workflow.compile()
@@ -408,30 +1315,17 @@ def visualize_graph():
     graph = build_weather_agent()
     
     try:
-        # 1. Genera la rappresentazione Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
-        
-        # Salva il diagramma Mermaid in un file .md
-        mermaid_path = "weather_agent_graph.md"
-        with open(mermaid_path, "w", encoding="utf-8") as f:
-            f.write("# Grafo Agente Meteo\n\n")
-            f.write("Questo grafo mostra il flusso dell'agente meteo:\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-        print(f"✓ Diagramma Mermaid salvato in: {mermaid_path}")
-        
-        # 2. Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "weather_agent_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(
+            graph, "weather_agent_graph", "Grafo Agente Meteo",
+            "Questo grafo mostra il flusso dell'agente meteo:"
+        )
+        mermaid_code = rendering["mermaid"]
+        print(f"✓ Diagramma Mermaid salvato in: {rendering['md_path']}")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
         # Stampa il diagramma in console
         print("\n" + "="*60)
@@ -454,12 +1348,15 @@ def visualize_graph():
     print("="*60 + "\n")
 
 # Funzione per eseguire l'agente
-def run_weather_agent(query: str) -> dict:
+@timed_agent("WEATHER")
+def run_weather_agent(query: str, session_id: str = "default", slots: dict | None = None) -> dict:
     """
     Esegue l'agente meteo con la query dell'utente
     
     Args:
         query: La domanda dell'utente
+        session_id: ID della conversazione a cui associare eventuali richieste in sospeso
+        slots: Slot già estratti dal supervisore; se presenti l'estrazione con l'LLM viene saltata
         
     Returns:
         Il risultato finale dello stato dell'agente
@@ -469,10 +1366,16 @@ def run_weather_agent(query: str) -> dict:
     
     initial_state = {
         "query": query,
+        "session_id": session_id,
+        "slots": slots,
         "location": None,
         "latitude": None,
         "longitude": None,
+        "locations": None,
+        "coordinates": None,
         "days_offset": None,
+        "time_of_day": None,
+        "hours_ahead": None,
         "date_str": None,
         "weather_data": None,
         "messages": []
@@ -4,19 +4,64 @@ Estrae il contenuto e usa l'LLM per rispondere alla domanda dell'utente
 """
 
 import os
-import wikipedia
+import threading
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# Aggiungi il path parent per importare i moduli condivisi
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from metrics import timed_node, timed_agent
+from llm_usage import invoke_llm, PROMPT_ANSWER, PROMPT_EXTRACTION
+from llm_provider import get_llm
+from singleflight import wikipedia_flight
+from circuit_breaker import protected, get_breaker
+from semantic_cache import wikipedia_answer_cache
+from graph_rendering import render_graph_files
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
-# Configura Wikipedia in italiano
-wikipedia.set_lang("it")
+# Endpoint alternativo dell'API di Wikipedia (es. per i benchmark offline)
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL")
+
+_wikipedia = None
+_wikipedia_lock = threading.Lock()
+
+
+def get_wikipedia():
+    """
+    Importa e configura la libreria wikipedia al primo utilizzo
+    (la libreria carica requests e BeautifulSoup, lenti da importare)
+    
+    Returns:
+        Il modulo wikipedia configurato in italiano
+    """
+    global _wikipedia
+    if _wikipedia is None:
+        with _wikipedia_lock:
+            if _wikipedia is None:
+                import wikipedia
+                
+                # Configura Wikipedia in italiano
+                wikipedia.set_lang("it")
+                if WIKIPEDIA_API_URL:
+                    wikipedia.wikipedia.API_URL = WIKIPEDIA_API_URL
+                # La libreria usa requests.get (nuova connessione, nessun timeout):
+                # le richieste passano dal pool condiviso con il timeout del turno
+                from http_client import wikipedia_requests
+                wikipedia.wikipedia.requests = wikipedia_requests
+                # Pagine inesistenti o ambigue sono risposte valide, non guasti del servizio
+                get_breaker("wikipedia").expected_errors = (
+                    wikipedia.exceptions.DisambiguationError,
+                    wikipedia.exceptions.PageError,
+                )
+                _wikipedia = wikipedia
+    return _wikipedia
 
 
 class WikipediaState(TypedDict):
@@ -47,11 +92,7 @@ def extract_search_terms(state: WikipediaState) -> WikipediaState:
     
     try:
         # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        llm = get_llm(temperature=0)
         
         # Prompt per l'estrazione dei termini di ricerca
         extraction_prompt = f"""Analizza la seguente domanda ed estrai i termini chiave da cercare su Wikipedia.
@@ -67,10 +108,10 @@ Domanda utente: {query}
 Rispondi SOLO con i termini di ricerca, senza spiegazioni."""
         
         # Chiama OpenAI
-        response = llm.invoke([
+        response = invoke_llm(llm, [
             SystemMessage(content="Sei un esperto nell'estrazione di termini di ricerca per Wikipedia."),
             HumanMessage(content=extraction_prompt)
-        ])
+        ], agent="WIKIPEDIA", prompt=PROMPT_EXTRACTION)
         
         search_query = response.content.strip()
         state["search_query"] = search_query
@@ -102,7 +143,8 @@ def search_wikipedia(state: WikipediaState) -> WikipediaState:
     
     try:
         # Cerca su Wikipedia
-        results = wikipedia.search(search_query, results=5)
+        # Le ricerche concorrenti identiche condividono una sola chiamata
+        results, _ = wikipedia_flight.do(("search", search_query), search_pages, search_query)
         state["search_results"] = results
         
         if results:
@@ -123,6 +165,35 @@ def search_wikipedia(state: WikipediaState) -> WikipediaState:
     return state
 
 
+@protected("wikipedia", key=lambda query: ("search", query))
+def search_pages(query: str) -> list:
+    """
+    Cerca le pagine Wikipedia corrispondenti alla query
+    
+    Args:
+        query: Testo della ricerca
+        
+    Returns:
+        I titoli delle pagine trovate (al più 5)
+    """
+    return get_wikipedia().search(query, results=5)
+
+
+@protected("wikipedia", key=lambda title: ("page", title))
+def load_page(title: str) -> tuple:
+    """
+    Scarica una pagina Wikipedia con il suo contenuto
+    
+    Args:
+        title: Titolo della pagina
+        
+    Returns:
+        Tupla (titolo, contenuto) della pagina
+    """
+    page = get_wikipedia().page(title, auto_suggest=False)
+    return page.title, page.content
+
+
 def fetch_page_content(state: WikipediaState) -> WikipediaState:
     """
     Recupera il contenuto della pagina Wikipedia più rilevante
@@ -140,35 +211,38 @@ def fetch_page_content(state: WikipediaState) -> WikipediaState:
         state["page_title"] = None
         return state
     
+    wikipedia = get_wikipedia()
+    
     # Prova a recuperare la prima pagina
     for result in results[:3]:  # Prova le prime 3 per sicurezza
         try:
-            page = wikipedia.page(result, auto_suggest=False)
+            # Le richieste concorrenti per la stessa pagina condividono una sola chiamata
+            (page_title, page_content), _ = wikipedia_flight.do(("page", result), load_page, result)
             
             # Limita il contenuto a ~4000 caratteri per non sovraccaricare l'LLM
-            content = page.content[:4000]
-            if len(page.content) > 4000:
+            content = page_content[:4000]
+            if len(page_content) > 4000:
                 content += "... (contenuto troncato)"
             
             state["page_content"] = content
-            state["page_title"] = page.title
+            state["page_title"] = page_title
             state["messages"].append(
-                AIMessage(content=f"Recuperata pagina: '{page.title}' ({len(page.content)} caratteri)")
+                AIMessage(content=f"Recuperata pagina: '{page_title}' ({len(page_content)} caratteri)")
             )
             break
             
         except wikipedia.exceptions.DisambiguationError as e:
             # Pagina di disambiguazione - prova con la prima opzione
             try:
-                page = wikipedia.page(e.options[0], auto_suggest=False)
-                content = page.content[:4000]
-                if len(page.content) > 4000:
+                (page_title, page_content), _ = wikipedia_flight.do(("page", e.options[0]), load_page, e.options[0])
+                content = page_content[:4000]
+                if len(page_content) > 4000:
                     content += "... (contenuto troncato)"
                     
                 state["page_content"] = content
-                state["page_title"] = page.title
+                state["page_title"] = page_title
                 state["messages"].append(
-                    AIMessage(content=f"Trovata disambiguazione, uso: '{page.title}'")
+                    AIMessage(content=f"Trovata disambiguazione, uso: '{page_title}'")
                 )
                 break
             except:
@@ -213,13 +287,18 @@ def generate_answer(state: WikipediaState) -> WikipediaState:
         )
         return state
     
+    # Risposta già generata per la stessa domanda (o una sua parafrasi) sulla stessa pagina
+    cached_answer = wikipedia_answer_cache.get(page_title, query)
+    if cached_answer is not None:
+        state["response"] = cached_answer
+        state["messages"].append(
+            AIMessage(content=state["response"])
+        )
+        return state
+    
     try:
         # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.3,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        llm = get_llm(temperature=0.3)
         
         # Prompt per generare la risposta
         answer_prompt = f"""Hai a disposizione il contenuto di una pagina Wikipedia. Usa queste informazioni per rispondere alla domanda dell'utente.
@@ -242,15 +321,16 @@ ISTRUZIONI:
 Fornisci la tua risposta:"""
         
         # Chiama OpenAI
-        response = llm.invoke([
+        response = invoke_llm(llm, [
             SystemMessage(content="Sei un assistente esperto che risponde a domande basandoti su contenuti enciclopedici."),
             HumanMessage(content=answer_prompt)
-        ])
+        ], agent="WIKIPEDIA", prompt=PROMPT_ANSWER)
         
         state["response"] = response.content.strip()
         state["messages"].append(
             AIMessage(content=state["response"])
         )
+        wikipedia_answer_cache.put(page_title, query, state["response"])
         
     except Exception as e:
         state["response"] = f"Mi dispiace, si è verificato un errore nel generare la risposta: {str(e)}"
@@ -266,10 +346,10 @@ def build_graph() -> StateGraph:
     workflow = StateGraph(WikipediaState)
     
     # Aggiungi i nodi
-    workflow.add_node("extract_search", extract_search_terms)
-    workflow.add_node("search", search_wikipedia)
-    workflow.add_node("fetch_content", fetch_page_content)
-    workflow.add_node("generate", generate_answer)
+    workflow.add_node("extract_search", timed_node("WIKIPEDIA", "extract_search")(extract_search_terms))
+    workflow.add_node("search", timed_node("WIKIPEDIA", "search")(search_wikipedia))
+    workflow.add_node("fetch_content", timed_node("WIKIPEDIA", "fetch_content")(fetch_page_content))
+    workflow.add_node("generate", timed_node("WIKIPEDIA", "generate")(generate_answer))
     
     # Definisci il flusso
     workflow.add_edge(START, "extract_search")
@@ -281,6 +361,7 @@ def build_graph() -> StateGraph:
     return workflow.compile()
 
 
+@timed_agent("WIKIPEDIA")
 def run_wikipedia_agent(query: str) -> dict:
     """
     Esegue l'agente Wikipedia per rispondere a una domanda enciclopedica
@@ -319,34 +400,21 @@ def run_wikipedia_agent(query: str) -> dict:
 
 def visualize_graph():
     """Visualizza il grafo dell'agente Wikipedia"""
-    graph = build_graph()
-    
-    # Genera il grafo Mermaid
-    mermaid_code = graph.get_graph().draw_mermaid()
+    try:
+        graph = build_graph()
         
-    print("Grafo Mermaid dell'agente wikipedia:")
-    print(mermaid_code)
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(graph, "wikipedia_agent_graph", "Grafo Agente Wikipedia")
         
-    # Salva in un file
-    with open("wikipedia_agent_graph.md", "w", encoding="utf-8") as f:
-        f.write("# Grafo Agente Wikipedia\n\n")
-        f.write("```mermaid\n")
-        f.write(mermaid_code)
-        f.write("\n```\n")
+        print("Grafo Mermaid dell'agente wikipedia:")
+        print(rendering["mermaid"])
         
-    print("\nGrafo salvato in wikipedia_agent_graph.md")
+        print(f"\nGrafo salvato in {rendering['md_path']}")
         
-    #Prova a generare l'immagine PNG
-    try:
-        png_data = graph.get_graph().draw_mermaid_png()
-        png_path = "wikipedia_agent_graph.png"
-        with open(png_path, "wb") as f:
-            f.write(png_data)
-        print(f"Grafo PNG salvato in: {png_path}")
-    except Exception as png_error:
-            print(f"PNG non generato: {png_error}")
-            print("  Installa le dipendenze opzionali per generare PNG:")
-            print("  pip install pygraphviz o pip install pydot")
+        if rendering["png_path"]:
+            print(f"Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("PNG non generato: controlla i log")
         
     except Exception as e:
         print(f"Errore nella visualizzazione del grafo: {e}")
@@ -0,0 +1,275 @@
+"""
+Elaborazione batch di query (valutazioni notturne, generazione di FAQ)
+Esegue il supervisore su molte query con concorrenza limitata e timeout per
+singola query, raggruppando le chiamate LLM di routing. I risultati sono
+prodotti in JSONL man mano che sono pronti e il file di output fa da
+checkpoint: con la ripresa le query già scritte vengono saltate (con
+--retry-failed solo quelle completate con successo) e ogni ID compare
+una sola volta nel file
+"""
+
+import os
+import sys
+import json
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from typing import Dict, Iterable, Iterator, Optional
+
+from multiagent import run_supervisor, build_routing_messages, extract_final_response
+from conversation_manager import conversation_manager
+from llm_usage import invoke_llm_batch, PROMPT_ROUTING
+from llm_provider import get_llm
+from deadline import deadline_scope, deadline_after, turn_budget
+from metrics import metrics_registry, Counter
+from logging_manager import get_logger
+
+
+logger = get_logger("batch")
+
+# Query per gruppo di chiamate di routing raggruppate
+DEFAULT_CHUNK_SIZE = 32
+
+# Margine oltre la scadenza del turno prima di abbandonarlo (per le fasi che non la rispettano)
+TIMEOUT_GRACE_S = 1.0
+
+
+def batch_items() -> Counter:
+    """Query elaborate in batch per esito: ok, partial, timeout o error"""
+    return metrics_registry.counter(
+        "alexa_batch_items_total",
+        "Query elaborate in modalità batch per esito",
+        ("status",)
+    )
+
+
+def normalize_items(queries: Iterable) -> list:
+    """
+    Normalizza le query in dizionari {"id", "query"}
+
+    Args:
+        queries: Stringhe oppure dizionari con "query" e "id" opzionale
+
+    Returns:
+        Lista di dizionari; senza "id" si usa la posizione della query
+    """
+    items = []
+    for index, item in enumerate(queries):
+        if isinstance(item, str):
+            item = {"query": item}
+        items.append({"id": str(item.get("id", index)), "query": item["query"]})
+    return items
+
+
+def route_batch(queries: list, concurrency: int, timeout: Optional[float] = None) -> list:
+    """
+    Esegue le chiamate di routing di un gruppo di query con una sola chiamata `batch` del modello
+    Le chiamate hanno come scadenza il budget di una singola query: se il circuito OpenAI
+    è aperto o il gruppo non risponde in tempo, ogni turno instrada da solo entro la propria scadenza
+
+    Args:
+        queries: Le query da instradare
+        concurrency: Numero massimo di chiamate contemporanee
+        timeout: Budget in secondi per singola query (None = budget di default del turno)
+
+    Returns:
+        Le risposte di routing nello stesso ordine; None per le chiamate fallite,
+        che il router ripeterà durante il turno
+    """
+    budget = timeout if timeout is not None else turn_budget()
+    try:
+        with deadline_scope(deadline_after(budget)):
+            responses = invoke_llm_batch(
+                get_llm(temperature=0),
+                [build_routing_messages(query) for query in queries],
+                agent="SUPERVISOR", prompt=PROMPT_ROUTING, max_concurrency=concurrency
+            )
+    except Exception as e:
+        logger.warning("Routing raggruppato non riuscito, ogni turno instraderà da solo: %s", e)
+        return [None] * len(queries)
+
+    return [None if isinstance(response, Exception) else response.content for response in responses]
+
+
+def _run_item(turns: ThreadPoolExecutor, item: dict, routing_response: Optional[str],
+              timeout: Optional[float]) -> dict:
+    """Esegue una query rispettandone il timeout e restituisce il record di output"""
+    session_id = f"batch-{item['id']}"
+    record = {"id": item["id"], "query": item["query"]}
+    start = time.perf_counter()
+
+    # Il timeout è la scadenza del turno, così il supervisore restituisce una risposta parziale.
+    # Il turno gira in un thread separato: se non rispetta la scadenza il worker si libera
+    # comunque dopo un margine, mentre il turno termina in background e viene ignorato
+    context = contextvars.copy_context()
+    future = turns.submit(context.run, run_supervisor, item["query"], session_id, routing_response, timeout)
+    # Ogni query ha la propria sessione: le richieste in sospeso non servono dopo il turno
+    future.add_done_callback(lambda _: conversation_manager.clear_pending_request(session_id))
+
+    try:
+        result = future.result(timeout=None if timeout is None else timeout + TIMEOUT_GRACE_S)
+        record.update(
+            status="partial" if result.get("deadline_exceeded") else "ok",
+            agent=result.get("selected_agent"),
+            response=extract_final_response(result),
+            # La chiamata di routing raggruppata avviene fuori dal turno: si conta qui
+            llm_calls=result["llm_usage"]["calls"] + (routing_response is not None)
+        )
+    except FutureTimeout:
+        record.update(status="timeout", error=f"Tempo massimo di {timeout}s superato")
+    except Exception as e:
+        logger.exception("Errore nella query %s", item["id"])
+        record.update(status="error", error=str(e))
+
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    batch_items().inc(status=record["status"])
+    return record
+
+
+def run_supervisor_batch(queries: Iterable, concurrency: int = 4, timeout: Optional[float] = None,
+                         skip_ids: Iterable = (), group_routing: bool = True,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Esegue il supervisore su un insieme di query
+
+    Args:
+        queries: Stringhe oppure dizionari con "query" e "id" opzionale
+        concurrency: Numero massimo di turni eseguiti contemporaneamente
+        timeout: Budget in secondi per singola query (None = budget di default del turno)
+        skip_ids: ID delle query già completate (ripresa da checkpoint)
+        group_routing: Se True le chiamate di routing di ogni gruppo sono fatte con `llm.batch`
+        chunk_size: Numero di query per gruppo
+
+    Yields:
+        Un record per query, nell'ordine di completamento, con id, query, status
+        (ok/partial/timeout/error), agent, response, llm_calls (compresa la chiamata
+        di routing raggruppata) e latency_ms
+    """
+    skip_ids = set(skip_ids)
+    items = [item for item in normalize_items(queries) if item["id"] not in skip_ids]
+
+    workers = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    # Margine per i turni scaduti che terminano in background
+    turns = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix="batch-turn")
+    try:
+        for offset in range(0, len(items), chunk_size):
+            chunk = items[offset:offset + chunk_size]
+            if group_routing:
+                routing = route_batch([item["query"] for item in chunk], concurrency, timeout)
+            else:
+                routing = [None] * len(chunk)
+
+            futures = [
+                workers.submit(_run_item, turns, item, routing_response, timeout)
+                for item, routing_response in zip(chunk, routing)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        workers.shutdown(wait=True, cancel_futures=True)
+        turns.shutdown(wait=False, cancel_futures=True)
+
+
+def load_checkpoint(path: str) -> Dict[str, dict]:
+    """
+    Legge i record già scritti in un file di output JSONL
+
+    Args:
+        path: Percorso del file di output di un'elaborazione precedente
+
+    Returns:
+        Dizionario ID -> ultimo record scritto per la query, nell'ordine del file
+        (le righe incomplete vengono ignorate)
+    """
+    written: Dict[str, dict] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                written[str(record["id"])] = record
+    except FileNotFoundError:
+        pass
+    return written
+
+
+def rewrite_checkpoint(path: str, records: Iterable[dict]):
+    """
+    Riscrive il file di output con i soli record indicati, uno per ID
+    Il file viene sostituito in modo atomico: un'interruzione lascia quello precedente
+
+    Args:
+        path: Percorso del file di output
+        records: I record da conservare
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(temporary, path)
+
+
+def read_queries(path: str) -> list:
+    """
+    Legge le query da un file JSONL ("-" per lo standard input)
+
+    Args:
+        path: Percorso del file; ogni riga è una stringa JSON o un oggetto con "query" e "id" opzionale
+
+    Returns:
+        La lista delle query
+    """
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [json.loads(line) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch_file(input_path: str, output_path: str = "-", concurrency: int = 4,
+                   timeout: Optional[float] = None, resume: bool = False, retry_failed: bool = False) -> dict:
+    """
+    Elabora un file JSONL di query scrivendo i risultati in JSONL man mano che sono pronti
+
+    Args:
+        input_path: File JSONL delle query ("-" per lo standard input)
+        output_path: File JSONL dei risultati ("-" per lo standard output)
+        concurrency: Numero massimo di turni contemporanei
+        timeout: Tempo massimo in secondi per singola query
+        resume: Se True salta le query già presenti nel file di output e vi accoda i nuovi risultati
+        retry_failed: Con resume, esegue di nuovo le query con esito diverso da "ok",
+                      sostituendone il record nel file di output
+
+    Returns:
+        Riepilogo con il numero di query per esito, quelle saltate e la durata
+    """
+    items = normalize_items(read_queries(input_path))
+    resume = resume and output_path != "-"
+    written = load_checkpoint(output_path) if resume else {}
+    if retry_failed:
+        written = {query_id: record for query_id, record in written.items() if record.get("status") == "ok"}
+    skip_ids = {item["id"] for item in items if item["id"] in written}
+    if resume:
+        # Un record per ID: toglie i duplicati, le righe incomplete e i record da rifare
+        rewrite_checkpoint(output_path, written.values())
+
+    summary = {"ok": 0, "partial": 0, "timeout": 0, "error": 0, "skipped": len(skip_ids)}
+    start = time.perf_counter()
+
+    out = sys.stdout if output_path == "-" else open(output_path, "a" if resume else "w", encoding="utf-8")
+    try:
+        for record in run_supervisor_batch(items, concurrency=concurrency, timeout=timeout, skip_ids=skip_ids):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # Ogni riga scritta è un checkpoint: la ripresa riparte dalle query mancanti
+            out.flush()
+            summary[record["status"]] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    summary["total_s"] = round(time.perf_counter() - start, 2)
+    logger.info("Batch completato: %s", summary)
+    return summary
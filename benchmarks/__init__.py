@@ -0,0 +1,4 @@
+"""
+Suite di benchmark offline del sistema multiagente
+Usa un chat model finto e servizi HTTP locali al posto di OpenAI e delle API esterne
+"""
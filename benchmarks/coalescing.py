@@ -0,0 +1,130 @@
+"""
+Verifica della coalescenza delle chiamate esterne (single-flight)
+Esegue N turni identici in parallelo contro i servizi simulati e verifica che
+producano le stesse chiamate verso i servizi e l'LLM di un turno singolo.
+La latenza dell'LLM simulato deve superare lo sfasamento tra i turni (che cresce
+con il loro numero), altrimenti un turno in ritardo arriva a chiamata conclusa
+
+Uso:
+    python -m benchmarks.coalescing --parallel 16
+"""
+
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.offline import setup_offline
+
+
+def _clear_http_cache():
+    """Svuota la cache HTTP di Open-Meteo e le cache dei dati, che altrimenti nasconderebbero le chiamate"""
+    from swr_cache import forecast_cache, hourly_forecast_cache, horoscope_cache, geocoding_cache
+
+    if os.path.exists(".cache.sqlite"):
+        os.remove(".cache.sqlite")
+    forecast_cache.clear()
+    hourly_forecast_cache.clear()
+    horoscope_cache.clear()
+    geocoding_cache.clear()
+
+
+def run(parallel: int, query: str, llm_latency_ms: float, service_latency_ms: float) -> dict:
+    """
+    Esegue `parallel` turni identici avviati nello stesso istante
+
+    Args:
+        parallel: Numero di turni concorrenti
+        query: La query ripetuta
+        llm_latency_ms: Latenza simulata per chiamata LLM
+        service_latency_ms: Latenza simulata delle API esterne
+
+    Returns:
+        Dizionario con le chiamate ai servizi simulati e all'LLM (insieme a quelle
+        di un turno singolo di riferimento) e i contatori di coalescenza per gruppo
+    """
+    server = setup_offline(llm_latency_ms, 0.0, service_latency_ms)
+
+    from multiagent import run_supervisor
+    from llm_usage import usage_tracker
+    from singleflight import singleflight_calls
+    from metrics import metrics_registry
+
+    # Riscaldamento (moduli caricati al primo utilizzo, richieste iniziali delle librerie),
+    # poi un turno singolo di riferimento: le chiamate che un turno effettua per ogni servizio
+    run_supervisor(query, session_id="coalescing-warmup")
+    server.requests.clear()
+    usage_tracker.reset()
+    _clear_http_cache()
+    run_supervisor(query, session_id="coalescing-baseline")
+    expected = dict(server.requests)
+    expected_llm_calls = usage_tracker.totals()["calls"]
+    server.requests.clear()
+    usage_tracker.reset()
+    metrics_registry.reset()
+
+    _clear_http_cache()
+    barrier = threading.Barrier(parallel)
+
+    def turn(index: int) -> dict:
+        barrier.wait()
+        return run_supervisor(query, session_id=f"coalescing-{index}")
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(turn, range(parallel)))
+
+    calls = singleflight_calls()
+    coalescing = {
+        group: {
+            "executed": calls.value(group=group, outcome="executed"),
+            "coalesced": calls.value(group=group, outcome="coalesced"),
+        }
+        for group in ("llm", "nominatim", "open_meteo", "horoscope", "wikipedia")
+    }
+
+    server.shutdown()
+    return {
+        "turns": len(results),
+        "answers": len({result["messages"][-1].content for result in results}),
+        "upstream_requests": dict(server.requests),
+        "expected_requests": expected,
+        "llm_calls": usage_tracker.totals()["calls"],
+        "expected_llm_calls": expected_llm_calls,
+        "coalescing": coalescing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica della coalescenza delle chiamate esterne")
+    parser.add_argument("--parallel", type=int, default=16, help="Turni identici concorrenti")
+    parser.add_argument("--query", default="Che tempo fa a Roma oggi?", help="Query ripetuta")
+    parser.add_argument("--llm-latency-ms", type=float, default=None,
+                        help="Latenza fissa per chiamata LLM (default: max(300, 15 ms per turno))")
+    parser.add_argument("--service-latency-ms", type=float, default=50.0, help="Latenza delle API esterne")
+    args = parser.parse_args()
+    llm_latency_ms = args.llm_latency_ms if args.llm_latency_ms is not None else max(300.0, 15.0 * args.parallel)
+
+    summary = run(args.parallel, args.query, llm_latency_ms, args.service_latency_ms)
+    print(json.dumps(summary, indent=2))
+
+    # N turni identici concorrenti devono chiamare i servizi e l'LLM quanto un turno solo
+    duplicated = {
+        name: count for name, count in summary["upstream_requests"].items()
+        if count > summary["expected_requests"].get(name, 0)
+    }
+    if duplicated:
+        raise SystemExit(f"Chiamate duplicate verso i servizi: {duplicated}")
+    if summary["llm_calls"] != summary["expected_llm_calls"]:
+        raise SystemExit(
+            f"Chiamate LLM: {summary['llm_calls']} contro {summary['expected_llm_calls']} di un turno solo "
+            f"(con latenza LLM di {llm_latency_ms:.0f} ms)"
+        )
+    print(
+        f"OK: {summary['turns']} turni identici, le stesse chiamate ai servizi e all'LLM "
+        f"({summary['llm_calls']}) di un turno solo"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Corpus di query per i benchmark
+Raccoglie gli esempi di esempio_conversazione.py e della UI Gradio
+"""
+
+# Esempi della UI Gradio (gradio_ui.py)
+GRADIO_EXAMPLES = [
+    "Che tempo fa a Milano domani?",
+    "Che tempo fa?",
+    "Che tempo fa a Roma, Milano e Napoli domani?",
+    "Pioverà stasera a Bologna?",
+    "Qual è l'oroscopo dell'ariete oggi?",
+    "Oroscopo della settimana",
+    "Oroscopo di ariete, leone e pesci",
+    "Chi era Leonardo da Vinci?",
+    "Cos'è la fotosintesi?",
+    "Quanto fa 23 * 45?",
+    "Converti 100 km in miglia",
+    "Il 20% di 150",
+    "Traduci hello in italiano",
+    "Come si dice buongiorno in francese?",
+    "Ciao! Come stai?",
+    "Grazie mille!",
+]
+
+# Conversazioni a più turni di esempio_conversazione.py
+CONVERSATION_SCRIPTS = [
+    ["Che tempo fa domani?", "Milano"],
+    ["Qual è l'oroscopo di oggi?", "Leone"],
+    ["Che tempo fa a Roma dopodomani?"],
+]
+
+# Query a turno singolo usate dal benchmark: le richieste incomplete sono escluse
+# perché lascerebbero una richiesta in sospeso che altererebbe il turno successivo
+QUERY_CORPUS = [
+    query for query in GRADIO_EXAMPLES
+    if query not in ("Che tempo fa?", "Oroscopo della settimana")
+] + [
+    "Che tempo fa a Roma dopodomani?",
+    "Dimmi qualcosa sulla Torre di Pisa",
+    "Oroscopo del leone della settimana",
+    "Risolvi 2x + 5 = 13",
+    "Traduci in inglese: dove si trova la stazione",
+    # Query multipla: meteo e oroscopo eseguiti in parallelo
+    "Che tempo fa a Roma domani e qual è l'oroscopo del leone?",
+]
+
+# Conversazioni per il test di carico: mescolano turni singoli e richieste
+# in sospeso completate al turno successivo
+LOAD_SCRIPTS = CONVERSATION_SCRIPTS + [
+    ["Che tempo fa?", "Napoli"],
+    ["Oroscopo della settimana", "Toro"],
+    ["Ciao! Come stai?", "Quanto fa 23 * 45?", "Grazie mille!"],
+    ["Chi era Leonardo da Vinci?", "Traduci in inglese: dove si trova la stazione"],
+    ["Che tempo fa a Firenze domani?", "Il 20% di 150"],
+    ["Qual è l'oroscopo dell'ariete oggi?", "Converti 100 km in miglia"],
+]
+
+# Query dell'oroscopo con gli slot attesi: (query, segno o None, periodo)
+HOROSCOPE_SLOT_CORPUS = [
+    ("Qual è l'oroscopo dell'ariete oggi?", "ariete", "daily"),
+    ("Oroscopo del leone della settimana", "leone", "weekly"),
+    ("Oroscopo per i gemelli", "gemelli", "daily"),
+    ("Che dice l'oroscopo settimanale del toro?", "toro", "weekly"),
+    ("Oroscopo mensile della bilancia", "bilancia", "monthly"),
+    ("Com'è il mese per lo scorpione?", "scorpione", "monthly"),
+    ("Oroscopo del Sagittario per questo mese", "sagittario", "monthly"),
+    ("Cosa dicono le stelle ai pesci domani?", "pesci", "daily"),
+    ("Sono del cancro, com'è la mia giornata oggi?", "cancro", "daily"),
+    ("Oroscopo della Vergine", "vergine", "daily"),
+    ("Oroscopo del capricorno dell'anno", "capricorno", "monthly"),
+    ("Previsioni annuali per l'acquario", "acquario", "monthly"),
+    ("Oroscopo dell'aquario di oggi", "acquario", "daily"),
+    ("Oroscopo del gemello per la settimana", "gemelli", "weekly"),
+    ("Cosa aspetta gli arieti questa settimana?", "ariete", "weekly"),
+    ("Per i leoni com'è il mese?", "leone", "monthly"),
+    ("Oroscopo giornaliero dello scorpione", "scorpione", "daily"),
+    ("Oroscopo quotidiano del toro", "toro", "daily"),
+    ("ORACOLO DEL LEONE: SETTIMANA", "leone", "weekly"),
+    ("oroscopo bilancia", "bilancia", "daily"),
+    ("Oroscopo settimanale per il segno dei Pesci", "pesci", "weekly"),
+    ("Oggi vorrei l'oroscopo settimanale del cancro", "cancro", "weekly"),
+    ("Horoscope for leo", "leone", "daily"),
+    ("Oroscopo della settimana", None, "weekly"),
+    ("Qual è l'oroscopo di oggi?", None, "daily"),
+    ("Oroscopo del mese", None, "monthly"),
+    ("Oroscopo dell'arite oggi", "ariete", "daily"),
+    ("Oroscopo del sagitario della settimana", "sagittario", "weekly"),
+]
+
+# Richieste tipiche all'agente traduttore: (testo, lingua di origine o "auto", lingua di destinazione)
+TRANSLATION_TRAFFIC = [
+    ("hello", "inglese", "italiano"),
+    ("buongiorno", "italiano", "francese"),
+    ("grazie", "italiano", "inglese"),
+    ("thank you", "auto", "italiano"),
+    ("Grazie mille!", "italiano", "spagnolo"),
+    ("buonanotte", "italiano", "tedesco"),
+    ("per favore", "italiano", "inglese"),
+    ("merci", "auto", "italiano"),
+    ("ti amo", "italiano", "francese"),
+    ("arrivederci", "italiano", "spagnolo"),
+    ("Danke", "tedesco", "italiano"),
+    ("quanto costa", "italiano", "inglese"),
+    ("buon compleanno", "italiano", "tedesco"),
+    ("gracias", "auto", "italiano"),
+    ("il conto", "italiano", "francese"),
+    ("birra", "italiano", "tedesco"),
+    ("stazione", "italiano", "inglese"),
+    ("good luck", "inglese", "italiano"),
+    ("ciao", "italiano", "giapponese"),
+    ("buongiorno", "italiano", "portoghese"),
+    ("dove si trova la stazione", "italiano", "inglese"),
+    ("il ristorante è chiuso", "italiano", "spagnolo"),
+    ("mi chiamo Paolo e vengo da Roma", "italiano", "inglese"),
+    ("where is the nearest pharmacy?", "auto", "italiano"),
+    ("serendipity", "inglese", "italiano"),
+]
@@ -0,0 +1,97 @@
+"""
+Verifica del comportamento con budget di latenza per turno stretti
+Esegue turni con una scadenza più breve della latenza dell'LLM e verifica che
+i timeout dovuti al budget del turno non aprano il circuit breaker del provider,
+mentre i timeout che raggiungono il limite per chiamata continuano a contare,
+e che la risposta parziale non sia il messaggio di errore di un nodo
+
+Uso:
+    python -m benchmarks.deadlines --llm-latency-ms 400 --deadline-s 0.6
+"""
+
+import argparse
+import json
+
+from benchmarks.offline import setup_offline
+
+
+def run(turns: int, llm_latency_ms: float, deadline_s: float, query: str) -> dict:
+    """
+    Esegue `turns` turni con scadenza stretta, poi un turno senza scadenza
+
+    Args:
+        turns: Turni con scadenza stretta
+        llm_latency_ms: Latenza simulata di ogni chiamata LLM
+        deadline_s: Budget di latenza dei turni stretti
+        query: La query ripetuta
+
+    Returns:
+        Il riepilogo: turni degradati, risposte parziali con il messaggio di errore di un nodo,
+        stato del circuito OpenAI dopo i turni stretti, risposta del turno successivo e stato
+        del circuito con timeout sul limite per chiamata
+    """
+    server = setup_offline(llm_latency_ms=llm_latency_ms)
+
+    import llm_usage
+    from multiagent import run_supervisor, ERROR_PREFIXES
+    from circuit_breaker import get_breaker, breaker_events
+
+    breaker = get_breaker("openai")
+    results = [
+        run_supervisor(query, session_id=f"deadline-{index}", deadline_s=deadline_s)
+        for index in range(turns)
+    ]
+    state_after_budget = breaker.state
+    error_answers = [
+        answer for answer in (result["messages"][-1].content for result in results)
+        if answer.lower().startswith(ERROR_PREFIXES) or "api key" in answer.lower()
+    ]
+    healthy = run_supervisor(query, session_id="deadline-healthy", deadline_s=60)
+
+    # Un limite per chiamata più breve della latenza: il provider è davvero lento
+    llm_usage.LLM_TIMEOUT_S = llm_latency_ms / 1000 / 2
+    for index in range(breaker.minimum_calls):
+        run_supervisor(f"{query} ({index})", session_id=f"deadline-cap-{index}", deadline_s=60)
+    state_after_cap = breaker.state
+
+    server.shutdown()
+    return {
+        "turns": turns,
+        "degraded": sum(result["deadline_exceeded"] for result in results),
+        "error_answers": error_answers,
+        "breaker_after_budget_timeouts": state_after_budget,
+        "healthy_answer": healthy["messages"][-1].content,
+        "breaker_after_cap_timeouts": state_after_cap,
+        "breaker_opened": breaker_events().value(upstream="openai", event="opened"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica dei turni con budget di latenza stretto")
+    parser.add_argument("--turns", type=int, default=10, help="Turni con scadenza stretta")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0, help="Latenza fissa per chiamata LLM")
+    parser.add_argument("--deadline-s", type=float, default=0.6, help="Budget di latenza dei turni stretti")
+    parser.add_argument("--query", default="Che tempo fa a Roma oggi?", help="Query ripetuta")
+    args = parser.parse_args()
+
+    summary = run(args.turns, args.llm_latency_ms, args.deadline_s, args.query)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+    if not summary["degraded"]:
+        raise SystemExit("Nessun turno ha esaurito il budget: aumenta --llm-latency-ms o riduci --deadline-s")
+    if summary["error_answers"]:
+        raise SystemExit(f"Risposte parziali con il messaggio di errore di un nodo: {summary['error_answers'][:3]}")
+    if summary["breaker_after_budget_timeouts"] != "closed":
+        raise SystemExit("I timeout dovuti al budget del turno hanno aperto il circuito OpenAI")
+    if "non disponibile" in summary["healthy_answer"]:
+        raise SystemExit(f"Turno senza scadenza rifiutato: {summary['healthy_answer']}")
+    if summary["breaker_after_cap_timeouts"] != "open":
+        raise SystemExit("I timeout sul limite per chiamata non hanno aperto il circuito OpenAI")
+    print(
+        f"OK: {summary['degraded']}/{summary['turns']} turni oltre il budget senza aprire il circuito OpenAI, "
+        f"aperto solo dai timeout sul limite per chiamata"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Chat model finto e deterministico per i benchmark offline
+Riconosce i prompt di routing, estrazione e risposta degli agenti e restituisce JSON o testo preconfezionati
+"""
+
+import re
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+ZODIAC_SIGNS = [
+    "ariete", "toro", "gemelli", "cancro", "leone", "vergine",
+    "bilancia", "scorpione", "sagittario", "capricorno", "acquario", "pesci"
+]
+
+LANGUAGES = [
+    "italiano", "inglese", "francese", "spagnolo", "tedesco", "portoghese",
+    "russo", "cinese", "giapponese", "olandese", "greco"
+]
+
+# Fasce del giorno riconosciute nelle query meteo (le forme composte prima)
+TIMES_OF_DAY = (
+    ("stamattina", "mattina"), ("mattina", "mattina"), ("pomeriggio", "pomeriggio"),
+    ("stasera", "sera"), ("sera", "sera"), ("stanotte", "notte"), ("notte", "notte"),
+)
+
+WEATHER_WORDS = ("tempo fa", "meteo", "piove", "pioverà", "pioggia", "temperatura", "neve", "vento", "sole")
+WIKIPEDIA_WORDS = ("chi era", "chi è", "cos'è", "cosa è", "dimmi qualcosa", "quando è", "storia di")
+CALCULATOR_WORDS = ("quanto fa", "calcola", "converti", "risolvi", "%")
+TRANSLATOR_WORDS = ("traduci", "come si dice", "che significa")
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima grossolana del numero di token (circa 4 caratteri per token)"""
+    return max(1, len(text) // 4)
+
+
+def classify_query(query: str) -> str:
+    """Sceglie l'agente per una query con regole a parole chiave"""
+    q = query.lower()
+    if any(word in q for word in TRANSLATOR_WORDS):
+        return "TRANSLATOR"
+    if any(word in q for word in CALCULATOR_WORDS) or re.search(r"\d\s*[-+*/x^]\s*\d", q):
+        return "CALCULATOR"
+    if "oroscopo" in q or any(sign in q for sign in ZODIAC_SIGNS):
+        return "HOROSCOPE"
+    if any(word in q for word in WEATHER_WORDS):
+        return "WEATHER"
+    if any(word in q for word in WIKIPEDIA_WORDS):
+        return "WIKIPEDIA"
+    return "GENERAL"
+
+
+def split_intents(query: str) -> list:
+    """Divide una query multipla sulle congiunzioni " e " tra richieste di agenti diversi"""
+    parts = [part.strip(" ?,") for part in re.split(r"\s+e\s+", query)]
+    intents = [{"agent": classify_query(part), "query": part + "?"} for part in parts if part]
+    agents = {intent["agent"] for intent in intents}
+    return intents if len(agents) > 1 and "GENERAL" not in agents else []
+
+
+def _field(prompt: str, label: str) -> str:
+    """Estrae il valore di una riga 'Etichetta: valore' dal prompt"""
+    match = re.search(rf"^{label}:\s*(.*)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+
+def _block(prompt: str, label: str, end: str) -> str:
+    """Estrae un valore su più righe (es. un testo lungo da tradurre) tra 'Etichetta:' e il marcatore end"""
+    match = re.search(rf"^{label}:\s*(.*?){re.escape(end)}", prompt, re.MULTILINE | re.DOTALL)
+    return match.group(1).strip() if match else _field(prompt, label)
+
+
+def extract_weather(query: str) -> dict:
+    """Slot dell'agente meteo"""
+    # Una o più città: "a Roma", "a Roma, Milano e Napoli"
+    city = r"[A-ZÀ-Ú][\wà-ú']+"
+    match = re.search(rf"\b(?:a|di|per)\s+({city}(?:\s*(?:,|\se)\s*{city})*)", query)
+    cities = re.split(r"\s*,\s*|\s+e\s+", match.group(1)) if match else []
+    q = query.lower()
+    if "dopodomani" in q:
+        days, description = 2, "dopodomani"
+    elif "domani" in q:
+        days, description = 1, "domani"
+    else:
+        days, description = 0, "oggi"
+    time_of_day = next((name for word, name in TIMES_OF_DAY if word in q), None)
+    hours = re.search(r"tra (\d+) or[ae]", q)
+    return {
+        "location": cities[0] if cities else "NESSUNA",
+        "locations": cities,
+        "days_offset": days,
+        "time_of_day": time_of_day,
+        "hours_ahead": int(hours.group(1)) if hours else None,
+        "time_description": description,
+        "validity": "VALIDO"
+    }
+
+
+def extract_horoscope(query: str) -> dict:
+    """Slot dell'agente oroscopo"""
+    q = query.lower()
+    # Tutti i segni citati, nell'ordine in cui compaiono
+    signs = sorted((s for s in ZODIAC_SIGNS if s in q), key=q.index)
+    sign = signs[0] if signs else "NESSUNO"
+    if "settiman" in q:
+        period, description = "weekly", "della settimana"
+    elif "mese" in q or "mensile" in q or "anno" in q:
+        period, description = "monthly", "del mese"
+    else:
+        period, description = "daily", "di oggi"
+    return {"zodiac_sign": sign, "zodiac_signs": signs, "time_period": period, "time_description": description, "validity": "VALIDO"}
+
+
+def extract_calculation(query: str) -> dict:
+    """Slot dell'agente calcolatore"""
+    q = query.lower()
+    units = {"km": "km", "miglia": "mi", "metri": "m", "piedi": "ft", "kg": "kg", "libbre": "lb",
+             "celsius": "c", "fahrenheit": "f", "litri": "l", "galloni": "gal"}
+
+    conversion = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:gradi\s+)?(\w+)\s+in\s+(\w+)", q)
+    if "convert" in q or (conversion and conversion.group(2) in units and conversion.group(3) in units):
+        if conversion:
+            value, src, dst = conversion.groups()
+            expression = f"{value} {units.get(src, src)} to {units.get(dst, dst)}"
+            return {"type": "CONVERSION", "expression": expression, "description": "conversione", "valid": True}
+
+    percentage = re.search(r"(\d+(?:[.,]\d+)?)\s*%\s*di\s*(\d+(?:[.,]\d+)?)", q)
+    if percentage:
+        pct, base = percentage.groups()
+        return {"type": "PERCENTAGE", "expression": f"{base} * {float(pct) / 100}",
+                "description": "percentuale", "valid": True}
+
+    if "risolvi" in q or "=" in q:
+        equation = q.split("risolvi")[-1].replace(" ", "")
+        left, _, right = equation.partition("=")
+        left = re.sub(r"(\d)x", r"\1*x", left)
+        return {"type": "EQUATION", "expression": f"{left}-({right or 0})", "description": "equazione", "valid": True}
+
+    expression = "".join(re.findall(r"[\d+\-*/().^ ]+", q)).strip()
+    return {"type": "ARITHMETIC", "expression": expression, "description": "calcolo aritmetico",
+            "valid": bool(expression)}
+
+
+def extract_translation(query: str) -> dict:
+    """Slot dell'agente traduttore"""
+    q = query.strip().rstrip("?")
+    patterns = [
+        r"traduci in (\w+)\s*:\s*(.+)",
+        r"traduci (?:questa frase )?in (\w+)\s*:\s*(.+)",
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, q, re.IGNORECASE | re.DOTALL)
+        if match:
+            return {"text": match.group(2), "source_lang": "italiano", "target_lang": match.group(1).lower(), "valid": True}
+
+    match = re.search(r"(?:traduci|come si dice)\s+(.+?)\s+in\s+(\w+)$", q, re.IGNORECASE)
+    if match:
+        text, target = match.groups()
+        source = "inglese" if target.lower() == "italiano" else "italiano"
+        return {"text": text, "source_lang": source, "target_lang": target.lower(), "valid": True}
+
+    match = re.search(r"che significa\s+(.+)$", q, re.IGNORECASE)
+    if match:
+        return {"text": match.group(1), "source_lang": "auto", "target_lang": "italiano", "valid": True}
+
+    return {"text": "", "source_lang": "auto", "target_lang": "", "valid": False}
+
+
+def extract_search_terms(query: str) -> str:
+    """Termini di ricerca per Wikipedia"""
+    q = query.strip().rstrip("?")
+    q = re.sub(r"^(chi era|chi è|cos'è|cosa è|dimmi qualcosa (sulla|sul|su)|quando è stata)\s+", "", q, flags=re.IGNORECASE)
+    q = re.sub(r"^(la|il|lo|l')\s*", "", q, flags=re.IGNORECASE)
+    return q[:1].upper() + q[1:]
+
+
+# Estrattori usati anche per il routing combinato
+SLOT_EXTRACTORS = {
+    "WEATHER": extract_weather,
+    "HOROSCOPE": extract_horoscope,
+    "CALCULATOR": extract_calculation,
+    "TRANSLATOR": extract_translation,
+}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model deterministico che imita le risposte di OpenAI per i prompt del sistema
+    La latenza simulata è base_latency_ms + per_token_ms * token_generati
+    """
+
+    model_name: str = "fake-gpt-3.5-turbo"
+    temperature: float = 0.0
+    base_latency_ms: float = 0.0
+    per_token_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def respond(self, system: str, prompt: str) -> str:
+        """Costruisce la risposta per la coppia (messaggio di sistema, prompt)"""
+        if "supervisore" in system:
+            query = _block(prompt, "Query utente", "\n\nRispondi in JSON")
+            agent = classify_query(query)
+            decision = {"agent": agent, "confidence": 0.9, "reason": f"richiesta di tipo {agent.lower()}"}
+            intents = split_intents(query) if '"intents"' in prompt else []
+            if intents:
+                decision["agent"] = intents[0]["agent"]
+                decision["intents"] = intents
+                decision["reason"] = "richieste multiple"
+            # Routing combinato: il prompt chiede anche gli slot dell'agente
+            if '"slots"' in prompt:
+                extractor = SLOT_EXTRACTORS.get(agent)
+                decision["slots"] = extractor(query) if extractor else None
+            return json.dumps(decision)
+
+        query = _field(prompt, "Query") or _field(prompt, "Domanda utente")
+
+        if "città e date" in system:
+            return json.dumps(extract_weather(query))
+        if "segni zodiacali" in system:
+            return json.dumps(extract_horoscope(query))
+        if "espressioni matematiche" in system:
+            return json.dumps(extract_calculation(query))
+        if "richieste di traduzione" in system:
+            return json.dumps(extract_translation(_block(prompt, "Query", "\n\nIdentifica:")))
+        if "termini di ricerca" in system:
+            return extract_search_terms(query)
+        if "specializzato in oroscopi" in system:
+            translation = "Oggi potresti sentire una forte spinta verso nuovi inizi. Fidati del tuo istinto."
+            # Più oroscopi in una chiamata: una sezione per intestazione [[SEGNO]]
+            sections = re.findall(r"^\[\[[A-Z]+\]\]$", prompt, re.MULTILINE)
+            if sections:
+                return "\n".join(f"{section}\n{translation}" for section in sections)
+            return translation
+        if "terminologo" in system:
+            # Glossario dei testi lunghi: i termini restano invariati (come i nomi propri)
+            terms = prompt.split("Termini:", 1)[-1].split("Rispondi in JSON", 1)[0].split("\n")
+            return json.dumps({term.strip(): term.strip() for term in terms if term.strip()})
+        if "traduttore professionale" in system:
+            text = prompt.split("Testo da tradurre:", 1)[-1].split("Fornisci SOLO", 1)[0].strip()
+            return f"[{text}]"
+        if "contenuti enciclopedici" in system:
+            return "Secondo le informazioni disponibili, si tratta di un argomento di grande rilievo storico e culturale."
+        return "Ciao! Sono qui per aiutarti, dimmi pure."
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        system = " ".join(m.content for m in messages if m.type == "system")
+        prompt = "\n".join(m.content for m in messages if m.type != "system")
+
+        content = self.respond(system, prompt)
+        input_tokens = estimate_tokens(system + prompt)
+        output_tokens = estimate_tokens(content)
+
+        delay_ms = self.base_latency_ms + self.per_token_ms * output_tokens
+        # Come il client OpenAI, rispetta il timeout passato a invoke
+        timeout = kwargs.get("timeout")
+        if timeout is not None and delay_ms / 1000 > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Request timed out.")
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            },
+            response_metadata={"model_name": self.model_name}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
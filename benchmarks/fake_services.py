@@ -0,0 +1,256 @@
+"""
+Server HTTP locale che sostituisce le API esterne durante i benchmark
+Riproduce le risposte registrate in fixtures/recorded_responses.json per
+Nominatim, Open-Meteo (formato flatbuffers), Horoscope API e Wikipedia
+"""
+
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import flatbuffers
+
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures" / "recorded_responses.json"
+
+# Prefissi di percorso dei servizi simulati
+NOMINATIM_PATH = "/nominatim/search"
+OPEN_METEO_PATH = "/open-meteo/v1/forecast"
+HOROSCOPE_PATH = "/horoscope/api/v1/get-horoscope"
+WIKIPEDIA_PATH = "/wikipedia/w/api.php"
+
+
+def load_fixtures() -> dict:
+    """Carica le risposte registrate"""
+    with open(FIXTURES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _float_vector(builder: flatbuffers.Builder, values: list) -> int:
+    """Serializza un vettore di float32"""
+    builder.StartVector(4, len(values), 4)
+    for value in reversed(values):
+        builder.PrependFloat32(float(value))
+    return builder.EndVector()
+
+
+def _variables_with_time(builder: flatbuffers.Builder, series: list, start: int, interval: int) -> int:
+    """Serializza una tabella VariablesWithTime con le serie indicate"""
+    variable_offsets = []
+    for values in series:
+        values_vector = _float_vector(builder, values)
+        builder.StartObject(13)
+        builder.PrependUOffsetTRelativeSlot(3, values_vector, 0)
+        variable_offsets.append(builder.EndObject())
+
+    builder.StartVector(4, len(variable_offsets), 4)
+    for offset in reversed(variable_offsets):
+        builder.PrependUOffsetTRelative(offset)
+    variables_vector = builder.EndVector()
+
+    length = len(series[0]) if series else 0
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + length * interval, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables_vector, 0)
+    return builder.EndObject()
+
+
+def build_open_meteo_message(latitude: float, longitude: float, daily: list, hourly: list,
+                             utc_offset: int, forecast_days: int) -> bytes:
+    """
+    Costruisce un messaggio WeatherApiResponse con prefisso di lunghezza, come l'API reale
+
+    Args:
+        latitude: Latitudine della località
+        longitude: Longitudine della località
+        daily: Serie giornaliere richieste (una lista di valori per variabile)
+        hourly: Serie orarie richieste
+        utc_offset: Offset del fuso orario in secondi
+        forecast_days: Numero di giorni di previsione
+
+    Returns:
+        I byte del messaggio
+    """
+    builder = flatbuffers.Builder(1024)
+    midnight = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+    daily_offset = _variables_with_time(builder, daily, midnight, 86400) if daily else None
+    hourly_offset = _variables_with_time(builder, hourly, midnight, 3600) if hourly else None
+
+    builder.StartObject(16)
+    builder.PrependFloat32Slot(0, latitude, 0)
+    builder.PrependFloat32Slot(1, longitude, 0)
+    builder.PrependInt32Slot(6, utc_offset, 0)
+    if daily_offset is not None:
+        builder.PrependUOffsetTRelativeSlot(10, daily_offset, 0)
+    if hourly_offset is not None:
+        builder.PrependUOffsetTRelativeSlot(11, hourly_offset, 0)
+    builder.Finish(builder.EndObject())
+
+    data = bytes(builder.Output())
+    return len(data).to_bytes(4, byteorder="little") + data
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    """Handler che instrada le richieste verso i servizi simulati"""
+
+    protocol_version = "HTTP/1.1"
+    # Header e corpo sono scritti separatamente: senza TCP_NODELAY, sulle connessioni
+    # keep-alive l'algoritmo di Nagle e l'ACK ritardato aggiungono ~40 ms per risposta
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server: "FakeServicesServer" = self.server
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+
+        if server.latency_s:
+            time.sleep(server.latency_s)
+
+        if parsed.path.startswith(NOMINATIM_PATH):
+            server.count("nominatim")
+            self._nominatim(params)
+        elif parsed.path.startswith(OPEN_METEO_PATH):
+            server.count("open_meteo")
+            self._open_meteo(params)
+        elif parsed.path.startswith(HOROSCOPE_PATH):
+            server.count("horoscope")
+            self._horoscope(parsed.path, params)
+        elif parsed.path.startswith(WIKIPEDIA_PATH):
+            server.count("wikipedia")
+            self._wikipedia(params)
+        else:
+            self._send_json({"error": "percorso sconosciuto"}, status=404)
+
+    def _send(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Il client ha già rinunciato (timeout ricavato dalla scadenza del turno)
+            pass
+
+    def _send_json(self, payload, status: int = 200):
+        self._send(json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", status)
+
+    def _nominatim(self, params: dict):
+        query = params.get("q", [""])[0]
+        city = query.split(",")[0].strip().lower()
+        self._send_json(self.server.fixtures["nominatim"].get(city, []))
+
+    def _open_meteo(self, params: dict):
+        fixture = self.server.fixtures["open_meteo"]
+        latitudes = [float(v) for v in ",".join(params.get("latitude", [])).split(",") if v]
+        longitudes = [float(v) for v in ",".join(params.get("longitude", [])).split(",") if v]
+        forecast_days = int(params.get("forecast_days", ["7"])[0])
+
+        daily = [fixture["daily"][name][:forecast_days] for name in params.get("daily", [])]
+        hourly = [
+            (fixture["hourly"][name] * forecast_days)[:24 * forecast_days]
+            for name in params.get("hourly", [])
+        ]
+
+        body = b"".join(
+            build_open_meteo_message(lat, lon, daily, hourly, fixture["utc_offset_seconds"], forecast_days)
+            for lat, lon in zip(latitudes, longitudes)
+        )
+        self._send(body, "application/octet-stream")
+
+    def _horoscope(self, path: str, params: dict):
+        period = path.rstrip("/").split("/")[-1]
+        text = self.server.fixtures["horoscope"].get(period)
+        if text is None:
+            self._send_json({"success": False, "status": 404}, status=404)
+            return
+        sign = params.get("sign", [""])[0]
+        self._send_json({
+            "data": {"date": datetime.now().strftime("%b %d, %Y"), "horoscope_data": f"{sign.capitalize()}: {text}"},
+            "status": 200,
+            "success": True
+        })
+
+    def _wikipedia(self, params: dict):
+        fixture = self.server.fixtures["wikipedia"]
+        pages = fixture["pages"]
+        titles = list(pages)
+
+        if params.get("list", [""])[0] == "search":
+            term = params.get("srsearch", [""])[0].strip().lower()
+            title = fixture["aliases"].get(term) or next((t for t in titles if term and term in t.lower()), None)
+            results = [{"title": title}] if title else []
+            self._send_json({"query": {"search": results}})
+            return
+
+        title = params.get("titles", [""])[0]
+        if title not in pages:
+            self._send_json({"query": {"pages": {"-1": {"title": title, "missing": ""}}}})
+            return
+
+        page_id = str(titles.index(title) + 1)
+        prop = params.get("prop", [""])[0]
+        page = {"pageid": int(page_id), "title": title, "fullurl": f"https://it.wikipedia.org/wiki/{title}"}
+        if "extracts" in prop:
+            page["extract"] = pages[title]
+            page["revisions"] = [{"revid": 1, "parentid": 0}]
+        self._send_json({"query": {"pages": {page_id: page}}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServicesServer(ThreadingHTTPServer):
+    """Server HTTP con i servizi simulati e i contatori delle richieste ricevute"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency_s: float = 0.0):
+        super().__init__(address, FakeServicesHandler)
+        self.fixtures = load_fixtures()
+        self.latency_s = latency_s
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, service: str):
+        with self._lock:
+            self.requests[service] += 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def endpoints(self) -> dict:
+        """URL da usare al posto dei servizi reali"""
+        return {
+            "NOMINATIM_URL": self.base_url + NOMINATIM_PATH,
+            "OPEN_METEO_URL": self.base_url + OPEN_METEO_PATH,
+            "HOROSCOPE_API_URL": self.base_url + HOROSCOPE_PATH,
+            "WIKIPEDIA_API_URL": self.base_url + WIKIPEDIA_PATH,
+        }
+
+
+def start_fake_services(port: int = 0, latency_ms: float = 0.0) -> FakeServicesServer:
+    """
+    Avvia il server dei servizi simulati in un thread daemon
+
+    Args:
+        port: Porta di ascolto (0 = porta libera scelta dal sistema)
+        latency_ms: Latenza artificiale aggiunta a ogni risposta
+
+    Returns:
+        Il server avviato
+    """
+    server = FakeServicesServer(("127.0.0.1", port), latency_s=latency_ms / 1000)
+    thread = threading.Thread(target=server.serve_forever, name="fake-services", daemon=True)
+    thread.start()
+    return server
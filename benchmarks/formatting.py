@@ -0,0 +1,177 @@
+"""
+Micro-benchmark della formattazione delle risposte dell'agente meteo
+Confronta, per un giorno, per il confronto tra località e per più giorni, la
+formattazione precedente (tabella dei codici e etichetta del giorno ricostruite
+a ogni chiamata, concatenazione di stringhe, un valore numpy alla volta) con
+le tabelle e i modelli precompilati di weather_formatting
+
+Uso:
+    python -m benchmarks.formatting --repeat 5 --number 2000
+"""
+
+import argparse
+import json
+import timeit
+
+import numpy as np
+
+from weather_formatting import (
+    describe_weathercode, day_label, format_day, daily_report, forecast_rows, comparison_report
+)
+
+
+DAYS = 8
+
+
+def sample_forecast(seed: int) -> dict:
+    """Previsioni giornaliere sintetiche (float32, come le restituisce Open-Meteo)"""
+    rng = np.random.default_rng(seed)
+    return {
+        "temperature_2m_max": rng.uniform(15, 30, DAYS).astype(np.float32),
+        "temperature_2m_min": rng.uniform(0, 15, DAYS).astype(np.float32),
+        "precipitation_sum": rng.uniform(0, 10, DAYS).astype(np.float32),
+        "precipitation_probability_max": rng.uniform(0, 100, DAYS).astype(np.float32),
+        "windspeed_10m_max": rng.uniform(0, 40, DAYS).astype(np.float32),
+        "weathercode": rng.choice([0, 1, 2, 3, 61, 80, 95], DAYS).astype(np.float32),
+    }
+
+
+def legacy_daily(forecast: dict, location: str, days_offset: int) -> str:
+    """La formattazione di fetch_weather prima delle tabelle precompilate"""
+    weather_descriptions = {
+        0: "Cielo sereno", 1: "Prevalentemente sereno", 2: "Parzialmente nuvoloso", 3: "Nuvoloso",
+        45: "Nebbia", 48: "Nebbia con brina", 51: "Pioviggine leggera", 53: "Pioviggine moderata",
+        55: "Pioviggine intensa", 61: "Pioggia leggera", 63: "Pioggia moderata", 65: "Pioggia forte",
+        71: "Neve leggera", 73: "Neve moderata", 75: "Neve intensa", 80: "Rovesci leggeri",
+        81: "Rovesci moderati", 82: "Rovesci violenti", 95: "Temporale",
+        96: "Temporale con grandine leggera", 99: "Temporale con grandine"
+    }
+    weathercode = int(forecast["weathercode"][days_offset])
+    condition = weather_descriptions.get(weathercode, f"Codice {weathercode}")
+    if days_offset == 0:
+        time_label = "oggi"
+    elif days_offset == 1:
+        time_label = "domani"
+    elif days_offset == 2:
+        time_label = "dopodomani"
+    else:
+        time_label = f"tra {days_offset} giorni"
+    weather_data = {
+        "temperature_max": f"{forecast['temperature_2m_max'][days_offset]:.1f}°C",
+        "temperature_min": f"{forecast['temperature_2m_min'][days_offset]:.1f}°C",
+        "precipitation": f"{forecast['precipitation_sum'][days_offset]:.1f} mm",
+        "precipitation_probability": f"{forecast['precipitation_probability_max'][days_offset]:.0f}%",
+        "windspeed": f"{forecast['windspeed_10m_max'][days_offset]:.1f} km/h",
+    }
+    response_text = ""
+    response_text += f"METEO A {location.upper()}\n"
+    response_text += f"{time_label.capitalize()} (20/10/2026)\n"
+    response_text += f"Coordinate: {41.8933:.4f}°N, {12.4829:.4f}°E\n\n"
+    response_text += f"Condizione: {condition}\n"
+    response_text += f"Temperatura: Min {weather_data['temperature_min']} / Max {weather_data['temperature_max']}\n"
+    response_text += f"Precipitazioni: {weather_data['precipitation']} (probabilità {weather_data['precipitation_probability']})\n"
+    response_text += f"Vento: {weather_data['windspeed']}\n"
+    response_text += f"\nFonte: Open-Meteo API\n"
+    return response_text
+
+
+def current_daily(forecast: dict, location: str, days_offset: int) -> str:
+    """La formattazione attuale di fetch_weather"""
+    return daily_report(
+        location, day_label(days_offset), "20/10/2026", 41.8933, 12.4829,
+        describe_weathercode(int(forecast["weathercode"][days_offset])), format_day(forecast, days_offset)
+    )
+
+
+def legacy_rows(day: dict, labels: list) -> str:
+    """Righe (località o giorni) formattate un valore numpy alla volta, per concatenazione"""
+    text = ""
+    for i, label in enumerate(labels):
+        weathercode = int(day["weathercode"][i])
+        text += (
+            f"{label}: {describe_weathercode(weathercode)}, Min {day['temperature_2m_min'][i]:.1f}°C / "
+            f"Max {day['temperature_2m_max'][i]:.1f}°C, precipitazioni {day['precipitation_sum'][i]:.1f} mm "
+            f"(probabilità {day['precipitation_probability_max'][i]:.0f}%), vento {day['windspeed_10m_max'][i]:.1f} km/h\n"
+        )
+    return text
+
+
+def current_rows(day: dict, labels: list) -> str:
+    """Righe formattate per colonna con i modelli precompilati"""
+    return forecast_rows(labels, day)
+
+
+def current_comparison(day: dict, labels: list) -> str:
+    """La risposta completa del confronto tra località"""
+    extremes = {
+        "warmest": int(np.argmax(day["temperature_2m_max"])),
+        "coldest": int(np.argmin(day["temperature_2m_min"])),
+        "wettest": int(np.argmax(day["precipitation_probability_max"])),
+    }
+    return comparison_report(labels, "domani", "20/10/2026", day, extremes, [])
+
+
+def _best_us(fn, repeat: int, number: int) -> float:
+    """Miglior tempo per chiamata in microsecondi"""
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number * 1e6
+
+
+def run(repeat: int, number: int) -> dict:
+    """
+    Misura le formattazioni precedente e attuale per ogni caso
+
+    Args:
+        repeat: Ripetizioni (si tiene la migliore)
+        number: Chiamate per ripetizione
+
+    Returns:
+        Dizionario caso -> microsecondi per chiamata e accelerazione
+    """
+    forecasts = [sample_forecast(seed) for seed in range(5)]
+    cities = ["Roma", "Milano", "Napoli", "Torino", "Firenze"]
+
+    def locations_day(count: int) -> dict:
+        return {name: np.stack([f[name] for f in forecasts[:count]])[:, 1] for name in forecasts[0]}
+
+    week = forecasts[0]
+    week_labels = [day_label(days) for days in range(DAYS)]
+    three, five = locations_day(3), locations_day(5)
+
+    # Stesso testo prima e dopo, altrimenti il confronto non avrebbe senso
+    assert legacy_daily(week, "Roma", 1) == current_daily(week, "Roma", 1)
+    assert legacy_rows(five, cities) == current_rows(five, cities)
+
+    cases = {
+        "giorno singolo": (lambda: legacy_daily(week, "Roma", 1), lambda: current_daily(week, "Roma", 1)),
+        "3 località (righe)": (lambda: legacy_rows(three, cities[:3]), lambda: current_rows(three, cities[:3])),
+        "5 località (righe)": (lambda: legacy_rows(five, cities), lambda: current_rows(five, cities)),
+        "8 giorni (righe)": (lambda: legacy_rows(week, week_labels), lambda: current_rows(week, week_labels)),
+    }
+    results = {}
+    for case, (legacy, current) in cases.items():
+        before = _best_us(legacy, repeat, number)
+        after = _best_us(current, repeat, number)
+        results[case] = {"precedente_us": round(before, 2), "attuale_us": round(after, 2),
+                         "accelerazione": round(before / after, 2)}
+    results["confronto completo 5 località"] = {
+        "attuale_us": round(_best_us(lambda: current_comparison(five, cities), repeat, number), 2)
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark della formattazione meteo")
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni (si tiene la migliore)")
+    parser.add_argument("--number", type=int, default=2000, help="Chiamate per ripetizione")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.number)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"\n{'Caso':<30} {'prima (µs)':>11} {'dopo (µs)':>10} {'x':>6}")
+    for case, result in results.items():
+        if "precedente_us" in result:
+            print(f"{case:<30} {result['precedente_us']:>11.2f} {result['attuale_us']:>10.2f} {result['accelerazione']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
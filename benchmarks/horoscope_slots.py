@@ -0,0 +1,111 @@
+"""
+Accuratezza e costo dell'estrazione degli slot dell'agente oroscopo
+Confronta, sul corpus HOROSCOPE_SLOT_CORPUS, l'estrazione attuale (regole
+locali con ripiego sull'LLM) con la sola estrazione LLM: accuratezza di segno
+e periodo, chiamate LLM e latenza media. Offline l'LLM è FakeChatModel; con
+--live si usa il modello configurato (serve OPENAI_API_KEY)
+
+Uso:
+    python -m benchmarks.horoscope_slots --llm-latency-ms 300
+    python -m benchmarks.horoscope_slots --live
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.corpus import HOROSCOPE_SLOT_CORPUS
+
+
+def evaluate(extract, corpus: list) -> dict:
+    """
+    Applica un estrattore al corpus
+
+    Args:
+        extract: Funzione query -> slot
+        corpus: Lista di (query, segno atteso o None, periodo atteso)
+
+    Returns:
+        Accuratezza di segno, periodo ed entrambi, latenza media ed errori per query
+    """
+    sign_ok = period_ok = both_ok = 0
+    elapsed = 0.0
+    mistakes = []
+    for query, expected_sign, expected_period in corpus:
+        start = time.perf_counter()
+        try:
+            data = extract(query)
+        except Exception as e:
+            data = {"error": str(e)}
+        elapsed += time.perf_counter() - start
+
+        sign = str(data.get("zodiac_sign", "NESSUNO")).strip().lower()
+        sign = None if sign in ("", "nessuno") else sign
+        period = str(data.get("time_period", "")).strip().lower()
+        sign_match = sign == expected_sign
+        period_match = period == expected_period
+        sign_ok += sign_match
+        period_ok += period_match
+        both_ok += sign_match and period_match
+        if not (sign_match and period_match):
+            mistakes.append({"query": query, "atteso": [expected_sign, expected_period], "estratto": [sign, period]})
+
+    total = len(corpus)
+    return {
+        "accuratezza_segno": round(sign_ok / total, 3),
+        "accuratezza_periodo": round(period_ok / total, 3),
+        "accuratezza_slot": round(both_ok / total, 3),
+        "latenza_media_ms": round(elapsed / total * 1000, 3),
+        "errori": mistakes,
+    }
+
+
+def run(live: bool, llm_latency_ms: float) -> dict:
+    """
+    Misura i due percorsi di estrazione
+
+    Args:
+        live: Se True usa il modello configurato invece di FakeChatModel
+        llm_latency_ms: Latenza simulata di ogni chiamata LLM (solo offline)
+
+    Returns:
+        Dizionario percorso -> risultati, con le chiamate LLM del percorso attuale
+    """
+    server = None
+    if not live:
+        from benchmarks.offline import setup_offline
+        server = setup_offline(llm_latency_ms=llm_latency_ms)
+
+    from agents.horoscope_agent import extract_horoscope_slots, llm_horoscope_slots, slot_extractions
+
+    before = slot_extractions().value(agent="HOROSCOPE", path="llm")
+    current = evaluate(extract_horoscope_slots, HOROSCOPE_SLOT_CORPUS)
+    current["chiamate_llm"] = int(slot_extractions().value(agent="HOROSCOPE", path="llm") - before)
+    llm_only = evaluate(llm_horoscope_slots, HOROSCOPE_SLOT_CORPUS)
+    llm_only["chiamate_llm"] = len(HOROSCOPE_SLOT_CORPUS)
+
+    if server is not None:
+        server.shutdown()
+    return {"query": len(HOROSCOPE_SLOT_CORPUS), "llm": "live" if live else "fake",
+            "regole_con_ripiego": current, "solo_llm": llm_only}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuratezza dell'estrazione degli slot dell'oroscopo")
+    parser.add_argument("--live", action="store_true", help="Usa il modello configurato invece di quello finto")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latenza simulata dell'LLM (offline)")
+    args = parser.parse_args()
+
+    summary = run(args.live, args.llm_latency_ms)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    print(f"\n{'Percorso':<20} {'segno':>6} {'periodo':>8} {'slot':>6} {'LLM':>5} {'ms/query':>9}")
+    for path in ("regole_con_ripiego", "solo_llm"):
+        result = summary[path]
+        print(
+            f"{path:<20} {result['accuratezza_segno']:>6.3f} {result['accuratezza_periodo']:>8.3f} "
+            f"{result['accuratezza_slot']:>6.3f} {result['chiamate_llm']:>5} {result['latenza_media_ms']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
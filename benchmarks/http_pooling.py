@@ -0,0 +1,107 @@
+"""
+Benchmark del pool di connessioni HTTP contro i servizi simulati
+Confronta la latenza per chiamata di requests.get (una nuova connessione per
+richiesta) con http_client.http_get (connessioni riusate con keep-alive)
+
+Uso:
+    python -m benchmarks.http_pooling --calls 200 --concurrency 4
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.offline import setup_offline
+
+
+def service_requests(endpoints: dict) -> dict:
+    """Una richiesta tipica per servizio: (url, parametri)"""
+    return {
+        "nominatim": (endpoints["NOMINATIM_URL"], {"q": "Roma, Italia", "format": "json", "limit": 1}),
+        "open_meteo": (endpoints["OPEN_METEO_URL"], {
+            "latitude": 41.8933, "longitude": 12.4829, "daily": "temperature_2m_max",
+            "forecast_days": 8, "format": "flatbuffers"
+        }),
+        "horoscope": (endpoints["HOROSCOPE_API_URL"] + "/daily", {"sign": "leo", "day": "TODAY"}),
+        "wikipedia": (endpoints["WIKIPEDIA_API_URL"], {
+            "list": "search", "srsearch": "leonardo da vinci", "format": "json", "action": "query"
+        }),
+    }
+
+
+def measure(get, url: str, params: dict, calls: int, concurrency: int) -> list:
+    """Esegue `calls` GET con `concurrency` thread e restituisce le latenze in ms"""
+    def one(_):
+        start = time.perf_counter()
+        response = get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(calls)))
+
+
+def _summary(latencies: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+    }
+
+
+def run(calls: int, concurrency: int, service_latency_ms: float) -> dict:
+    """
+    Misura le due modalità per ogni servizio simulato
+
+    Args:
+        calls: Chiamate per servizio e modalità
+        concurrency: Chiamate contemporanee
+        service_latency_ms: Latenza simulata delle API esterne
+
+    Returns:
+        Dizionario servizio -> latenze con e senza pool e risparmio medio per chiamata
+    """
+    server = setup_offline(0.0, 0.0, service_latency_ms)
+    from http_client import http_get, _get_http2_client
+
+    protocol = "http2" if _get_http2_client() is not None else "http1.1"
+    results = {}
+    for service, (url, params) in service_requests(server.endpoints()).items():
+        # Riscaldamento: la prima richiesta del pool apre le connessioni
+        http_get(url, params=params, timeout=10)
+        fresh = _summary(measure(requests.get, url, params, calls, concurrency))
+        pooled = _summary(measure(http_get, url, params, calls, concurrency))
+        results[service] = {
+            "nuova_connessione": fresh,
+            "pool": pooled,
+            "risparmio_ms_per_chiamata": round(fresh["mean_ms"] - pooled["mean_ms"], 3),
+        }
+
+    server.shutdown()
+    return {"protocol": protocol, "calls": calls, "concurrency": concurrency, "services": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool di connessioni HTTP")
+    parser.add_argument("--calls", type=int, default=200, help="Chiamate per servizio e modalità")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chiamate contemporanee")
+    parser.add_argument("--service-latency-ms", type=float, default=0.0, help="Latenza delle API esterne")
+    args = parser.parse_args()
+
+    summary = run(args.calls, args.concurrency, args.service_latency_ms)
+    print(json.dumps(summary, indent=2))
+    print(f"\n{'Servizio':<12} {'nuova conn. (ms)':>17} {'pool (ms)':>10} {'risparmio':>10}")
+    for service, result in summary["services"].items():
+        print(
+            f"{service:<12} {result['nuova_connessione']['mean_ms']:>17.3f} "
+            f"{result['pool']['mean_ms']:>10.3f} {result['risparmio_ms_per_chiamata']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Generatore di carico concorrente per il supervisore e per l'interfaccia Gradio
+Riproduce conversazioni a più turni (anche con richieste in sospeso) con
+concorrenza e frequenza di arrivo configurabili, usando i servizi offline
+
+Uso:
+    python -m benchmarks.load_test --conversations 200 --concurrency 16 --rate 20
+    python -m benchmarks.load_test --target gradio --conversations 50 --concurrency 8
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from benchmarks.offline import setup_offline
+from benchmarks.corpus import LOAD_SCRIPTS
+
+
+@dataclass
+class LoadResults:
+    """Risultati raccolti durante il test di carico"""
+    latencies: list = field(default_factory=list)
+    queue_waits: list = field(default_factory=list)
+    turns: int = 0
+    errors: int = 0
+    conversations: int = 0
+    peak_sessions: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, latency: float, failed: bool):
+        with self.lock:
+            self.latencies.append(latency)
+            self.turns += 1
+            if failed:
+                self.errors += 1
+
+
+def _is_error(result: dict) -> bool:
+    """Un turno è fallito se un nodo ha riportato un errore nei messaggi"""
+    return any(
+        getattr(msg, "content", "").startswith("Errore") for msg in result.get("messages", [])
+    )
+
+
+class SupervisorTarget:
+    """Esegue i turni chiamando direttamente run_supervisor"""
+
+    def __init__(self):
+        from multiagent import run_supervisor
+        self.run_supervisor = run_supervisor
+
+    def open(self, session_id: str):
+        return session_id
+
+    def turn(self, session, message: str) -> bool:
+        return _is_error(self.run_supervisor(message, session_id=session))
+
+    def close(self):
+        pass
+
+
+class GradioTarget:
+    """Esegue i turni tramite l'endpoint HTTP dell'interfaccia Gradio"""
+
+    def __init__(self, url: str | None, concurrency: int):
+        from gradio_client import Client
+        self.client_class = Client
+        self.demo = None
+
+        if url is None:
+            # Avvia l'interfaccia nello stesso processo, servita dai fake offline
+            from gradio_ui import create_interface
+            self.demo = create_interface()
+            self.demo.queue(default_concurrency_limit=concurrency)
+            self.demo.launch(server_name="127.0.0.1", prevent_thread_lock=True, quiet=True)
+            url = self.demo.local_url
+        self.url = url
+
+    def open(self, session_id: str):
+        # Ogni client Gradio ha un proprio session_hash, quindi una propria conversazione
+        return self.client_class(self.url, verbose=False, analytics_enabled=False)
+
+    def turn(self, session, message: str) -> bool:
+        _, history = session.predict(message, [], api_name="/chat")
+        last = history[-1]["content"] if history else ""
+        return isinstance(last, str) and last.startswith("Errore")
+
+    def close(self):
+        if self.demo is not None:
+            self.demo.close()
+
+
+def _run_conversation(target, script: list, conversation_id: int, scheduled_at: float,
+                      think_time: float, results: LoadResults, session_counter):
+    """Esegue tutti i turni di una conversazione in sequenza"""
+    results.queue_waits.append(time.perf_counter() - scheduled_at)
+    try:
+        session = target.open(f"load-{conversation_id}")
+    except Exception:
+        results.record(0.0, failed=True)
+        return
+
+    for message in script:
+        start = time.perf_counter()
+        try:
+            failed = target.turn(session, message)
+        except Exception:
+            failed = True
+        results.record(time.perf_counter() - start, failed)
+
+        if session_counter is not None:
+            sessions = session_counter()
+            with results.lock:
+                results.peak_sessions = max(results.peak_sessions, sessions)
+        if think_time:
+            time.sleep(random.expovariate(1 / think_time))
+
+    with results.lock:
+        results.conversations += 1
+
+
+def run_load_test(target_name: str, conversations: int, concurrency: int, rate: float,
+                  think_time: float, llm_latency_ms: float, service_latency_ms: float,
+                  url: str | None = None, seed: int = 0) -> dict:
+    """
+    Esegue il test di carico
+
+    Args:
+        target_name: "supervisor" oppure "gradio"
+        conversations: Numero di conversazioni da avviare
+        concurrency: Numero massimo di conversazioni contemporanee
+        rate: Conversazioni avviate al secondo (arrivi di Poisson); 0 = tutte subito
+        think_time: Pausa media in secondi tra un turno e il successivo
+        llm_latency_ms: Latenza simulata per chiamata LLM
+        service_latency_ms: Latenza simulata delle API esterne
+        url: URL di un'interfaccia Gradio già avviata (solo target "gradio")
+        seed: Seme per la scelta degli script e degli arrivi
+
+    Returns:
+        Dizionario con il riepilogo del test
+    """
+    server = setup_offline(llm_latency_ms=llm_latency_ms, service_latency_ms=service_latency_ms)
+
+    from conversation_manager import conversation_manager
+    from metrics import percentile
+
+    target = GradioTarget(url, concurrency) if target_name == "gradio" else SupervisorTarget()
+
+    # Le sessioni sono osservabili solo se il sistema gira in questo processo
+    session_counter = (lambda: len(conversation_manager.conversations)) if url is None else None
+
+    rng = random.Random(seed)
+    scripts = itertools.cycle(rng.sample(LOAD_SCRIPTS, len(LOAD_SCRIPTS)))
+    results = LoadResults()
+
+    tracemalloc.start()
+    memory_before = tracemalloc.take_snapshot()
+    sessions_before = len(conversation_manager.conversations)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+        for conversation_id in range(conversations):
+            executor.submit(
+                _run_conversation, target, next(scripts), conversation_id,
+                time.perf_counter(), think_time, results, session_counter
+            )
+            if rate > 0:
+                time.sleep(rng.expovariate(rate))
+    duration = time.perf_counter() - start
+
+    memory_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # Crescita della memoria allocata da conversation_manager durante il test
+    manager_growth = sum(
+        stat.size_diff for stat in memory_after.compare_to(memory_before, "filename")
+        if stat.traceback[0].filename.endswith("conversation_manager.py")
+    )
+    total_growth = sum(stat.size_diff for stat in memory_after.compare_to(memory_before, "filename"))
+
+    target.close()
+    server.shutdown()
+
+    latencies = sorted(results.latencies)
+    waits = sorted(results.queue_waits)
+    return {
+        "target": target_name,
+        "conversations": results.conversations,
+        "turns": results.turns,
+        "errors": results.errors,
+        "error_rate": results.errors / results.turns if results.turns else 0.0,
+        "duration_s": duration,
+        "throughput_turns_per_s": results.turns / duration if duration else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "queue_wait_ms_p95": percentile(waits, 0.95) * 1000,
+        "conversation_manager": {
+            "sessions_before": sessions_before,
+            "sessions_after": len(conversation_manager.conversations) if url is None else None,
+            "peak_sessions": results.peak_sessions if url is None else None,
+            "memory_growth_kb": manager_growth / 1024,
+        },
+        "process_memory_growth_kb": total_growth / 1024,
+    }
+
+
+def format_report(summary: dict) -> str:
+    """Formatta il riepilogo del test di carico"""
+    latency = summary["latency_ms"]
+    manager = summary["conversation_manager"]
+    return "\n".join([
+        f"Target: {summary['target']}  Conversazioni: {summary['conversations']}  Turni: {summary['turns']}",
+        f"Durata: {summary['duration_s']:.2f}s  Throughput: {summary['throughput_turns_per_s']:.1f} turni/s",
+        f"Errori: {summary['errors']} ({summary['error_rate']:.2%})",
+        f"Latenza turno: p50={latency['p50']:.1f}ms  p95={latency['p95']:.1f}ms  "
+        f"p99={latency['p99']:.1f}ms  max={latency['max']:.1f}ms",
+        f"Attesa in coda (p95): {summary['queue_wait_ms_p95']:.1f}ms",
+        f"conversation_manager: sessioni {manager['sessions_before']} -> {manager['sessions_after']} "
+        f"(picco {manager['peak_sessions']}), memoria +{manager['memory_growth_kb']:.1f} KB",
+        f"Crescita memoria del processo: +{summary['process_memory_growth_kb']:.1f} KB",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico del sistema multiagente")
+    parser.add_argument("--target", choices=["supervisor", "gradio"], default="supervisor")
+    parser.add_argument("--url", help="URL di un'interfaccia Gradio già avviata (default: avvio locale)")
+    parser.add_argument("--conversations", type=int, default=100, help="Conversazioni da eseguire")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversazioni contemporanee")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrivi al secondo (0 = tutti subito)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa media tra i turni (s)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latenza per chiamata LLM")
+    parser.add_argument("--service-latency-ms", type=float, default=0.0, help="Latenza delle API esterne")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Stampa il riepilogo in JSON")
+    args = parser.parse_args()
+
+    summary = run_load_test(
+        args.target, args.conversations, args.concurrency, args.rate, args.think_time,
+        args.llm_latency_ms, args.service_latency_ms, url=args.url, seed=args.seed
+    )
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+
+
+if __name__ == "__main__":
+    main()
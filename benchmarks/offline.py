@@ -0,0 +1,73 @@
+"""
+Configurazione dell'ambiente offline per i benchmark
+Avvia i servizi HTTP simulati e sostituisce il chat model con FakeChatModel
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Aggiungi la root del progetto al path per importare i moduli condivisi
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.fake_services import FakeServicesServer, start_fake_services
+
+
+def setup_offline(llm_latency_ms: float = 0.0, per_token_ms: float = 0.0,
+                  service_latency_ms: float = 0.0) -> FakeServicesServer:
+    """
+    Prepara l'ambiente offline: va chiamata prima di importare multiagent
+
+    Args:
+        llm_latency_ms: Latenza fissa simulata per ogni chiamata LLM
+        per_token_ms: Latenza simulata per token generato
+        service_latency_ms: Latenza simulata delle API esterne
+
+    Returns:
+        Il server dei servizi simulati
+    """
+    # Niente server delle metriche e log ridotti durante le misure
+    os.environ.setdefault("ALEXA_METRICS_PORT", "0")
+    os.environ.setdefault("ALEXA_LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    # Il limite di Nominatim (1 req/s) vale per il servizio reale, non per quello simulato
+    os.environ.setdefault("ALEXA_NOMINATIM_RATE", "1000")
+
+    server = start_fake_services(latency_ms=service_latency_ms)
+    os.environ.update(server.endpoints())
+
+    # I moduli già importati hanno letto gli endpoint all'import: li aggiorna
+    _patch_loaded_modules(server.endpoints())
+
+    from llm_provider import set_llm_factory
+
+    def factory(temperature: float = 0) -> FakeChatModel:
+        return FakeChatModel(temperature=temperature, base_latency_ms=llm_latency_ms, per_token_ms=per_token_ms)
+
+    set_llm_factory(factory)
+    return server
+
+
+def _patch_loaded_modules(endpoints: dict):
+    """Aggiorna gli endpoint nei moduli agente già caricati"""
+    for module_name in ("agents.weather_agent", "weather_agent"):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            module.NOMINATIM_URL = endpoints["NOMINATIM_URL"]
+            module.OPEN_METEO_URL = endpoints["OPEN_METEO_URL"]
+
+    for module_name in ("agents.horoscope_agent", "horoscope_agent"):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            module.HOROSCOPE_API_URL = endpoints["HOROSCOPE_API_URL"]
+
+    for module_name in ("agents.wikipedia_agent", "wikipedia_agent"):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            module.WIKIPEDIA_API_URL = endpoints["WIKIPEDIA_API_URL"]
+
+    # La libreria wikipedia, se già configurata, conserva il proprio endpoint
+    wikipedia = sys.modules.get("wikipedia")
+    if wikipedia is not None:
+        wikipedia.wikipedia.API_URL = endpoints["WIKIPEDIA_API_URL"]
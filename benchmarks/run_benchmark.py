@@ -0,0 +1,137 @@
+"""
+Benchmark offline end-to-end del supervisore
+Esegue il corpus di query con FakeChatModel e servizi HTTP locali e riporta
+throughput e latenze p50/p95/p99 per agente
+
+Uso:
+    python -m benchmarks.run_benchmark --iterations 5 --llm-latency-ms 20
+    python -m benchmarks.run_benchmark --combined   # routing e estrazione in una sola chiamata
+    python -m benchmarks.run_benchmark --speculative   # estrazione speculativa in parallelo al routing
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+
+from benchmarks.offline import setup_offline
+from benchmarks.corpus import QUERY_CORPUS
+
+
+def run(iterations: int, llm_latency_ms: float, per_token_ms: float, service_latency_ms: float) -> dict:
+    """
+    Esegue il benchmark e raccoglie le latenze
+
+    Args:
+        iterations: Numero di passate sull'intero corpus
+        llm_latency_ms: Latenza fissa simulata per chiamata LLM
+        per_token_ms: Latenza simulata per token generato
+        service_latency_ms: Latenza simulata delle API esterne
+
+    Returns:
+        Dizionario con il riepilogo del benchmark
+    """
+    server = setup_offline(llm_latency_ms, per_token_ms, service_latency_ms)
+
+    # Import dopo il setup, così gli agenti leggono gli endpoint simulati
+    from multiagent import run_supervisor
+    from conversation_manager import conversation_manager
+    from metrics import percentile
+
+    latencies = defaultdict(list)
+    llm_calls = 0
+    errors = 0
+
+    # Riscaldamento: grafi, client HTTP e moduli degli agenti (caricati al
+    # primo utilizzo) non entrano nelle misure
+    for query in QUERY_CORPUS:
+        run_supervisor(query)
+        conversation_manager.clear_pending_request()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in QUERY_CORPUS:
+            turn_start = time.perf_counter()
+            try:
+                result = run_supervisor(query)
+                agent = result.get("selected_agent") or "UNKNOWN"
+                llm_calls += result["llm_usage"]["calls"]
+            except Exception:
+                agent = "ERROR"
+                errors += 1
+            latencies[agent].append(time.perf_counter() - turn_start)
+            conversation_manager.clear_pending_request()
+    total_time = time.perf_counter() - start
+
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+    per_agent = {}
+    for agent, values in sorted(latencies.items()):
+        values = sorted(values)
+        per_agent[agent] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+
+    server.shutdown()
+    return {
+        "turns": len(all_latencies),
+        "errors": errors,
+        "total_s": total_time,
+        "throughput_rps": len(all_latencies) / total_time if total_time else 0.0,
+        "p50_ms": percentile(all_latencies, 0.5) * 1000,
+        "p95_ms": percentile(all_latencies, 0.95) * 1000,
+        "p99_ms": percentile(all_latencies, 0.99) * 1000,
+        "llm_calls_per_turn": llm_calls / len(all_latencies) if all_latencies else 0.0,
+        "per_agent": per_agent,
+        "upstream_requests": dict(server.requests),
+    }
+
+
+def format_report(summary: dict) -> str:
+    """Formatta il riepilogo del benchmark come tabella testuale"""
+    lines = [
+        f"Turni: {summary['turns']}  Errori: {summary['errors']}  "
+        f"Durata: {summary['total_s']:.2f}s  Throughput: {summary['throughput_rps']:.1f} turni/s",
+        f"Totale      p50={summary['p50_ms']:8.1f}ms  p95={summary['p95_ms']:8.1f}ms  p99={summary['p99_ms']:8.1f}ms",
+        f"Chiamate LLM per turno: {summary['llm_calls_per_turn']:.2f}",
+        "",
+        f"{'Agente':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for agent, stats in summary["per_agent"].items():
+        lines.append(
+            f"{agent:<12}{stats['count']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    lines.append("")
+    lines.append("Richieste ai servizi simulati: " + json.dumps(summary["upstream_requests"]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del sistema multiagente")
+    parser.add_argument("--iterations", type=int, default=3, help="Passate sul corpus di query")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latenza fissa per chiamata LLM")
+    parser.add_argument("--per-token-ms", type=float, default=0.0, help="Latenza per token generato")
+    parser.add_argument("--service-latency-ms", type=float, default=0.0, help="Latenza delle API esterne")
+    parser.add_argument("--combined", action="store_true", help="Attiva il routing combinato con estrazione degli slot")
+    parser.add_argument("--speculative", action="store_true", help="Attiva l'estrazione speculativa durante il routing")
+    parser.add_argument("--json", action="store_true", help="Stampa il riepilogo in JSON")
+    args = parser.parse_args()
+
+    if args.combined:
+        os.environ["ALEXA_COMBINED_ROUTING"] = "1"
+    if args.speculative:
+        os.environ["ALEXA_SPECULATIVE_ROUTING"] = "1"
+
+    summary = run(args.iterations, args.llm_latency_ms, args.per_token_ms, args.service_latency_ms)
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+
+    if args.speculative and not args.json:
+        from speculation import format_speculation_report
+        print("\nSpeculazioni:\n" + format_speculation_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark di avvio a freddo e profilo dei tempi di import
+Ogni misura avvia un nuovo interprete, così nessun modulo è già in cache
+
+Uso:
+    python -m benchmarks.startup                 # tempi di avvio
+    python -m benchmarks.startup --profile multiagent   # costo di import per modulo
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Scenari di avvio misurati: nome -> codice eseguito in un interprete nuovo
+STARTUP_SCENARIOS = {
+    "import multiagent": "import multiagent",
+    "import gradio_ui": "import gradio_ui",
+    "primo turno (offline)": (
+        "from benchmarks.offline import setup_offline; setup_offline(); "
+        "from multiagent import run_supervisor; run_supervisor('Quanto fa 2+2?')"
+    ),
+}
+
+
+def _run_python(args: list) -> subprocess.CompletedProcess:
+    """Esegue un interprete Python nella root del progetto"""
+    return subprocess.run(
+        [sys.executable, *args], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+
+
+def measure_startup(code: str, repeats: int = 5) -> dict:
+    """
+    Misura il tempo di esecuzione di un frammento di codice in un interprete nuovo
+
+    Args:
+        code: Codice Python da eseguire
+        repeats: Numero di ripetizioni
+
+    Returns:
+        Tempi minimo e mediano in millisecondi
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _run_python(["-c", code])
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(timings), "median_ms": statistics.median(timings)}
+
+
+def profile_imports(module: str) -> dict:
+    """
+    Esegue `python -X importtime -c "import <module>"` e aggrega il costo per modulo
+
+    Args:
+        module: Modulo da importare
+
+    Returns:
+        Dizionario con il tempo totale, il costo cumulativo degli import diretti
+        del modulo e il tempo proprio aggregato per pacchetto di primo livello
+    """
+    stderr = _run_python(["-X", "importtime", "-c", f"import {module}"]).stderr
+
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len("import time:"):].split("|")
+        # L'annidamento è indicato da due spazi per livello prima del nome
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        entries.append((raw_name.strip(), int(self_us), int(cumulative_us), depth))
+
+    # L'output è in post-ordine: il sottoalbero del modulo precede la sua riga e
+    # segue l'ultimo import di primo livello (es. quelli di avvio dell'interprete)
+    end = max(i for i, (name, _, _, depth) in enumerate(entries) if name == module and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    subtree = entries[start:end + 1]
+    total_us = entries[end][2]
+
+    # Import diretti del modulo (primo livello di annidamento sotto il modulo stesso)
+    direct = {name: cumulative for name, _, cumulative, depth in subtree if depth == 1}
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in subtree:
+        by_package[name.split(".")[0]] += self_us
+
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "direct_imports_ms": {name: us / 1000 for name, us in sorted(direct.items(), key=lambda i: -i[1])},
+        "by_package_ms": {name: us / 1000 for name, us in sorted(by_package.items(), key=lambda i: -i[1])},
+    }
+
+
+def format_profile(profile: dict, top: int = 15) -> str:
+    """Formatta il profilo degli import come tabella testuale"""
+    lines = [f"Import di {profile['module']}: {profile['total_ms']:.1f} ms", "", "Import diretti (cumulativo):"]
+    for name, ms in list(profile["direct_imports_ms"].items())[:top]:
+        lines.append(f"  {name:<40}{ms:>10.1f} ms")
+    lines += ["", "Tempo proprio per pacchetto:"]
+    for name, ms in list(profile["by_package_ms"].items())[:top]:
+        lines.append(f"  {name:<40}{ms:>10.1f} ms")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di avvio a freddo")
+    parser.add_argument("--repeats", type=int, default=5, help="Ripetizioni per scenario")
+    parser.add_argument("--profile", metavar="MODULO", help="Mostra il costo di import per modulo")
+    parser.add_argument("--json", action="store_true", help="Stampa i risultati in JSON")
+    args = parser.parse_args()
+
+    if args.profile:
+        profile = profile_imports(args.profile)
+        print(json.dumps(profile, indent=2) if args.json else format_profile(profile))
+        return
+
+    results = {name: measure_startup(code, args.repeats) for name, code in STARTUP_SCENARIOS.items()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'Scenario':<28}{'min ms':>10}{'mediana ms':>12}")
+    for name, stats in results.items():
+        print(f"{name:<28}{stats['min_ms']:>10.1f}{stats['median_ms']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
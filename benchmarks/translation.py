@@ -0,0 +1,111 @@
+"""
+Benchmark della traduzione di testi lunghi
+Confronta la traduzione con una sola chiamata LLM (il testo intero nel prompt)
+con la traduzione a blocchi in parallelo di translator_agent, misurando la
+latenza totale, il tempo alla prima risposta parziale e le chiamate LLM.
+L'LLM è FakeChatModel con una latenza per token generato, come un modello
+che produce l'output in sequenza
+
+Uso:
+    python -m benchmarks.translation --paragraphs 12 --per-token-ms 2
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.offline import setup_offline
+
+
+# Paragrafi del testo sintetico (ripetuti a rotazione); i nomi propri ricorrono tra i blocchi
+PARAGRAPHS = [
+    "Leonardo da Vinci nacque ad Anchiano, vicino a Vinci, nel 1452. Fu pittore, ingegnere e scienziato. "
+    "A Firenze si formò nella bottega del Verrocchio, dove imparò il disegno, la pittura e la scultura.",
+    "Nel 1482 Leonardo si trasferì a Milano, alla corte di Ludovico il Moro. Qui progettò macchine da guerra, "
+    "studiò l'anatomia e dipinse il Cenacolo nel refettorio di Santa Maria delle Grazie.",
+    "I suoi taccuini raccolgono migliaia di pagine di appunti scritti da destra a sinistra. Leonardo annotava "
+    "osservazioni sul volo degli uccelli, sul moto dell'acqua e sulla luce, con disegni di grande precisione.",
+    "Dopo la caduta di Ludovico il Moro, Leonardo tornò a Firenze e lavorò alla Gioconda. Negli ultimi anni "
+    "visse in Francia, ad Amboise, ospite del re Francesco I, dove morì nel 1519.",
+]
+
+
+def long_text(paragraphs: int) -> str:
+    """Testo di `paragraphs` paragrafi separati da righe vuote"""
+    # Paragrafi numerati: blocchi identici condividerebbero la chiamata LLM (coalescenza)
+    return "\n\n".join(f"{i + 1}. {PARAGRAPHS[i % len(PARAGRAPHS)]}" for i in range(paragraphs))
+
+
+def measure(translate, text: str) -> dict:
+    """Esegue una traduzione e misura latenza totale, prima risposta parziale e chiamate LLM"""
+    from partial_response import partial_listener
+    from llm_usage import track_turn
+
+    start = time.perf_counter()
+    partials = []
+    with partial_listener(lambda partial: partials.append(time.perf_counter() - start)):
+        with track_turn() as records:
+            translated = translate(text)
+    total = time.perf_counter() - start
+    return {
+        "latenza_ms": round(total * 1000, 1),
+        "prima_risposta_ms": round((partials[0] if partials else total) * 1000, 1),
+        "risposte_parziali": len(partials),
+        "chiamate_llm": len(records),
+        "caratteri_tradotti": len(translated),
+    }
+
+
+def run(paragraphs: int, llm_latency_ms: float, per_token_ms: float, chunk_chars: int, parallelism: int) -> dict:
+    """
+    Misura la traduzione in una chiamata e a blocchi (in sequenza e in parallelo)
+
+    Args:
+        paragraphs: Paragrafi del testo da tradurre
+        llm_latency_ms: Latenza fissa simulata per ogni chiamata LLM
+        per_token_ms: Latenza simulata per token generato
+        chunk_chars: Lunghezza massima dei blocchi
+        parallelism: Blocchi tradotti contemporaneamente
+
+    Returns:
+        Dizionario modalità -> misure
+    """
+    server = setup_offline(llm_latency_ms, per_token_ms)
+    import agents.translator_agent as translator
+
+    text = long_text(paragraphs)
+    chunks = translator.split_text(text, chunk_chars)
+
+    def chunked(workers: int):
+        def translate(text: str) -> str:
+            translator.TRANSLATION_PARALLELISM = workers
+            return translator.translate_chunks(chunks, "italiano", "inglese")
+        return translate
+
+    results = {
+        "una_chiamata": measure(lambda text: translator.translate_text(text, "italiano", "inglese"), text),
+        "blocchi_in_sequenza": measure(chunked(1), text),
+        f"blocchi_paralleli_{parallelism}": measure(chunked(parallelism), text),
+    }
+    server.shutdown()
+    return {"caratteri": len(text), "blocchi": len(chunks), "chunk_chars": chunk_chars, "modalita": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della traduzione di testi lunghi")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Paragrafi del testo")
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0, help="Latenza fissa per chiamata LLM")
+    parser.add_argument("--per-token-ms", type=float, default=2.0, help="Latenza per token generato")
+    parser.add_argument("--chunk-chars", type=int, default=1200, help="Lunghezza massima dei blocchi")
+    parser.add_argument("--parallelism", type=int, default=4, help="Blocchi tradotti contemporaneamente")
+    args = parser.parse_args()
+
+    summary = run(args.paragraphs, args.llm_latency_ms, args.per_token_ms, args.chunk_chars, args.parallelism)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    print(f"\n{'Modalità':<22} {'totale (ms)':>12} {'prima parte (ms)':>17} {'LLM':>5}")
+    for mode, result in summary["modalita"].items():
+        print(f"{mode:<22} {result['latenza_ms']:>12.1f} {result['prima_risposta_ms']:>17.1f} {result['chiamate_llm']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Copertura e risparmio di latenza del dizionario bilingue dell'agente traduttore
+Sul corpus TRANSLATION_TRAFFIC misura la quota di richieste tradotte dal
+dizionario su disco, la durata delle ricerche e la latenza di perform_translation
+con e senza dizionario (LLM finto con latenza configurabile)
+
+Uso:
+    python -m benchmarks.translation_dictionary --llm-latency-ms 300
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.corpus import TRANSLATION_TRAFFIC
+from benchmarks.offline import setup_offline
+
+
+def _translate_all(translator, enabled: bool) -> list:
+    """Esegue perform_translation su tutto il corpus e restituisce le latenze in ms"""
+    translator.DICTIONARY_ENABLED = enabled
+    latencies = []
+    for text, source, target in TRANSLATION_TRAFFIC:
+        state = {"text_to_translate": text, "source_language": source, "target_language": target,
+                 "translated_text": None, "messages": []}
+        start = time.perf_counter()
+        translator.perform_translation(state)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert state["translated_text"], state["messages"]
+    return latencies
+
+
+def run(llm_latency_ms: float, repeat: int) -> dict:
+    """
+    Misura copertura, durata delle ricerche e latenza della traduzione
+
+    Args:
+        llm_latency_ms: Latenza simulata di ogni chiamata LLM
+        repeat: Ripetizioni delle ricerche nel dizionario (per la durata media)
+
+    Returns:
+        Il riepilogo delle misure
+    """
+    server = setup_offline(llm_latency_ms=llm_latency_ms)
+    import agents.translator_agent as translator
+    from bilingual_dictionary import bilingual_dictionary
+
+    # Copertura e durata delle ricerche (la prima apre la mappa del file)
+    hits = [translator.dictionary_translation(*request) for request in TRANSLATION_TRAFFIC]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for request in TRANSLATION_TRAFFIC:
+            translator.dictionary_translation(*request)
+    lookup_us = (time.perf_counter() - start) / (repeat * len(TRANSLATION_TRAFFIC)) * 1e6
+
+    with_dictionary = _translate_all(translator, True)
+    llm_only = _translate_all(translator, False)
+    translator.DICTIONARY_ENABLED = True
+    bilingual_dictionary.close()
+    server.shutdown()
+
+    covered = sum(hit is not None for hit in hits)
+    return {
+        "richieste": len(TRANSLATION_TRAFFIC),
+        "copertura": round(covered / len(TRANSLATION_TRAFFIC), 3),
+        "ricerca_media_us": round(lookup_us, 2),
+        "latenza_media_ms": {
+            "con_dizionario": round(statistics.fmean(with_dictionary), 2),
+            "solo_llm": round(statistics.fmean(llm_only), 2),
+        },
+        "chiamate_llm_evitate": covered,
+        "non_coperte": [text for (text, _, _), hit in zip(TRANSLATION_TRAFFIC, hits) if hit is None],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copertura e risparmio del dizionario bilingue")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latenza simulata dell'LLM")
+    parser.add_argument("--repeat", type=int, default=200, help="Ripetizioni delle ricerche nel dizionario")
+    args = parser.parse_args()
+
+    summary = run(args.llm_latency_ms, args.repeat)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    latency = summary["latenza_media_ms"]
+    print(
+        f"\nCopertura {summary['copertura']:.0%} ({summary['chiamate_llm_evitate']}/{summary['richieste']}), "
+        f"ricerca {summary['ricerca_media_us']:.1f} µs, traduzione media {latency['con_dizionario']:.1f} ms "
+        f"contro {latency['solo_llm']:.1f} ms con il solo LLM"
+    )
+
+
+if __name__ == "__main__":
+    main()
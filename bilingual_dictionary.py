@@ -0,0 +1,220 @@
+"""
+Dizionario bilingue su disco per le traduzioni di parole e frasi brevi
+Gran parte delle richieste all'agente traduttore sono parole o formule fisse
+("hello", "buongiorno", "grazie"): il dizionario le traduce senza chiamare l'LLM.
+Il file (data/bilingual_dictionary.tsv) ha una riga per coppia di lingue e
+termine, ordinata per byte; è mappato in memoria con mmap e cercato per
+bisezione, quindi non viene caricato né indicizzato all'avvio e le pagine
+del file sono condivise tra i processi
+"""
+
+import os
+import re
+import sys
+import mmap
+import time
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Iterable, Optional
+
+from metrics import metrics_registry, Counter, Histogram
+from logging_manager import get_logger
+
+
+logger = get_logger("bilingual_dictionary")
+
+# Percorso del dizionario (ALEXA_DICTIONARY_PATH)
+DEFAULT_PATH = Path(__file__).parent / "data" / "bilingual_dictionary.tsv"
+
+# Testi con più parole non sono cercati nel dizionario (frasi libere, sempre all'LLM)
+MAX_WORDS = 5
+
+# Punteggiatura ai bordi che non cambia il termine ("Grazie!", "¿hola?")
+_EDGE_PUNCTUATION = "\"'«»“”‘’.,;:!?¡¿()"
+
+_SPACES = re.compile(r"\s+")
+
+
+def dictionary_lookups() -> Counter:
+    """Ricerche nel dizionario per esito: hit, miss o skipped (testo troppo lungo o lingue senza dati)"""
+    return metrics_registry.counter(
+        "alexa_translation_dictionary_total",
+        "Ricerche nel dizionario bilingue per esito",
+        ("outcome",)
+    )
+
+
+def dictionary_latency() -> Histogram:
+    """Durata delle ricerche nel dizionario per esito"""
+    return metrics_registry.histogram(
+        "alexa_translation_dictionary_lookup_seconds",
+        "Durata delle ricerche nel dizionario bilingue",
+        ("outcome",)
+    )
+
+
+def normalize_term(text: str) -> str:
+    """
+    Normalizza un termine come le chiavi del dizionario
+
+    Args:
+        text: La parola o frase da tradurre
+
+    Returns:
+        Il termine in minuscolo, senza punteggiatura ai bordi e con spazi e apostrofi uniformi
+    """
+    text = unicodedata.normalize("NFC", text).replace("’", "'").lower()
+    return _SPACES.sub(" ", text.strip(_EDGE_PUNCTUATION + " \t\n")).strip()
+
+
+class BilingualDictionary:
+    """Dizionario ordinato su disco, mappato in memoria al primo utilizzo"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._unavailable = False
+        self._lock = threading.Lock()
+
+    def _open(self) -> Optional[mmap.mmap]:
+        """Mappa il file in memoria al primo utilizzo (None se manca o è vuoto)"""
+        if self._map is None and not self._unavailable:
+            with self._lock:
+                if self._map is None and not self._unavailable:
+                    try:
+                        with open(self.path, "rb") as file:
+                            # La mappa resta valida anche dopo la chiusura del file
+                            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError) as e:
+                        logger.warning("Dizionario bilingue non disponibile (%s): traduzioni solo con l'LLM", e)
+                        self._unavailable = True
+        return self._map
+
+    def _find(self, data: mmap.mmap, key: bytes) -> Optional[str]:
+        """Cerca per bisezione la riga che inizia con la chiave"""
+        low, high = 0, len(data)
+        # Invariante: low e high sono inizi di riga; le righe prima di low sono minori della chiave
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b"\n", 0, middle) + 1
+            end = data.find(b"\n", start)
+            end = len(data) if end < 0 else end
+            if data[start:end] < key:
+                low = end + 1
+            else:
+                high = start
+
+        end = data.find(b"\n", low)
+        line = data[low:len(data) if end < 0 else end]
+        if line.startswith(key):
+            return line[len(key):].decode("utf-8")
+        return None
+
+    def get(self, text: str, source: str, target: str) -> Optional[str]:
+        """
+        Traduzione di un termine per una coppia di lingue
+
+        Args:
+            text: La parola o frase (non normalizzata)
+            source: Codice della lingua di origine (es. "en")
+            target: Codice della lingua di destinazione (es. "it")
+
+        Returns:
+            La traduzione, oppure None
+        """
+        data = self._open()
+        if data is None:
+            return None
+        # Il tab dopo il termine è minore di ogni carattere stampabile: "ciao" precede "ciao mondo"
+        key = f"{source}\t{target}\t{normalize_term(text)}\t".encode("utf-8")
+        return self._find(data, key)
+
+    def lookup(self, text: str, source: Optional[str], target: str, candidates: Iterable[str] = ()) -> Optional[str]:
+        """
+        Cerca la traduzione di un testo breve, registrando esito e durata
+
+        Args:
+            text: Il testo da tradurre
+            source: Codice della lingua di origine, oppure None se da rilevare
+            target: Codice della lingua di destinazione
+            candidates: Lingue di origine da provare quando source è None
+
+        Returns:
+            La traduzione (con l'iniziale maiuscola se lo era il testo), oppure None
+        """
+        start = time.perf_counter()
+        if len(text.split()) > MAX_WORDS or source == target:
+            outcome, translation = "skipped", None
+        else:
+            if source is not None:
+                translations = {self.get(text, source, target)}
+            else:
+                # Lingua da rilevare: il termine deve avere la stessa traduzione in tutte le lingue in cui compare
+                translations = {self.get(text, code, target) for code in candidates if code != target}
+            translations.discard(None)
+            translation = translations.pop() if len(translations) == 1 else None
+            outcome = "hit" if translation is not None else "miss"
+
+        dictionary_lookups().inc(outcome=outcome)
+        dictionary_latency().observe(time.perf_counter() - start, outcome=outcome)
+        if translation is not None and text.strip()[:1].isupper():
+            translation = translation[:1].upper() + translation[1:]
+        return translation
+
+    def close(self):
+        """Rilascia la mappa in memoria (usato dai benchmark)"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+def sort_dictionary(path: str) -> int:
+    """
+    Riordina per byte le righe del dizionario (dopo averlo modificato a mano)
+
+    Args:
+        path: Percorso del file
+
+    Returns:
+        Il numero di voci
+    """
+    with open(path, "rb") as file:
+        lines = [line for line in file.read().split(b"\n") if line.strip()]
+    comments = [line for line in lines if line.startswith(b"#")]
+    entries = sorted(set(line for line in lines if not line.startswith(b"#")))
+    with open(path, "wb") as file:
+        file.write(b"\n".join(comments + entries) + b"\n")
+    return len(entries)
+
+
+# Dizionario condiviso dall'agente traduttore
+bilingual_dictionary = BilingualDictionary(os.getenv("ALEXA_DICTIONARY_PATH", str(DEFAULT_PATH)))
+
+
+if __name__ == "__main__":
+    if "--sort" in sys.argv:
+        print(f"Dizionario riordinato: {sort_dictionary(bilingual_dictionary.path)} voci")
+        sys.exit(0)
+
+    # Verifica: file ordinato, ricerche con e senza lingua di origine, testi esclusi
+    with open(bilingual_dictionary.path, "rb") as file:
+        entries = [line for line in file.read().split(b"\n") if line and not line.startswith(b"#")]
+    assert entries == sorted(entries), "Dizionario non ordinato: python bilingual_dictionary.py --sort"
+
+    assert bilingual_dictionary.lookup("hello", "en", "it") == "ciao"
+    assert bilingual_dictionary.lookup("Buongiorno!", "it", "fr") == "Bonjour"
+    assert bilingual_dictionary.lookup("grazie mille", "it", "de") == "vielen Dank"
+    assert bilingual_dictionary.lookup("thank you", None, "it", ["it", "en", "fr", "es", "de"]) == "grazie"
+    assert bilingual_dictionary.lookup("parola inesistente", "it", "en") is None
+    assert bilingual_dictionary.lookup("dove si trova la stazione dei treni oggi", "it", "en") is None
+
+    # Ogni voce si ritrova con la propria chiave
+    for entry in entries:
+        source, target, term, translation = entry.decode("utf-8").split("\t")
+        assert bilingual_dictionary.get(term, source, target) == translation, entry
+
+    lookups = dictionary_lookups()
+    print({outcome: lookups.value(outcome=outcome) for outcome in ("hit", "miss", "skipped")})
+    print(f"OK: {len(entries)} voci ordinate e tutte ritrovate")
@@ -0,0 +1,334 @@
+"""
+Circuit breaker per i servizi esterni (OpenAI, Nominatim, Open-Meteo, Horoscope API, Wikipedia)
+Se la percentuale di errori recenti supera la soglia il circuito si apre e le
+chiamate falliscono subito, restituendo l'ultimo dato valido se disponibile.
+Trascorso il periodo di apertura una chiamata di prova (half-open) decide se
+richiudere il circuito
+"""
+
+import os
+import time
+import threading
+import functools
+from collections import deque, OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from deadline import DeadlineExceeded
+from metrics import metrics_registry, Counter, Gauge
+from logging_manager import get_logger
+
+
+logger = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Valore della gauge per ciascuno stato
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Parametri di default (sovrascrivibili con le variabili d'ambiente)
+FAILURE_RATE_THRESHOLD = float(os.getenv("ALEXA_BREAKER_FAILURE_RATE", "0.5"))
+MINIMUM_CALLS = int(os.getenv("ALEXA_BREAKER_MIN_CALLS", "5"))
+WINDOW_SIZE = int(os.getenv("ALEXA_BREAKER_WINDOW", "20"))
+OPEN_SECONDS = float(os.getenv("ALEXA_BREAKER_OPEN_SECONDS", "30"))
+
+# Ultimi risultati validi conservati per servizio, usati come ripiego
+STALE_ENTRIES = 256
+
+# Servizi protetti: i circuiti sono creati subito, così il loro stato compare in /metrics
+UPSTREAMS = ("openai", "nominatim", "open_meteo", "horoscope", "wikipedia")
+
+
+def breaker_state() -> Gauge:
+    """Stato del circuito per servizio: 0 chiuso, 1 half-open, 2 aperto"""
+    return metrics_registry.gauge(
+        "alexa_circuit_state",
+        "Stato del circuit breaker (0 chiuso, 1 half-open, 2 aperto)",
+        ("upstream",)
+    )
+
+
+def breaker_events() -> Counter:
+    """Eventi del circuito: rejected (chiamata non eseguita), fallback (dato vecchio restituito), opened"""
+    return metrics_registry.counter(
+        "alexa_circuit_events_total",
+        "Chiamate rifiutate, ripieghi su dati vecchi e aperture del circuit breaker",
+        ("upstream", "event")
+    )
+
+
+class CircuitOpenError(ConnectionError):
+    """Il circuito del servizio è aperto: la chiamata non è stata eseguita"""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"Servizio {upstream} temporaneamente non disponibile (nuovo tentativo tra {retry_in:.0f}s)")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Indica se un errore è imputabile al servizio esterno
+
+    Args:
+        error: L'eccezione sollevata dalla chiamata
+
+    Returns:
+        False per gli errori del client (HTTP 4xx tranne 429) e per la scadenza
+        del turno, che non dicono nulla sullo stato del servizio
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    # Errori HTTP di requests, httpx e del client OpenAI espongono la risposta con lo status
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return True
+
+
+class CircuitBreaker:
+    """Circuit breaker con soglia sulla percentuale di errori e prova in half-open"""
+
+    def __init__(self, upstream: str, failure_rate: float = FAILURE_RATE_THRESHOLD,
+                 minimum_calls: int = MINIMUM_CALLS, window: int = WINDOW_SIZE,
+                 open_seconds: float = OPEN_SECONDS):
+        self.upstream = upstream
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes: deque = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stale: OrderedDict = OrderedDict()
+        # Eccezioni che rappresentano una risposta valida del servizio (es. pagina inesistente)
+        self.expected_errors: tuple = ()
+        self._lock = threading.Lock()
+        breaker_state().set(STATE_VALUES[CLOSED], upstream=upstream)
+
+    def _transition(self, state: str):
+        """Cambia stato aggiornando la gauge (da chiamare con il lock acquisito)"""
+        if state == self.state:
+            return
+        logger.warning("Circuito %s: %s -> %s", self.upstream, self.state, state)
+        self.state = state
+        breaker_state().set(STATE_VALUES[state], upstream=self.upstream)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            breaker_events().inc(upstream=self.upstream, event="opened")
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def _acquire(self) -> bool:
+        """Decide se la chiamata può partire; in half-open passa una sola chiamata di prova"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def _record(self, success: bool):
+        """Registra l'esito di una chiamata e aggiorna lo stato"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(CLOSED if success else OPEN)
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.minimum_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._transition(OPEN)
+
+    def _release_probe(self):
+        """Libera la prova in half-open senza esito (es. errore del client)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _is_failure(self, error: BaseException) -> bool:
+        """Indica se l'errore va contato come guasto del servizio"""
+        return not isinstance(error, self.expected_errors) and is_upstream_failure(error)
+
+    def retry_in(self) -> float:
+        """Secondi mancanti alla prossima chiamata di prova"""
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Esegue la chiamata attraverso il circuito
+
+        Args:
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+
+        Returns:
+            Il risultato di fn
+
+        Raises:
+            CircuitOpenError: Se il circuito è aperto
+        """
+        if not self._acquire():
+            breaker_events().inc(upstream=self.upstream, event="rejected")
+            raise CircuitOpenError(self.upstream, self.retry_in())
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self._is_failure(e):
+                self._record(False)
+            elif isinstance(e, self.expected_errors):
+                self._record(True)
+            else:
+                self._release_probe()
+            raise
+        self._record(True)
+        return result
+
+    def call_with_fallback(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Come call, ma conserva l'ultimo risultato valido per chiave e lo restituisce
+        se il circuito è aperto o la chiamata fallisce per un errore del servizio
+
+        Args:
+            key: Chiave del dato (es. la località o l'URL)
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+
+        Returns:
+            Il risultato di fn, oppure l'ultimo risultato valido per la chiave
+        """
+        try:
+            result = self.call(fn, *args, **kwargs)
+        except Exception as e:
+            if not self._is_failure(e):
+                raise
+            with self._lock:
+                stale = self._stale.get(key)
+            if stale is None:
+                raise
+            breaker_events().inc(upstream=self.upstream, event="fallback")
+            logger.warning("Servizio %s non disponibile (%s): uso l'ultimo dato valido per %r", self.upstream, e, key)
+            return stale
+
+        with self._lock:
+            self._stale[key] = result
+            self._stale.move_to_end(key)
+            while len(self._stale) > STALE_ENTRIES:
+                self._stale.popitem(last=False)
+        return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    """
+    Restituisce (creandolo al primo utilizzo) il circuit breaker del servizio
+
+    Args:
+        upstream: Nome del servizio (openai, nominatim, open_meteo, horoscope, wikipedia)
+
+    Returns:
+        Il circuit breaker condiviso del servizio
+    """
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(upstream)
+            if breaker is None:
+                breaker = _breakers[upstream] = CircuitBreaker(upstream)
+    return breaker
+
+
+def protected(upstream: str, key: Optional[Callable[..., Hashable]] = None) -> Callable:
+    """
+    Decoratore che fa passare le chiamate di una funzione dal circuit breaker del servizio
+
+    Args:
+        upstream: Nome del servizio
+        key: Funzione che ricava dagli argomenti la chiave del dato; se indicata,
+             a circuito aperto o in caso di errore si restituisce l'ultimo dato valido
+
+    Returns:
+        Il decoratore da applicare alla funzione che effettua la chiamata
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            breaker = get_breaker(upstream)
+            if key is None:
+                return breaker.call(func, *args, **kwargs)
+            return breaker.call_with_fallback(key(*args, **kwargs), func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+for _upstream in UPSTREAMS:
+    get_breaker(_upstream)
+
+
+if __name__ == "__main__":
+    # Verifica: apertura dopo gli errori, ripiego sul dato vecchio, prova in half-open
+    breaker = CircuitBreaker("selfcheck", failure_rate=0.5, minimum_calls=4, window=10, open_seconds=0.2)
+    upstream_calls = []
+    healthy = True
+
+    def upstream(city: str) -> dict:
+        upstream_calls.append(city)
+        if not healthy:
+            raise ConnectionError("servizio non raggiungibile")
+        return {"city": city, "call": len(upstream_calls)}
+
+    first = breaker.call_with_fallback("roma", upstream, "Roma")
+    assert breaker.state == CLOSED
+
+    healthy = False
+    for _ in range(3):
+        assert breaker.call_with_fallback("roma", upstream, "Roma") is first
+    assert breaker.state == OPEN, breaker.state
+
+    # A circuito aperto il servizio non viene chiamato
+    calls = len(upstream_calls)
+    assert breaker.call_with_fallback("roma", upstream, "Roma") is first
+    try:
+        breaker.call(upstream, "Milano")
+        raise AssertionError("CircuitOpenError attesa")
+    except CircuitOpenError:
+        pass
+    assert len(upstream_calls) == calls
+
+    # Prova in half-open fallita: il circuito si riapre
+    time.sleep(0.25)
+    assert breaker.call_with_fallback("roma", upstream, "Roma") is first
+    assert breaker.state == OPEN and len(upstream_calls) == calls + 1
+
+    # Prova in half-open riuscita: il circuito si richiude
+    time.sleep(0.25)
+    healthy = True
+    assert breaker.call_with_fallback("roma", upstream, "Roma")["call"] == calls + 2
+    assert breaker.state == CLOSED
+
+    # Gli errori del client non aprono il circuito
+    class ClientError(Exception):
+        response = type("Response", (), {"status_code": 404})()
+
+    def not_found():
+        raise ClientError()
+
+    for _ in range(10):
+        try:
+            breaker.call(not_found)
+        except ClientError:
+            pass
+    assert breaker.state == CLOSED
+
+    print(metrics_registry.render_prometheus())
+    print("OK: apertura, ripiego sul dato vecchio e prova in half-open verificati")
@@ -3,19 +3,55 @@ Gestione dello stato conversazionale per il sistema multiagente
 Mantiene il contesto tra richieste successive
 """
 
+import threading
+import contextvars
+from contextlib import contextmanager
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 
+from logging_manager import get_logger
+
+
+logger = get_logger("conversation_manager")
+
+# Ramo parallelo di una query multipla in esecuzione nel contesto corrente (None = turno a un solo agente).
+# Le variabili di contesto si propagano ai thread dei nodi di LangGraph
+_branch: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("conversation_branch", default=None)
+
 
 class ConversationManager:
     """
     Gestisce lo stato conversazionale tra richieste multiple
     Permette agli agenti di ricordare richieste incomplete
+    Gli accessi sono protetti da un lock: i rami paralleli di una query multipla
+    e i turni concorrenti di sessioni diverse condividono lo stesso dizionario
     """
     
     def __init__(self):
         self.conversations: Dict[str, Dict[str, Any]] = {}
         self.session_timeout = timedelta(minutes=10)  # Timeout sessione: 10 minuti
+        self._lock = threading.RLock()
+    
+    @contextmanager
+    def parallel_branch(self, index: int):
+        """
+        Esegue il blocco come ramo parallelo di una query multipla
+        Per sessione c'è una sola richiesta in sospeso: se più rami chiedono
+        un'informazione mancante, la conserva il ramo con indice più basso
+        
+        Args:
+            index: Posizione della sotto-richiesta nella query
+            
+        Yields:
+            Il dizionario del ramo; "asked" è True se il ramo ha chiesto un'informazione
+            mancante (la richiesta in sospeso conservata è quella del ramo indicato in "branch")
+        """
+        branch = {"index": index, "asked": False}
+        token = _branch.set(branch)
+        try:
+            yield branch
+        finally:
+            _branch.reset(token)
     
     def get_session_id(self, user_id: str = "default") -> str:
         """Genera un ID sessione per l'utente"""
@@ -33,21 +69,21 @@ class ConversationManager:
         """
         session_id = self.get_session_id(session_id)
         
-        if session_id not in self.conversations:
-            print(f"[CONV_MGR] Nessuna conversazione per session {session_id}")
-            return False
-        
-        session = self.conversations[session_id]
-        
-        # Verifica timeout
-        if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
-            # Sessione scaduta
-            print(f"[CONV_MGR] Sessione scaduta per {session_id}")
-            del self.conversations[session_id]
-            return False
+        with self._lock:
+            session = self.conversations.get(session_id)
+            if session is None:
+                logger.debug("Nessuna conversazione per la sessione %s", session_id, extra={"session_id": session_id})
+                return False
+            
+            # Verifica timeout
+            if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
+                # Sessione scaduta
+                logger.debug("Sessione scaduta: %s", session_id, extra={"session_id": session_id})
+                del self.conversations[session_id]
+                return False
         
         result = session.get("pending", False)
-        print(f"[CONV_MGR] has_pending_request: {result}")
+        logger.debug("has_pending_request: %s", result, extra={"session_id": session_id})
         return result
     
     def get_pending_request(self, session_id: str = "default") -> Optional[Dict[str, Any]]:
@@ -63,23 +99,24 @@ class ConversationManager:
         session_id = self.get_session_id(session_id)
         
         # Controlla direttamente senza chiamare has_pending_request per evitare doppio prefisso
-        if session_id not in self.conversations:
-            print(f"[CONV_MGR] Nessuna conversazione per session {session_id}")
-            return None
-        
-        session = self.conversations[session_id]
-        
-        # Verifica timeout
-        if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
-            print(f"[CONV_MGR] Sessione scaduta in get_pending_request")
-            del self.conversations[session_id]
-            return None
+        with self._lock:
+            session = self.conversations.get(session_id)
+            if session is None:
+                logger.debug("Nessuna conversazione per la sessione %s", session_id, extra={"session_id": session_id})
+                return None
+            
+            # Verifica timeout
+            if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
+                logger.debug("Sessione scaduta in get_pending_request", extra={"session_id": session_id})
+                del self.conversations[session_id]
+                return None
         
         if not session.get("pending", False):
-            print(f"[CONV_MGR] Sessione non è pending")
+            logger.debug("La sessione non ha richieste in sospeso", extra={"session_id": session_id})
             return None
         
-        print(f"[CONV_MGR] Returning pending request: {session}")
+        # Il repr della sessione viene costruito solo se il livello DEBUG è attivo
+        logger.debug("Richiesta in sospeso restituita: %r", session, extra={"session_id": session_id})
         return session.copy()
     
     def save_pending_request(
@@ -89,7 +126,7 @@ class ConversationManager:
         missing_info: str,
         partial_data: Dict[str, Any],
         session_id: str = "default"
-    ):
+    ) -> bool:
         """
         Salva una richiesta incompleta
         
@@ -99,19 +136,44 @@ class ConversationManager:
             missing_info: Tipo di informazione mancante (location, zodiac_sign, etc.)
             partial_data: Dati già estratti dalla query
             session_id: ID della sessione
+            
+        Returns:
+            False se la richiesta non è stata salvata perché un ramo precedente
+            della stessa query multipla ne ha già salvata una
         """
         session_id = self.get_session_id(session_id)
+        branch = _branch.get()
+        
+        if branch is not None:
+            branch["asked"] = True
         
-        self.conversations[session_id] = {
-            "pending": True,
-            "agent_type": agent_type,
-            "original_query": original_query,
-            "missing_info": missing_info,
-            "partial_data": partial_data,
-            "timestamp": datetime.now()
-        }
+        with self._lock:
+            # Il router consuma la richiesta in sospeso prima degli agenti: una richiesta
+            # di un ramo già presente è stata salvata da un altro ramo dello stesso turno
+            current = self.conversations.get(session_id)
+            if (branch is not None and current is not None and current.get("branch") is not None
+                    and current["branch"] < branch["index"]):
+                logger.debug(
+                    "Richiesta in sospeso non salvata: il ramo %s ne ha già una", current["branch"],
+                    extra={"session_id": session_id, "agent": agent_type}
+                )
+                return False
+            
+            self.conversations[session_id] = {
+                "pending": True,
+                "agent_type": agent_type,
+                "original_query": original_query,
+                "missing_info": missing_info,
+                "partial_data": partial_data,
+                "branch": branch["index"] if branch is not None else None,
+                "timestamp": datetime.now()
+            }
         
-        print(f"[CONV_MGR] Salvata richiesta pendente: agente={agent_type}, manca={missing_info}")
+        logger.debug(
+            "Salvata richiesta in sospeso: agente=%s, manca=%s", agent_type, missing_info,
+            extra={"session_id": session_id, "agent": agent_type}
+        )
+        return True
     
     def complete_pending_request(
         self,
@@ -131,21 +193,24 @@ class ConversationManager:
         session_id = self.get_session_id(session_id)
         
         # Controlla direttamente senza chiamare has_pending_request per evitare doppio prefisso
-        if session_id not in self.conversations:
-            print(f"[CONV_MGR] Nessuna conversazione per session {session_id} in complete_pending_request")
-            return None
-        
-        session = self.conversations[session_id]
-        
-        # Verifica timeout
-        if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
-            print(f"[CONV_MGR] Sessione scaduta in complete_pending_request")
+        with self._lock:
+            session = self.conversations.get(session_id)
+            if session is None:
+                logger.debug("Nessuna conversazione per la sessione %s in complete_pending_request", session_id, extra={"session_id": session_id})
+                return None
+            
+            # Verifica timeout
+            if datetime.now() - session.get("timestamp", datetime.now()) > self.session_timeout:
+                logger.debug("Sessione scaduta in complete_pending_request", extra={"session_id": session_id})
+                del self.conversations[session_id]
+                return None
+            
+            if not session.get("pending", False):
+                logger.debug("La sessione non ha richieste in sospeso in complete_pending_request", extra={"session_id": session_id})
+                return None
+            
+            # La richiesta viene consumata una sola volta, anche con turni concorrenti
             del self.conversations[session_id]
-            return None
-        
-        if not session.get("pending", False):
-            print(f"[CONV_MGR] Sessione non è pending in complete_pending_request")
-            return None
         
         original_query = session.get("original_query", "")
         missing_info = session.get("missing_info", "")
@@ -166,9 +231,6 @@ class ConversationManager:
             # Fallback: aggiungi semplicemente la risposta alla query originale
             completed_query = f"{original_query} {user_response}"
         
-        # Pulisci la richiesta in sospeso
-        del self.conversations[session_id]
-        
         return completed_query
     
     def clear_pending_request(self, session_id: str = "default"):
@@ -180,8 +242,8 @@ class ConversationManager:
         """
         session_id = self.get_session_id(session_id)
         
-        if session_id in self.conversations:
-            del self.conversations[session_id]
+        with self._lock:
+            self.conversations.pop(session_id, None)
     
     def get_agent_type(self, session_id: str = "default") -> Optional[str]:
         """
@@ -193,23 +255,20 @@ class ConversationManager:
         Returns:
             Tipo di agente (WEATHER, HOROSCOPE, etc.) o None
         """
-        session_id = self.get_session_id(session_id)
-        
-        if not self.has_pending_request(session_id):
-            return None
-        
-        return self.conversations[session_id].get("agent_type")
+        pending = self.get_pending_request(session_id)
+        return pending.get("agent_type") if pending else None
     
     def cleanup_expired_sessions(self):
         """Pulisce le sessioni scadute"""
         now = datetime.now()
-        expired = [
-            sid for sid, session in self.conversations.items()
-            if now - session.get("timestamp", now) > self.session_timeout
-        ]
-        
-        for sid in expired:
-            del self.conversations[sid]
+        with self._lock:
+            expired = [
+                sid for sid, session in self.conversations.items()
+                if now - session.get("timestamp", now) > self.session_timeout
+            ]
+            
+            for sid in expired:
+                del self.conversations[sid]
 
 
 # Istanza globale del conversation manager
@@ -0,0 +1,119 @@
+"""
+Budget di latenza per turno (deadline) propagato a tutti i nodi
+run_supervisor fissa la scadenza del turno; nodi, chiamate HTTP e chiamate LLM
+ne ricavano il proprio timeout, così la somma delle attese non supera il budget
+"""
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+
+# Budget di default per turno in secondi (ALEXA_TURN_DEADLINE_S, 0 = nessun limite)
+DEFAULT_TURN_DEADLINE_S = 10.0
+
+# Scadenza del turno corrente (istante di time.monotonic()), None = nessun limite.
+# Le variabili di contesto si propagano ai thread dei nodi di LangGraph
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("turn_deadline", default=None)
+
+# Indica se nel turno corrente almeno un nodo ha sforato la scadenza o è stato saltato
+_degraded: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("turn_degraded", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Il budget di latenza del turno è esaurito"""
+
+
+def turn_budget() -> Optional[float]:
+    """
+    Budget di latenza configurato per turno
+
+    Returns:
+        I secondi a disposizione, oppure None se il limite è disattivato
+    """
+    budget = float(os.getenv("ALEXA_TURN_DEADLINE_S", DEFAULT_TURN_DEADLINE_S))
+    return budget if budget > 0 else None
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Calcola la scadenza a `seconds` secondi da ora (None = nessun limite)"""
+    return None if seconds is None else time.monotonic() + seconds
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """
+    Imposta la scadenza per il blocco (un turno di conversazione)
+
+    Args:
+        deadline: Istante di scadenza (time.monotonic()), oppure None
+
+    Yields:
+        La lista degli eventi di degradazione del turno (nodi saltati o in ritardo)
+    """
+    events: list = []
+    deadline_token = _deadline.set(deadline)
+    degraded_token = _degraded.set(events)
+    try:
+        yield events
+    finally:
+        _deadline.reset(deadline_token)
+        _degraded.reset(degraded_token)
+
+
+def remaining() -> Optional[float]:
+    """Secondi rimanenti prima della scadenza (None = nessun limite)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """Indica se la scadenza del turno è passata"""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def stage_timeout(cap: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout di una fase (chiamata HTTP o LLM) ricavato dalla scadenza del turno
+
+    Args:
+        cap: Timeout massimo della fase indipendentemente dal budget
+
+    Returns:
+        Il minimo tra cap e il tempo rimanente (None se non c'è né l'uno né l'altro)
+
+    Raises:
+        DeadlineExceeded: Se la scadenza è già passata
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("Tempo a disposizione per la risposta esaurito")
+    return left if cap is None else min(cap, left)
+
+
+def is_timeout(error: BaseException) -> bool:
+    """
+    Indica se un errore è un timeout del client (TimeoutError, requests, httpx o OpenAI)
+
+    Args:
+        error: L'eccezione sollevata dalla chiamata
+
+    Returns:
+        True se l'errore o una sua classe base è un timeout
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    # I client HTTP e OpenAI hanno gerarchie proprie (es. APITimeoutError, ReadTimeout)
+    return any("Timeout" in cls.__name__ for cls in type(error).__mro__)
+
+
+def mark_degraded(agent: str, node: str, reason: str):
+    """Registra che un nodo del turno è stato saltato o ha sforato la scadenza"""
+    events = _degraded.get()
+    if events is not None:
+        events.append({"agent": agent, "node": node, "reason": reason})
@@ -3,9 +3,12 @@ Interfaccia Gradio per testare il sistema multiagente
 Fornisce una UI web interattiva per chattare con Alexa
 """
 
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
 import gradio as gr
-from multiagent import run_supervisor, build_supervisor_agent
 from conversation_manager import conversation_manager
+from metrics import start_metrics_server
 import os
 from dotenv import load_dotenv
 
@@ -71,7 +74,22 @@ def generate_agent_graph(agent_name):
         return None, f"❌ Errore nella generazione: {str(e)}"
 
 
-def chat_with_alexa(message, history):
+def get_session_key(request: gr.Request | None) -> str:
+    """
+    Restituisce l'ID della conversazione per la sessione Gradio corrente
+    
+    Args:
+        request: Richiesta Gradio (iniettata automaticamente)
+        
+    Returns:
+        L'hash della sessione del browser, oppure "default" fuori da Gradio
+    """
+    if request is not None and getattr(request, "session_hash", None):
+        return request.session_hash
+    return "default"
+
+
+def chat_with_alexa(message, history, request: gr.Request = None):
     """
     Gestisce la conversazione con Alexa mostrando il reasoning durante l'elaborazione
     e poi solo il risultato finale
@@ -79,6 +97,7 @@ def chat_with_alexa(message, history):
     Args:
         message: Messaggio dell'utente
         history: Storia della conversazione (lista di dizionari con 'role' e 'content')
+        request: Richiesta Gradio, usata per separare le richieste in sospeso per sessione
         
     Yields:
         Tupla (stringa vuota, history aggiornata) durante il processing
@@ -97,8 +116,28 @@ def chat_with_alexa(message, history):
         temp_history.append({"role": "assistant", "content": "🔄 Elaborazione in corso..."})
         yield "", temp_history
         
-        # Esegui il supervisore
-        result = run_supervisor(message.strip())
+        # Esegui il supervisore (il sistema multiagente è caricato alla prima richiesta) in un
+        # thread: le risposte parziali (es. i primi blocchi di una traduzione lunga) sono
+        # mostrate mentre il turno è ancora in corso
+        from multiagent import run_supervisor
+        from partial_response import partial_listener
+        
+        session_key = get_session_key(request)
+        partials = queue.Queue()
+        
+        def run_turn():
+            with partial_listener(partials.put):
+                return run_supervisor(message.strip(), session_id=session_key)
+        
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(run_turn)
+            # Fine del turno: None chiude l'attesa dopo l'ultima risposta parziale
+            future.add_done_callback(lambda _: partials.put(None))
+            while (partial := partials.get()) is not None:
+                temp_history = history.copy()
+                temp_history.append({"role": "assistant", "content": partial})
+                yield "", temp_history
+        result = future.result()
         
         # Estrai tutti i messaggi per il reasoning
         all_messages = []
@@ -151,9 +190,9 @@ def chat_with_alexa(message, history):
         return "", history
 
 
-def clear_conversation():
+def clear_conversation(request: gr.Request = None):
     """Pulisce la conversazione e le richieste pendenti"""
-    conversation_manager.clear_pending_request()
+    conversation_manager.clear_pending_request(get_session_key(request))
     return []
 
 
@@ -223,8 +262,11 @@ def create_interface():
                             examples=[
                                 ["Che tempo fa a Milano domani?"],
                                 ["Che tempo fa?"],
+                                ["Che tempo fa a Roma, Milano e Napoli domani?"],
+                                ["Pioverà stasera a Bologna?"],
                                 ["Qual è l'oroscopo dell'ariete oggi?"],
                                 ["Oroscopo della settimana"],
+                                ["Oroscopo di ariete, leone e pesci"],
                                 ["Chi era Leonardo da Vinci?"],
                                 ["Cos'è la fotosintesi?"],
                                 ["Quanto fa 23 * 45?"],
@@ -264,7 +306,8 @@ def create_interface():
                 submit_btn.click(
                     fn=chat_with_alexa,
                     inputs=[msg, chatbot],
-                    outputs=[msg, chatbot]
+                    outputs=[msg, chatbot],
+                    api_name="chat"
                 )
                 
                 msg.submit(
@@ -349,7 +392,8 @@ def create_interface():
             Assicurati di avere configurato la tua `OPENAI_API_KEY` nel file `.env`
             
             ### Debug
-            I log di debug vengono stampati nella console dove hai avviato l'applicazione.
+            I log (JSON, uno per riga) vengono stampati nella console dove hai avviato l'applicazione.
+            Per attivare il livello di debug imposta `ALEXA_LOG_LEVEL=DEBUG`.
             """
         )
     
@@ -371,6 +415,9 @@ def main():
     
     demo = create_interface()
     
+    # Espone le metriche di latenza su /metrics (porta configurabile con ALEXA_METRICS_PORT)
+    start_metrics_server()
+    
     print("\nInterfaccia creata con successo!")
     print("\nL'interfaccia web si aprirà automaticamente nel browser")
     print("   Se non si apre, usa l'URL mostrato qui sotto\n")
@@ -0,0 +1,203 @@
+"""
+Rendering locale dei grafi degli agenti (networkx + matplotlib)
+Sostituisce draw_mermaid_png, che chiama un servizio remoto. Diagramma
+Mermaid (.md) e immagine (.png) sono rigenerati solo se la struttura del
+grafo è cambiata: l'impronta della struttura è salvata nel file .md
+"""
+
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from logging_manager import get_logger
+
+
+logger = get_logger("graph_rendering")
+
+# Da incrementare quando cambia il disegno, per invalidare le immagini già generate
+RENDERER_VERSION = 1
+
+SIGNATURE_PATTERN = re.compile(r"<!-- graph-signature: ([0-9a-f]+) -->")
+MERMAID_PATTERN = re.compile(r"```mermaid\n(.*?)\n```", re.DOTALL)
+
+START_NODE = "__start__"
+END_NODE = "__end__"
+
+# Evita che due richieste contemporanee scrivano gli stessi file
+_render_lock = threading.Lock()
+
+
+def graph_signature(graph) -> str:
+    """
+    Calcola l'impronta della struttura di un grafo LangGraph
+
+    Args:
+        graph: Il grafo restituito da CompiledGraph.get_graph()
+
+    Returns:
+        L'hash SHA-256 di nodi e archi (con i rami condizionali)
+    """
+    structure = {
+        "renderer": RENDERER_VERSION,
+        "nodes": sorted(graph.nodes),
+        "edges": sorted(
+            (edge.source, edge.target, bool(edge.conditional), str(edge.data or ""))
+            for edge in graph.edges
+        ),
+    }
+    return hashlib.sha256(json.dumps(structure).encode("utf-8")).hexdigest()
+
+
+def _layered_positions(nodes: list, edges: list) -> dict:
+    """Dispone i nodi per livelli (distanza da __start__), dall'alto verso il basso"""
+    successors: Dict[str, list] = {node: [] for node in nodes}
+    for source, target in edges:
+        successors[source].append(target)
+
+    depth = {START_NODE: 0} if START_NODE in successors else {}
+    frontier = list(depth)
+    while frontier:
+        following = []
+        for node in frontier:
+            for target in successors[node]:
+                if target not in depth and target != END_NODE:
+                    depth[target] = depth[node] + 1
+                    following.append(target)
+        frontier = following
+
+    last = max(depth.values(), default=0)
+    for node in nodes:
+        if node == END_NODE:
+            depth[node] = last + 1
+        elif node not in depth:
+            depth[node] = last + 1
+
+    levels: Dict[int, list] = {}
+    for node in nodes:
+        levels.setdefault(depth[node], []).append(node)
+
+    positions = {}
+    for level, members in levels.items():
+        for index, node in enumerate(sorted(members)):
+            positions[node] = (index - (len(members) - 1) / 2, -level)
+    return positions
+
+
+def render_png(graph, png_path: str, title: str):
+    """
+    Disegna il grafo con networkx e matplotlib e lo salva in PNG
+
+    Args:
+        graph: Il grafo restituito da CompiledGraph.get_graph()
+        png_path: Percorso dell'immagine
+        title: Titolo del diagramma
+    """
+    # Import al primo utilizzo: networkx e matplotlib sono lenti da caricare.
+    # Si usa Figure senza pyplot, così non serve un backend grafico e il rendering è thread-safe
+    import networkx as nx
+    from matplotlib.figure import Figure
+
+    nodes = list(graph.nodes)
+    edges = [(edge.source, edge.target) for edge in graph.edges]
+    conditional = [(edge.source, edge.target) for edge in graph.edges if edge.conditional]
+    direct = [edge for edge in edges if edge not in conditional]
+
+    digraph = nx.DiGraph()
+    digraph.add_nodes_from(nodes)
+    digraph.add_edges_from(edges)
+    positions = _layered_positions(nodes, edges)
+
+    levels = [y for _, y in positions.values()]
+    widest = max(levels.count(level) for level in levels)
+    width = max(6.0, 2.2 * widest)
+    height = max(4.0, 1.4 * (1 - min(levels)))
+    figure = Figure(figsize=(width, height), dpi=100)
+    axes = figure.subplots()
+    axes.set_title(title)
+    axes.axis("off")
+
+    terminals = [node for node in nodes if node in (START_NODE, END_NODE)]
+    steps = [node for node in nodes if node not in terminals]
+    nx.draw_networkx_nodes(digraph, positions, nodelist=steps, node_color="#f2f0ff",
+                           edgecolors="#6c5ce7", node_size=2600, node_shape="s", ax=axes)
+    nx.draw_networkx_nodes(digraph, positions, nodelist=terminals, node_color="#dfe6e9",
+                           edgecolors="#636e72", node_size=1600, ax=axes)
+    nx.draw_networkx_edges(digraph, positions, edgelist=direct, arrows=True, arrowsize=15,
+                           node_size=2600, ax=axes)
+    nx.draw_networkx_edges(digraph, positions, edgelist=conditional, arrows=True, arrowsize=15,
+                           style="dashed", edge_color="#6c5ce7", node_size=2600, ax=axes)
+    # I nomi lunghi vanno a capo sui trattini bassi per restare dentro i nodi
+    labels = {node: node.strip("_").replace("_", "\n") if len(node) > 12 else node.strip("_") for node in nodes}
+    nx.draw_networkx_labels(digraph, positions, labels=labels, font_size=8, ax=axes)
+    axes.margins(x=0.12, y=0.08)
+
+    figure.tight_layout()
+    figure.savefig(png_path)
+
+
+def _read_cached(md_path: Path) -> tuple:
+    """Legge impronta e codice Mermaid da un file .md generato in precedenza"""
+    try:
+        text = md_path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None, None
+    signature = SIGNATURE_PATTERN.search(text)
+    mermaid = MERMAID_PATTERN.search(text)
+    return (signature.group(1) if signature else None), (mermaid.group(1) if mermaid else None)
+
+
+def render_graph_files(compiled_graph, name: str, title: str, description: Optional[str] = None) -> dict:
+    """
+    Genera il diagramma Mermaid (.md) e l'immagine (.png) di un grafo, se la sua struttura è cambiata
+
+    Args:
+        compiled_graph: Il grafo compilato dell'agente
+        name: Nome base dei file (es. "weather_agent_graph")
+        title: Titolo del diagramma
+        description: Testo introduttivo opzionale del file .md
+
+    Returns:
+        Dizionario con "mermaid" (codice del diagramma), "md_path", "png_path"
+        (None se l'immagine non è stata generata) e "cached" (True se i file erano già aggiornati)
+    """
+    graph = compiled_graph.get_graph()
+    signature = graph_signature(graph)
+    md_path = Path(f"{name}.md")
+    png_path = Path(f"{name}.png")
+
+    with _render_lock:
+        cached_signature, cached_mermaid = _read_cached(md_path)
+        if cached_signature == signature and cached_mermaid is not None and png_path.exists():
+            return {"mermaid": cached_mermaid, "md_path": str(md_path), "png_path": str(png_path), "cached": True}
+
+        mermaid_code = graph.draw_mermaid()
+        try:
+            render_png(graph, str(png_path), title)
+            rendered = True
+        except Exception as e:
+            logger.warning("Immagine del grafo %s non generata: %s", name, e)
+            # Un'immagine precedente non corrisponde più alla struttura del grafo
+            png_path.unlink(missing_ok=True)
+            rendered = False
+
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n")
+            if description:
+                f.write(f"{description}\n\n")
+            # Senza immagine l'impronta non viene salvata: la prossima richiesta riprova
+            if rendered:
+                f.write(f"<!-- graph-signature: {signature} -->\n")
+            f.write("```mermaid\n")
+            f.write(mermaid_code)
+            f.write("\n```\n")
+
+        logger.info("Grafo %s generato (struttura %s)", name, signature[:12])
+        return {
+            "mermaid": mermaid_code,
+            "md_path": str(md_path),
+            "png_path": str(png_path) if rendered else None,
+            "cached": False
+        }
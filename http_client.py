@@ -0,0 +1,193 @@
+"""
+Livello HTTP condiviso per le chiamate REST degli agenti
+Un'unica sessione con pool di connessioni per host e keep-alive evita di
+aprire una nuova connessione TCP+TLS a ogni chiamata verso Nominatim,
+Open-Meteo, l'API Horoscope e Wikipedia. Se sono installati httpx e h2
+le richieste usano HTTP/2 dove il server lo supporta
+"""
+
+import os
+import time
+import threading
+from types import SimpleNamespace
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics_registry, Histogram
+from deadline import stage_timeout, expired, DeadlineExceeded
+from logging_manager import get_logger
+
+
+logger = get_logger("http_client")
+
+# Host distinti con un pool di connessioni e connessioni conservate per host
+POOL_CONNECTIONS = int(os.getenv("ALEXA_HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.getenv("ALEXA_HTTP_POOL_MAXSIZE", "20"))
+
+# HTTP/2 con httpx (pip install "httpx[http2]"): "auto" lo usa se disponibile, "0" lo disattiva
+HTTP2_MODE = os.getenv("ALEXA_HTTP2", "auto").lower()
+
+USER_AGENT = "AlexaAgent/1.0"
+
+_session: Optional[requests.Session] = None
+_http2_client: Any = None
+_http2_checked = False
+_lock = threading.Lock()
+
+
+def http_request_latency() -> Histogram:
+    """Durata delle richieste HTTP per host e protocollo"""
+    return metrics_registry.histogram(
+        "alexa_http_request_seconds",
+        "Durata delle richieste HTTP verso i servizi esterni",
+        ("host", "protocol")
+    )
+
+
+def mount_pool(session: requests.Session, max_retries: Any = 0) -> requests.Session:
+    """
+    Monta sulla sessione gli adapter con il pool di connessioni configurato
+
+    Args:
+        session: La sessione da configurare (anche una sessione con cache)
+        max_retries: Numero di tentativi o oggetto urllib3 Retry
+
+    Returns:
+        La stessa sessione
+    """
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Restituisce (creandola al primo utilizzo) la sessione HTTP condivisa"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = mount_pool(requests.Session())
+                session.headers["User-Agent"] = USER_AGENT
+                _session = session
+    return _session
+
+
+def _get_http2_client():
+    """Client httpx con HTTP/2, oppure None se disattivato o se mancano httpx/h2"""
+    global _http2_client, _http2_checked
+    if not _http2_checked:
+        with _lock:
+            if not _http2_checked:
+                if HTTP2_MODE not in ("0", "false", "no"):
+                    try:
+                        import httpx
+                        import h2  # noqa: F401 (necessario per http2=True)
+
+                        _http2_client = httpx.Client(
+                            http2=True,
+                            headers={"User-Agent": USER_AGENT},
+                            limits=httpx.Limits(
+                                max_connections=POOL_CONNECTIONS * POOL_MAXSIZE,
+                                max_keepalive_connections=POOL_MAXSIZE
+                            ),
+                        )
+                    except ImportError:
+                        logger.info("httpx/h2 non installati: richieste HTTP/1.1 con keep-alive")
+                _http2_checked = True
+    return _http2_client
+
+
+def _as_requests_response(response) -> requests.Response:
+    """Converte una risposta httpx in requests.Response, così i chiamanti gestiscono un solo tipo"""
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted._content = response.content
+    converted.headers.update(response.headers)
+    converted.url = str(response.url)
+    converted.reason = response.reason_phrase
+    converted.encoding = response.encoding
+    return converted
+
+
+def _http2_get(client, url: str, params: Optional[dict], headers: Optional[dict],
+               timeout: Optional[float]) -> requests.Response:
+    """Esegue la richiesta con httpx traducendo gli errori in quelli di requests"""
+    import httpx
+
+    try:
+        response = client.get(url, params=params, headers=headers, timeout=timeout)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    return _as_requests_response(response)
+
+
+def http_get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+             timeout: Optional[float] = None) -> requests.Response:
+    """
+    Esegue una GET riusando le connessioni aperte verso lo stesso host
+
+    Args:
+        url: URL della richiesta
+        params: Parametri della query string
+        headers: Header aggiuntivi
+        timeout: Timeout in secondi
+
+    Returns:
+        La risposta (requests.Response anche quando la richiesta usa HTTP/2)
+
+    Raises:
+        DeadlineExceeded: Se la richiesta va in timeout dopo la scadenza del turno
+    """
+    client = _get_http2_client()
+    start = time.perf_counter()
+    try:
+        if client is not None:
+            response = _http2_get(client, url, params, headers, timeout)
+            protocol = "http2"
+        else:
+            response = get_session().get(url, params=params, headers=headers, timeout=timeout)
+            protocol = "http1.1"
+    except requests.exceptions.Timeout as e:
+        # Il timeout era il tempo rimanente del turno: non è un guasto del servizio
+        if expired():
+            raise DeadlineExceeded(f"Tempo per la risposta esaurito in attesa di {urlparse(url).netloc}") from e
+        raise
+    http_request_latency().observe(time.perf_counter() - start, host=urlparse(url).netloc, protocol=protocol)
+    return response
+
+
+class TimeoutSession:
+    """
+    Vista su una sessione condivisa che applica un timeout a ogni GET
+    Serve ai client (es. openmeteo_requests) che non accettano un timeout e
+    chiudono la propria sessione quando vengono distrutti: close non ha effetto
+    """
+
+    def __init__(self, session: requests.Session, timeout: Optional[float]):
+        self.session = session
+        self.timeout = timeout
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        response = self.session.get(url, **kwargs)
+        http_request_latency().observe(time.perf_counter() - start, host=urlparse(url).netloc, protocol="http1.1")
+        return response
+
+    def close(self):
+        """La sessione condivisa resta aperta"""
+
+
+def _wikipedia_get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None, **kwargs) -> requests.Response:
+    """GET della libreria wikipedia, con il pool condiviso e il timeout ricavato dalla scadenza del turno"""
+    return http_get(url, params=params, headers=headers, timeout=stage_timeout(10))
+
+
+# Sostituto del modulo requests per la libreria wikipedia, che usa solo requests.get
+wikipedia_requests = SimpleNamespace(get=_wikipedia_get)
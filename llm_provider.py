@@ -0,0 +1,51 @@
+"""
+Provider del chat model usato da supervisore e agenti
+Centralizza la creazione del modello e permette di sostituirlo (es. con un modello finto nei benchmark)
+"""
+
+import os
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+
+# Carica le variabili d'ambiente
+load_dotenv()
+
+# Modello di default usato da tutti gli agenti
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+_llm_factory: Optional[Callable[..., Any]] = None
+
+
+def set_llm_factory(factory: Optional[Callable[..., Any]]):
+    """
+    Sostituisce la factory del chat model
+
+    Args:
+        factory: Callable che accetta `temperature` e restituisce un chat model,
+                 oppure None per tornare a OpenAI
+    """
+    global _llm_factory
+    _llm_factory = factory
+
+
+def get_llm(temperature: float = 0) -> Any:
+    """
+    Restituisce il chat model configurato
+
+    Args:
+        temperature: Temperatura di campionamento
+
+    Returns:
+        Un chat model LangChain
+    """
+    if _llm_factory is not None:
+        return _llm_factory(temperature=temperature)
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=DEFAULT_MODEL,
+        temperature=temperature,
+        api_key=os.getenv("OPENAI_API_KEY")
+    )
@@ -0,0 +1,434 @@
+"""
+Contabilità dei token e dei costi delle chiamate LLM
+Registra l'uso di ogni chiamata, lo aggrega per turno e mantiene i totali per agente e per prompt
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from logging_manager import get_logger, get_file_logger
+from metrics import metrics_registry
+from singleflight import llm_flight
+from deadline import stage_timeout, is_timeout, DeadlineExceeded
+from circuit_breaker import get_breaker, CircuitOpenError
+
+
+logger = get_logger("llm_usage")
+
+# Timeout massimo di una chiamata LLM in secondi (ALEXA_LLM_TIMEOUT_S, 0 = nessun limite).
+# Solo i timeout che raggiungono questo limite contano come guasti del provider
+LLM_TIMEOUT_S = float(os.getenv("ALEXA_LLM_TIMEOUT_S", "30")) or None
+
+# Prezzi in USD per 1000 token (input, output)
+MODEL_PRICES_PER_1K = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+}
+
+# Categorie di prompt usate nei report
+PROMPT_ROUTING = "routing"
+PROMPT_EXTRACTION = "extraction"
+PROMPT_ANSWER = "answer"
+
+_turn_records: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("llm_turn_records", default=None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Stima il costo di una chiamata in USD
+
+    Args:
+        model: Nome del modello restituito dal provider
+        prompt_tokens: Token di input
+        completion_tokens: Token di output
+
+    Returns:
+        Il costo stimato (0 se il modello non è in listino)
+    """
+    # I nomi restituiti dal provider possono avere un suffisso di versione (es. gpt-3.5-turbo-0125)
+    for name in sorted(MODEL_PRICES_PER_1K, key=len, reverse=True):
+        if model.startswith(name):
+            price_in, price_out = MODEL_PRICES_PER_1K[name]
+            return (prompt_tokens * price_in + completion_tokens * price_out) / 1000
+    return 0.0
+
+
+def _extract_usage(response: Any) -> Dict[str, int]:
+    """Estrae i conteggi dei token dalla risposta del chat model"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+        }
+
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return {
+        "prompt_tokens": token_usage.get("prompt_tokens", 0),
+        "completion_tokens": token_usage.get("completion_tokens", 0),
+    }
+
+
+def _empty_summary() -> dict:
+    """Totali a zero di un gruppo di chiamate"""
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cost_usd": 0.0,
+        "latency_ms": 0.0,
+    }
+
+
+def _accumulate(summary: dict, other: dict):
+    """Somma a summary un record di utilizzo o un altro riepilogo"""
+    summary["calls"] += other.get("calls", 1)
+    summary["prompt_tokens"] += other["prompt_tokens"]
+    summary["completion_tokens"] += other["completion_tokens"]
+    summary["total_tokens"] += other["prompt_tokens"] + other["completion_tokens"]
+    summary["cost_usd"] += other["cost_usd"]
+    summary["latency_ms"] += other["latency_ms"]
+
+
+def _rounded(summary: dict) -> dict:
+    """Copia del riepilogo con costo e latenza arrotondati"""
+    return dict(summary, cost_usd=round(summary["cost_usd"], 6), latency_ms=round(summary["latency_ms"], 2))
+
+
+def _summarize_groups(groups: Dict[tuple, dict]) -> dict:
+    """Riepilogo con il dettaglio per agente e per prompt a partire dai totali per (agente, prompt)"""
+    total = _empty_summary()
+    by_agent: Dict[str, dict] = {}
+    for (agent, _), group in groups.items():
+        _accumulate(total, group)
+        _accumulate(by_agent.setdefault(agent, _empty_summary()), group)
+
+    summary = _rounded(total)
+    summary["by_agent"] = {agent: _rounded(group) for agent, group in by_agent.items()}
+    summary["by_prompt"] = {f"{agent}/{prompt}": _rounded(group) for (agent, prompt), group in groups.items()}
+    return summary
+
+
+def summarize_records(records: List[dict]) -> dict:
+    """
+    Riassume i record di utilizzo con il dettaglio per agente e per prompt
+
+    Args:
+        records: Record prodotti da UsageTracker
+
+    Returns:
+        Dizionario con i totali e le suddivisioni "by_agent" e "by_prompt"
+    """
+    groups: Dict[tuple, dict] = {}
+    for record in records:
+        _accumulate(groups.setdefault((record["agent"], record["prompt"]), _empty_summary()), record)
+    return _summarize_groups(groups)
+
+
+class UsageTracker:
+    """
+    Mantiene i totali progressivi dell'uso LLM per agente e per prompt
+    Se la variabile ALEXA_USAGE_LOG è impostata, ogni chiamata viene anche
+    accodata in formato JSONL al file indicato, da un thread dedicato
+    """
+
+    def __init__(self):
+        # (agente, prompt) -> totali: la memoria non cresce con il numero di chiamate
+        self._groups: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+        self.log_path = os.getenv("ALEXA_USAGE_LOG")
+        self._usage_log = get_file_logger("usage_log", self.log_path) if self.log_path else None
+
+    def record(self, agent: str, prompt: str, model: str, prompt_tokens: int,
+               completion_tokens: int, latency_ms: float) -> dict:
+        """
+        Registra una chiamata LLM
+
+        Args:
+            agent: Agente che ha effettuato la chiamata (es. "WEATHER")
+            prompt: Categoria del prompt (routing, extraction, answer)
+            model: Modello usato
+            prompt_tokens: Token di input
+            completion_tokens: Token di output
+            latency_ms: Durata della chiamata in millisecondi
+
+        Returns:
+            Il record registrato
+        """
+        entry = {
+            "ts": time.time(),
+            "agent": agent,
+            "prompt": prompt,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_ms": round(latency_ms, 2),
+            "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+        }
+
+        with self._lock:
+            _accumulate(self._groups.setdefault((agent, prompt), _empty_summary()), entry)
+        if self._usage_log is not None:
+            # La scrittura avviene nel thread del listener, fuori dal percorso critico
+            self._usage_log.info(json.dumps(entry))
+
+        turn_records = _turn_records.get()
+        if turn_records is not None:
+            turn_records.append(entry)
+
+        tokens = metrics_registry.counter(
+            "alexa_llm_tokens_total", "Token consumati dalle chiamate LLM", ("agent", "prompt", "kind")
+        )
+        tokens.inc(prompt_tokens, agent=agent, prompt=prompt, kind="prompt")
+        tokens.inc(completion_tokens, agent=agent, prompt=prompt, kind="completion")
+
+        logger.debug(
+            "Chiamata LLM %s/%s: %s+%s token", prompt, model, prompt_tokens, completion_tokens,
+            extra={"agent": agent, "latency_ms": entry["latency_ms"]}
+        )
+        return entry
+
+    def totals(self) -> dict:
+        """Totali progressivi con suddivisione per agente e per prompt"""
+        with self._lock:
+            groups = {key: dict(group) for key, group in self._groups.items()}
+        return _summarize_groups(groups)
+
+    def reset(self):
+        """Azzera i totali progressivi"""
+        with self._lock:
+            self._groups.clear()
+
+
+# Istanza globale del tracker di utilizzo
+usage_tracker = UsageTracker()
+
+
+def _invoke_within_budget(llm: Any, messages: list, timeout: Optional[float]) -> Any:
+    """
+    Invoca il chat model con il timeout della fase
+    Se il timeout è stato ridotto dal tempo rimanente del turno, il timeout del client
+    diventa DeadlineExceeded: è il turno ad aver esaurito il budget, non il provider
+    a essere lento, e il circuit breaker non lo conta come guasto
+
+    Args:
+        llm: Il chat model LangChain
+        messages: Messaggi da inviare
+        timeout: Timeout della chiamata (None = nessun limite)
+
+    Returns:
+        La risposta del modello
+    """
+    if timeout is None:
+        return llm.invoke(messages)
+    try:
+        return llm.invoke(messages, timeout=timeout)
+    except Exception as e:
+        if is_timeout(e) and (LLM_TIMEOUT_S is None or timeout < LLM_TIMEOUT_S):
+            raise DeadlineExceeded("Tempo a disposizione per la risposta esaurito durante la chiamata LLM") from e
+        raise
+
+
+def invoke_llm(llm: Any, messages: list, agent: str, prompt: str) -> Any:
+    """
+    Invoca il chat model registrando token, modello e latenza della chiamata
+
+    Args:
+        llm: Il chat model LangChain
+        messages: Messaggi da inviare
+        agent: Agente che effettua la chiamata
+        prompt: Categoria del prompt (routing, extraction, answer)
+
+    Returns:
+        La risposta del modello
+    """
+    # Le chiamate identiche in corso (stesso modello, temperatura e messaggi) condividono
+    # una sola richiesta al provider; solo la chiamata effettiva viene contabilizzata
+    key = (
+        getattr(llm, "model_name", None),
+        getattr(llm, "temperature", None),
+        tuple((message.type, message.content) for message in messages)
+    )
+    # Il timeout della chiamata è il minimo tra il limite per chiamata e il tempo rimanente del turno
+    timeout = stage_timeout(LLM_TIMEOUT_S)
+    start = time.perf_counter()
+    # Con il circuito del provider aperto la chiamata fallisce subito (CircuitOpenError)
+    response, coalesced = llm_flight.do(
+        key, get_breaker("openai").call, _invoke_within_budget, llm, messages, timeout
+    )
+    latency_ms = (time.perf_counter() - start) * 1000
+    if coalesced:
+        return response
+
+    usage = _extract_usage(response)
+    model = (
+        (getattr(response, "response_metadata", None) or {}).get("model_name")
+        or getattr(llm, "model_name", None)
+        or "sconosciuto"
+    )
+    usage_tracker.record(agent, prompt, model, usage["prompt_tokens"], usage["completion_tokens"], latency_ms)
+
+    return response
+
+
+def describe_llm_error(error: Exception) -> str:
+    """
+    Messaggio per l'utente relativo a un errore di una chiamata LLM, in base al tipo di errore
+
+    Args:
+        error: L'eccezione sollevata dalla chiamata (o dall'interpretazione della risposta)
+
+    Returns:
+        La descrizione dell'errore; il suggerimento sulla API key solo per gli errori di autenticazione
+    """
+    if isinstance(error, DeadlineExceeded):
+        return "tempo a disposizione per la risposta esaurito"
+    if isinstance(error, CircuitOpenError):
+        return str(error)
+    if is_timeout(error):
+        return "il servizio OpenAI non ha risposto in tempo"
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status in (401, 403) or "Authentication" in type(error).__name__:
+        return f"{error}. Controlla la tua API key di OpenAI."
+    if isinstance(error, ValueError):
+        # Comprende json.JSONDecodeError: il modello non ha risposto nel formato atteso
+        return f"risposta del modello non valida ({error})"
+    return str(error)
+
+
+def _batch_within_budget(llm: Any, batch: List[list], max_concurrency: int, timeout: Optional[float]) -> List[Any]:
+    """
+    Esegue `llm.batch` con il timeout della fase, restituendo le eccezioni delle singole chiamate
+    Se tutte le chiamate falliscono l'errore viene sollevato, così il circuit breaker lo conta;
+    un timeout ridotto dal budget diventa DeadlineExceeded come in _invoke_within_budget
+
+    Args:
+        llm: Il chat model LangChain
+        batch: Una lista di messaggi per ogni chiamata
+        max_concurrency: Numero massimo di chiamate contemporanee
+        timeout: Timeout di ogni chiamata (None = nessun limite)
+
+    Returns:
+        Le risposte nello stesso ordine di `batch`, con le eccezioni delle chiamate fallite
+    """
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    responses = llm.batch(batch, config={"max_concurrency": max_concurrency}, return_exceptions=True, **kwargs)
+
+    failures = [response for response in responses if isinstance(response, Exception)]
+    if failures and len(failures) == len(responses):
+        error = failures[0]
+        if timeout is not None and is_timeout(error) and (LLM_TIMEOUT_S is None or timeout < LLM_TIMEOUT_S):
+            raise DeadlineExceeded("Tempo a disposizione esaurito durante le chiamate LLM raggruppate") from error
+        raise error
+    return responses
+
+
+def invoke_llm_batch(llm: Any, batch: List[list], agent: str, prompt: str, max_concurrency: int = 4) -> List[Any]:
+    """
+    Invoca il chat model su più liste di messaggi con `llm.batch`, registrando ogni chiamata
+    I provider che supportano richieste multiple le raggruppano, gli altri le eseguono
+    in parallelo con al massimo `max_concurrency` chiamate contemporanee.
+    Come invoke_llm, ogni chiamata ha come timeout il minimo tra il limite per chiamata e
+    il tempo rimanente della scadenza corrente, e il gruppo passa dal circuit breaker del provider
+
+    Args:
+        llm: Il chat model LangChain
+        batch: Una lista di messaggi per ogni chiamata
+        agent: Agente che effettua le chiamate
+        prompt: Categoria del prompt (routing, extraction, answer)
+        max_concurrency: Numero massimo di chiamate contemporanee
+
+    Returns:
+        Le risposte nello stesso ordine di `batch`; una chiamata fallita restituisce l'eccezione
+
+    Raises:
+        CircuitOpenError: Se il circuito del provider è aperto
+        DeadlineExceeded: Se la scadenza è passata o tutte le chiamate l'hanno superata
+    """
+    if not batch:
+        return []
+
+    timeout = stage_timeout(LLM_TIMEOUT_S)
+    start = time.perf_counter()
+    responses = get_breaker("openai").call(_batch_within_budget, llm, batch, max_concurrency, timeout)
+    # La durata delle singole chiamate non è disponibile: si attribuisce la media del gruppo
+    latency_ms = (time.perf_counter() - start) * 1000 / len(batch)
+
+    for response in responses:
+        if isinstance(response, Exception):
+            continue
+        usage = _extract_usage(response)
+        model = (
+            (getattr(response, "response_metadata", None) or {}).get("model_name")
+            or getattr(llm, "model_name", None)
+            or "sconosciuto"
+        )
+        usage_tracker.record(agent, prompt, model, usage["prompt_tokens"], usage["completion_tokens"], latency_ms)
+
+    return responses
+
+
+@contextmanager
+def track_turn():
+    """
+    Raccoglie le chiamate LLM effettuate all'interno del blocco (un turno di conversazione)
+
+    Yields:
+        La lista dei record del turno, popolata man mano
+    """
+    records: list = []
+    token = _turn_records.set(records)
+    try:
+        yield records
+    finally:
+        _turn_records.reset(token)
+
+
+def format_usage_report(records: Optional[List[dict]] = None) -> str:
+    """
+    Produce un report dei consumi ordinato per token totali, per individuare i prompt più costosi
+
+    Args:
+        records: Record da analizzare. Default: i totali progressivi del processo
+
+    Returns:
+        Il report formattato come tabella
+    """
+    summary = summarize_records(records) if records is not None else usage_tracker.totals()
+    total_tokens = summary["total_tokens"] or 1
+
+    lines = [f"{'AGENTE/PROMPT':<26} {'CHIAMATE':>8} {'INPUT':>9} {'OUTPUT':>9} {'QUOTA':>7} {'COSTO $':>10}"]
+    ranked = sorted(summary["by_prompt"].items(), key=lambda item: item[1]["total_tokens"], reverse=True)
+    for name, entry in ranked:
+        lines.append(
+            f"{name:<26} {entry['calls']:>8} {entry['prompt_tokens']:>9} {entry['completion_tokens']:>9} "
+            f"{entry['total_tokens'] / total_tokens:>7.1%} {entry['cost_usd']:>10.4f}"
+        )
+    lines.append(
+        f"{'TOTALE':<26} {summary['calls']:>8} {summary['prompt_tokens']:>9} "
+        f"{summary['completion_tokens']:>9} {'':>7} {summary['cost_usd']:>10.4f}"
+    )
+    return "\n".join(lines)
+
+
+def load_usage_log(path: str) -> List[dict]:
+    """Legge i record di utilizzo da un file JSONL scritto con ALEXA_USAGE_LOG"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    # Uso: python llm_usage.py [file_jsonl]  (default: variabile ALEXA_USAGE_LOG)
+    log_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("ALEXA_USAGE_LOG")
+    if not log_path or not os.path.exists(log_path):
+        print("Specifica un file di log dei consumi (o imposta ALEXA_USAGE_LOG)")
+        sys.exit(1)
+    print(format_usage_report(load_usage_log(log_path)))
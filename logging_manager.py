@@ -0,0 +1,205 @@
+"""
+Gestione del logging strutturato per il sistema multiagente
+Emette record JSON con livelli configurabili tramite un handler non bloccante basato su coda
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+# Nome del logger radice del sistema multiagente
+ROOT_LOGGER_NAME = "alexa"
+
+# Livello di default: il debug è disattivato a meno che non venga richiesto esplicitamente
+DEFAULT_LOG_LEVEL = "INFO"
+
+# Campi di contesto propagati automaticamente in ogni record
+CONTEXT_FIELDS = ("request_id", "session_id", "agent", "latency_ms")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_session_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+_agent: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("agent", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Listener dei logger su file, per nome del componente
+_file_listeners: Dict[str, logging.handlers.QueueListener] = {}
+_file_listeners_lock = threading.Lock()
+
+
+class ContextFilter(logging.Filter):
+    """
+    Arricchisce i record con request id, session id e agente del contesto corrente
+    I valori passati esplicitamente tramite `extra` hanno la precedenza
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = _request_id.get()
+        if getattr(record, "session_id", None) is None:
+            record.session_id = _session_id.get()
+        if getattr(record, "agent", None) is None:
+            record.agent = _agent.get()
+        if not hasattr(record, "latency_ms"):
+            record.latency_ms = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatta i record di log come una riga JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: Optional[str] = None) -> logging.Logger:
+    """
+    Configura il logger radice del sistema (idempotente)
+    I record vengono accodati dal thread chiamante e scritti su stderr
+    da un thread dedicato, così l'I/O non blocca il percorso critico
+
+    Args:
+        level: Livello di log (DEBUG, INFO, ...). Default: variabile ALEXA_LOG_LEVEL o INFO
+
+    Returns:
+        Il logger radice del sistema
+    """
+    global _listener
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    level_name = (level or os.getenv("ALEXA_LOG_LEVEL", DEFAULT_LOG_LEVEL)).upper()
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+
+    if _listener is not None:
+        return root
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Il filtro gira nel thread chiamante, dove le contextvar sono valorizzate
+    queue_handler.addFilter(ContextFilter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    return root
+
+
+def get_file_logger(name: str, path: str) -> logging.Logger:
+    """
+    Restituisce un logger che scrive il solo messaggio dei record, una riga per record, su file
+    Come per il logger radice, i record sono accodati dal thread chiamante e scritti
+    da un thread dedicato (es. i record JSONL dei consumi LLM)
+
+    Args:
+        name: Nome del componente (es. "usage_log")
+        path: File su cui accodare le righe
+
+    Returns:
+        Il logger configurato (non propaga i record al logger radice)
+    """
+    logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+    with _file_listeners_lock:
+        if name in _file_listeners:
+            return logger
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        file_handler = logging.FileHandler(path, encoding="utf-8", delay=True)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        listener = logging.handlers.QueueListener(log_queue, file_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        _file_listeners[name] = listener
+
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Restituisce un logger figlio del logger radice del sistema
+
+    Args:
+        name: Nome del componente (es. "supervisor", "conversation_manager")
+
+    Returns:
+        Il logger configurato
+    """
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def new_request_id() -> str:
+    """Genera un identificativo univoco per una richiesta"""
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def log_context(
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    agent: Optional[str] = None
+):
+    """
+    Imposta i campi di contesto per tutti i log emessi all'interno del blocco
+    I campi non specificati mantengono il valore del contesto esterno
+
+    Args:
+        request_id: ID della richiesta corrente
+        session_id: ID della sessione
+        agent: Nome dell'agente in esecuzione
+    """
+    tokens = []
+    if request_id is not None:
+        tokens.append((_request_id, _request_id.set(request_id)))
+    if session_id is not None:
+        tokens.append((_session_id, _session_id.set(session_id)))
+    if agent is not None:
+        tokens.append((_agent, _agent.set(agent)))
+
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def elapsed_ms(start: float) -> float:
+    """Millisecondi trascorsi da un istante ottenuto con time.perf_counter()"""
+    return round((time.perf_counter() - start) * 1000, 2)
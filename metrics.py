@@ -0,0 +1,380 @@
+"""
+Registro delle metriche in-process per il sistema multiagente
+Raccoglie contatori, gauge e distribuzioni di latenza e li espone in formato testo Prometheus
+"""
+
+import os
+import time
+import math
+import threading
+import functools
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from logging_manager import get_logger
+from deadline import expired, mark_degraded
+
+
+logger = get_logger("metrics")
+
+# Quantili calcolati per ogni distribuzione
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Numero di osservazioni recenti conservate per il calcolo dei quantili
+DEFAULT_WINDOW = 2048
+
+# Porta di default dell'endpoint /metrics
+DEFAULT_METRICS_PORT = 9100
+
+# Indirizzo di ascolto di default: solo locale, le metriche rivelano agenti, prompt e costi
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+
+def _label_key(label_names: Tuple[str, ...], labels: dict) -> Tuple[str, ...]:
+    """Costruisce la chiave ordinata dei valori delle etichette"""
+    missing = set(label_names) - set(labels)
+    if missing:
+        raise ValueError(f"Etichette mancanti: {', '.join(sorted(missing))}")
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _format_labels(label_names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Formatta le etichette nella sintassi Prometheus"""
+    parts = [f'{name}="{value}"' for name, value in zip(label_names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Calcola un percentile con interpolazione lineare
+
+    Args:
+        sorted_values: Valori già ordinati
+        q: Quantile tra 0 e 1
+
+    Returns:
+        Il valore del percentile (NaN se non ci sono valori)
+    """
+    if not sorted_values:
+        return math.nan
+    pos = (len(sorted_values) - 1) * q
+    lower = math.floor(pos)
+    upper = math.ceil(pos)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class Counter:
+    """Contatore monotono con etichette"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Incrementa il contatore per le etichette indicate"""
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Valore corrente per le etichette indicate"""
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+
+class Gauge(Counter):
+    """Valore istantaneo con etichette"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        """Imposta il valore per le etichette indicate"""
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram:
+    """
+    Distribuzione dei valori osservati (es. latenze in secondi)
+    Mantiene conteggio e somma totali e una finestra delle osservazioni recenti
+    da cui calcola p50/p95/p99. Viene esposta come summary Prometheus
+    """
+
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), window: int = DEFAULT_WINDOW):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.window = window
+        self._series: Dict[Tuple[str, ...], dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Registra un'osservazione per le etichette indicate"""
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)}
+                self._series[key] = series
+            series["count"] += 1
+            series["sum"] += value
+            series["recent"].append(value)
+
+    def stats(self) -> Dict[Tuple[str, ...], dict]:
+        """
+        Statistiche per ogni combinazione di etichette
+
+        Returns:
+            Dizionario {valori_etichette: {"count", "sum", "p50", "p95", "p99"}}
+        """
+        with self._lock:
+            snapshot = {key: (s["count"], s["sum"], sorted(s["recent"])) for key, s in self._series.items()}
+
+        result = {}
+        for key, (count, total, values) in snapshot.items():
+            entry = {"count": count, "sum": total}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = percentile(values, q)
+            result[key] = entry
+        return result
+
+    def render(self) -> Iterable[str]:
+        for key, entry in sorted(self.stats().items()):
+            for q in QUANTILES:
+                labels = _format_labels(self.label_names, key, f'quantile="{q}"')
+                yield f"{self.name}{labels} {entry[f'p{int(q * 100)}']}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {entry['sum']}"
+            yield f"{self.name}_count{labels} {entry['count']}"
+
+
+class MetricsRegistry:
+    """Registro centrale delle metriche del processo"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, label_names: Tuple[str, ...]):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, tuple(label_names))
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La metrica {name} è già registrata con un tipo diverso")
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        """Restituisce (creandolo se necessario) un contatore"""
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def gauge(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        """Restituisce (creandolo se necessario) un gauge"""
+        return self._get_or_create(Gauge, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Histogram:
+        """Restituisce (creandola se necessario) una distribuzione"""
+        return self._get_or_create(Histogram, name, help_text, label_names)
+
+    def render_prometheus(self) -> str:
+        """Rende tutte le metriche nel formato di esposizione testuale Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Svuota il registro (usato dai benchmark tra un'esecuzione e l'altra)"""
+        with self._lock:
+            self._metrics.clear()
+
+
+# Istanza globale del registro delle metriche
+metrics_registry = MetricsRegistry()
+
+
+def node_latency() -> Histogram:
+    """Distribuzione delle latenze dei nodi dei grafi LangGraph"""
+    return metrics_registry.histogram(
+        "alexa_node_latency_seconds",
+        "Latenza di esecuzione dei nodi dei grafi degli agenti",
+        ("agent", "node")
+    )
+
+
+def node_timeouts() -> Counter:
+    """Nodi che hanno sforato la scadenza del turno (overrun), saltati (skipped) o sostituiti dal ripiego (fallback)"""
+    return metrics_registry.counter(
+        "alexa_node_timeouts_total",
+        "Nodi in ritardo o saltati per la scadenza del turno",
+        ("agent", "node", "reason")
+    )
+
+
+def agent_latency() -> Histogram:
+    """Distribuzione delle latenze complessive di ciascun agente"""
+    return metrics_registry.histogram(
+        "alexa_agent_latency_seconds",
+        "Latenza complessiva di esecuzione di ciascun agente",
+        ("agent",)
+    )
+
+
+def timed_node(agent: str, node: str, on_deadline: Optional[Callable] = None) -> Callable:
+    """
+    Decoratore che misura la durata di un nodo di un grafo LangGraph
+    Se la scadenza del turno è già passata il nodo non viene eseguito
+
+    Args:
+        agent: Nome dell'agente proprietario del grafo (es. "WEATHER")
+        node: Nome del nodo nel grafo
+        on_deadline: Funzione eseguita al posto del nodo a scadenza passata;
+                     di default il nodo viene saltato e lo stato passa invariato
+
+    Returns:
+        Il decoratore da applicare alla funzione del nodo
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(state, *args, **kwargs):
+            if expired():
+                reason = "fallback" if on_deadline else "skipped"
+                node_timeouts().inc(agent=agent, node=node, reason=reason)
+                mark_degraded(agent, node, reason)
+                return on_deadline(state) if on_deadline else state
+
+            start = time.perf_counter()
+            try:
+                return func(state, *args, **kwargs)
+            finally:
+                node_latency().observe(time.perf_counter() - start, agent=agent, node=node)
+                if expired():
+                    node_timeouts().inc(agent=agent, node=node, reason="overrun")
+                    mark_degraded(agent, node, "overrun")
+        return wrapper
+    return decorator
+
+
+def timed_agent(agent: str) -> Callable:
+    """
+    Decoratore che misura la durata complessiva di esecuzione di un agente
+
+    Args:
+        agent: Nome dell'agente (es. "WEATHER")
+
+    Returns:
+        Il decoratore da applicare alla funzione run_*_agent
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                agent_latency().observe(time.perf_counter() - start, agent=agent)
+        return wrapper
+    return decorator
+
+
+def format_latency_report() -> str:
+    """
+    Produce un report testuale con p50/p95/p99 per agente e per nodo
+
+    Returns:
+        Il report formattato come tabella
+    """
+    lines = [f"{'AGENTE':<12} {'NODO':<28} {'N':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+
+    rows = [((agent, "(totale)"), entry) for (agent,), entry in agent_latency().stats().items()]
+    rows += list(node_latency().stats().items())
+
+    for (agent, node), entry in sorted(rows):
+        lines.append(
+            f"{agent:<12} {node:<28} {entry['count']:>6} "
+            f"{entry['p50'] * 1000:>9.1f} {entry['p95'] * 1000:>9.1f} {entry['p99'] * 1000:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Handler HTTP che serve il registro sull'endpoint /metrics"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Avvia (una sola volta) il server HTTP che espone /metrics in un thread daemon
+
+    Args:
+        port: Porta di ascolto. Default: variabile ALEXA_METRICS_PORT o 9100 (0 disattiva)
+        host: Indirizzo di ascolto. Default: variabile ALEXA_METRICS_HOST o 127.0.0.1
+              ("0.0.0.0" per esporre le metriche su tutte le interfacce)
+
+    Returns:
+        Il server avviato, o None se disattivato o non avviabile
+    """
+    global _server
+
+    if _server is not None:
+        return _server
+
+    if port is None:
+        port = int(os.getenv("ALEXA_METRICS_PORT", DEFAULT_METRICS_PORT))
+    if port == 0:
+        return None
+    if host is None:
+        host = os.getenv("ALEXA_METRICS_HOST", DEFAULT_METRICS_HOST)
+
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("Impossibile avviare l'endpoint /metrics sulla porta %s: %s", port, e)
+        return None
+
+    thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info("Endpoint metriche attivo su http://%s:%s/metrics", host, port)
+    return _server
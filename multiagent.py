@@ -5,33 +5,186 @@ Supervisore che usa LLM per coordinare gli agenti specializzati
 
 import os
 import json
+import time
+import sys
+import argparse
+from datetime import datetime
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, START, END
+from langgraph.constants import Send
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 import operator
 from dotenv import load_dotenv
 
-from agents.weather_agent import run_weather_agent, visualize_graph
-from agents.horoscope_agent import run_horoscope_agent
-from agents.general_agent import run_general_agent
-from agents.wikipedia_agent import run_wikipedia_agent
-from agents.calculator_agent import run_calculator_agent
-from agents.translator_agent import run_translator_agent
+# Gli agenti sono caricati al primo utilizzo (vedi agents/__init__.py)
+from agents import get_agent_runner
 from conversation_manager import conversation_manager
+from metrics import timed_node, start_metrics_server, format_latency_report
+from llm_usage import invoke_llm, track_turn, summarize_records, format_usage_report, PROMPT_ROUTING
+from llm_provider import get_llm
+from speculation import speculation_enabled, start_speculation, format_speculation_report
+from deadline import turn_budget, deadline_after, deadline_scope
+from graph_rendering import render_graph_files
+from logging_manager import get_logger, log_context, new_request_id, elapsed_ms
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
+logger = get_logger("supervisor")
+
+# Agenti che accettano slot già estratti dal supervisore (routing combinato)
+SLOT_AGENTS = {"WEATHER", "HOROSCOPE", "CALCULATOR", "TRANSLATOR"}
+
+# Agente -> nodo del grafo del supervisore che lo esegue
+AGENT_NODES = {
+    "WEATHER": "weather_agent",
+    "HOROSCOPE": "horoscope_agent",
+    "WIKIPEDIA": "wikipedia_agent",
+    "CALCULATOR": "calculator_agent",
+    "TRANSLATOR": "translator_agent",
+    "GENERAL": "general_agent",
+}
+
+# Numero massimo di sotto-richieste eseguite in parallelo per una query multipla
+MAX_INTENTS = 4
+
+# Messaggi di routing/sistema da non considerare come risposta finale
+ROUTING_KEYWORDS = ("ho analizzato", "attivo l'agente", "ho identificato", "sto recuperando")
+
+# Inizio dei messaggi di errore dei nodi, da non restituire come risposta parziale
+ERROR_PREFIXES = (
+    "errore", "scusa, non riesco", "mi dispiace, ho avuto un problema", "mi dispiace, si è verificato un errore"
+)
+
+# Risposte quando il budget di latenza del turno si esaurisce
+PARTIAL_ANSWER_NOTICE = "⏱️ Risposta parziale: non sono riuscito a completare la richiesta nei tempi previsti."
+TIMEOUT_ANSWER = "⏱️ Mi dispiace, non sono riuscito a rispondere in tempo. Riprova tra poco."
+
+# Risposta di un ramo di una query multipla a cui manca un'informazione quando un altro ramo ne ha già chiesta una
+DEFERRED_FOLLOW_UP = "Per \"{query}\" mi servono altre informazioni: ripeti la richiesta dopo aver risposto."
+
+
+def combined_routing_enabled() -> bool:
+    """
+    Indica se il routing combinato è attivo (variabile ALEXA_COMBINED_ROUTING)
+    In questa modalità il supervisore estrae anche gli slot dell'agente scelto,
+    risparmiando la chiamata LLM di estrazione dell'agente
+    """
+    return os.getenv("ALEXA_COMBINED_ROUTING", "").lower() in ("1", "true", "yes")
+
+
+def build_slots_prompt() -> str:
+    """
+    Istruzioni aggiuntive del prompt di routing per estrarre gli slot degli agenti
+    
+    Returns:
+        Il testo da accodare al prompt di routing
+    """
+    today = datetime.now().strftime("%d/%m/%Y")
+    return f"""
+
+Estrai anche i dati che servono all'agente scelto e aggiungi al JSON il campo "slots":
+- WEATHER: {{"location": "nome città" o "NESSUNA", "locations": ["tutte le città citate, nell'ordine"], "days_offset": 0-7 (giorni da oggi, data odierna {today}), "time_of_day": "mattina|pomeriggio|sera|notte" o null, "hours_ahead": ore da adesso ("tra 3 ore") o null, "time_description": "es. 'oggi', 'domani'", "validity": "VALIDO" o "INVALIDO"}}
+- HOROSCOPE: {{"zodiac_sign": "segno in italiano (minuscolo)" o "NESSUNO", "zodiac_signs": ["tutti i segni citati, nell'ordine"], "time_period": "daily|weekly|monthly", "time_description": "es. 'di oggi', 'della settimana'", "validity": "VALIDO" o "INVALIDO"}}
+- CALCULATOR: {{"type": "ARITHMETIC|PERCENTAGE|CONVERSION|EQUATION", "expression": "es. '2+2', '100 * 0.20', '10 km to mi', '25 c to f', '2*x+5-13'", "description": "breve descrizione", "valid": true o false}}
+- TRANSLATOR: {{"text": "testo da tradurre", "source_lang": "nome lingua origine o 'auto'", "target_lang": "nome lingua destinazione", "valid": true o false}}
+- Altri agenti: "slots": null"""
+
 
 class SupervisorState(TypedDict):
     """Stato del supervisore agente"""
     user_query: str
+    session_id: str
     selected_agent: str | None
+    slots: dict | None
+    # Risposta del modello di routing calcolata in anticipo (None = il router chiama l'LLM)
+    routing_response: str | None
     agent_result: dict | None
+    # Sotto-richieste di una query multipla, eseguite in parallelo (fan-out)
+    intents: list | None
+    # Risultati dei rami paralleli, uniti dal nodo merge_results (fan-in)
+    agent_results: Annotated[list, operator.add]
     messages: Annotated[list, operator.add]
 
 
+def parse_intents(raw) -> list:
+    """
+    Normalizza le sotto-richieste restituite dal router
+    
+    Args:
+        raw: Il campo "intents" della risposta JSON del router
+        
+    Returns:
+        Lista di dizionari {"agent", "query"}; gli agenti sconosciuti diventano GENERAL
+    """
+    if not isinstance(raw, list):
+        return []
+    
+    intents = []
+    for item in raw:
+        if not isinstance(item, dict):
+            continue
+        agent = str(item.get("agent", "")).upper()
+        query = str(item.get("query", "")).strip()
+        if query:
+            intents.append({"agent": agent if agent in AGENT_NODES else "GENERAL", "query": query})
+    return intents[:MAX_INTENTS]
+
+
+def build_routing_messages(user_query: str) -> list:
+    """
+    Costruisce i messaggi della chiamata LLM di routing
+    
+    Args:
+        user_query: La domanda dell'utente
+        
+    Returns:
+        La lista di messaggi (sistema e prompt) da inviare al modello
+    """
+    # Prompt per il routing
+    routing_prompt = f"""Sei un supervisore di un sistema multiagente. La tua responsabilità è decidere quale agente specializzato attivare.
+
+Agenti disponibili:
+1. WEATHER - Specializzato in: meteo, condizioni atmosferiche, pioggia, neve, temperatura, umidità, sole, vento, clima
+2. HOROSCOPE - Specializzato in: oroscopo, segni zodiacali, previsioni astrologiche
+3. WIKIPEDIA - Specializzato in: informazioni enciclopediche, domande su personaggi storici, eventi, definizioni, concetti scientifici, luoghi, cultura generale, fatti storici, biografie
+4. CALCULATOR - Specializzato in: calcoli matematici, aritmetica, percentuali, conversioni unità (km/miglia, kg/libbre, celsius/fahrenheit), equazioni
+5. TRANSLATOR - Specializzato in: traduzioni tra lingue, tradurre parole/frasi, "come si dice", "che significa"
+6. GENERAL - Specializzato in: saluti, presentazioni, small talk, conversazioni generiche, domande sull'assistente, ringraziamenti, calendario
+
+IMPORTANTE:
+- Usa TRANSLATOR per: "traduci [testo] in [lingua]", "come si dice [testo] in [lingua]", "che significa [testo]"
+- Usa CALCULATOR per: "quanto fa 2+2", "calcola il 20% di 100", "converti 10 km in miglia", "risolvi 2x+5=13"
+- Usa GENERAL per: saluti (ciao, buongiorno), presentazioni (chi sei, cosa fai), ringraziamenti, conversazioni generiche
+- Usa GENERAL come fallback per qualsiasi cosa non gestita dagli altri agenti
+- Non usare mai NONE, usa sempre GENERAL se nessun altro agente è appropriato
+
+Analizza la seguente query e decidi quale agente è il più appropriato.
+
+Query utente: {user_query}
+
+Rispondi in JSON con il seguente formato:
+{{
+    "agent": "WEATHER" | "HOROSCOPE" | "GENERAL" | "WIKIPEDIA" | "CALCULATOR" | "TRANSLATOR",
+    "confidence": 0.0-1.0,
+    "reason": "breve spiegazione"
+}}
+
+Se la query contiene più richieste distinte (es. "che tempo fa a Roma e qual è l'oroscopo del leone?"), aggiungi il campo "intents" con una voce per richiesta, ognuna riformulata come domanda autonoma:
+"intents": [{{"agent": "WEATHER", "query": "Che tempo fa a Roma?"}}, {{"agent": "HOROSCOPE", "query": "Qual è l'oroscopo del leone?"}}]
+In questo caso "agent" indica l'agente della prima richiesta. Se la richiesta è una sola, ometti "intents".
+
+Usa GENERAL per tutto ciò che non è meteo, oroscopo, domande enciclopediche, calcoli matematici, traduzioni o funzionalità specifiche."""
+    
+    if combined_routing_enabled():
+        routing_prompt += build_slots_prompt()
+    
+    return [
+        SystemMessage(content="Sei un supervisore intelligente di un sistema multiagente."),
+        HumanMessage(content=routing_prompt)
+    ]
+
+
 def supervisor_router(state: SupervisorState) -> SupervisorState:
     """
     Supervisore che decide quale agente attivare basandosi sulla query dell'utente
@@ -45,25 +198,26 @@ def supervisor_router(state: SupervisorState) -> SupervisorState:
         Lo stato aggiornato con l'agente selezionato
     """
     user_query = state["user_query"]
+    session_id = state.get("session_id", "default")
     
     # PRIMA PRIORITÀ: Controlla se c'è una richiesta in sospeso
-    has_pending = conversation_manager.has_pending_request()
+    has_pending = conversation_manager.has_pending_request(session_id)
     
     if has_pending:
-        print(f"[DEBUG] Rilevata richiesta in sospeso")
-        pending_request = conversation_manager.get_pending_request()
+        logger.debug("Rilevata richiesta in sospeso")
+        pending_request = conversation_manager.get_pending_request(session_id)
         
         # Controllo di sicurezza: verifica che pending_request non sia None
         if pending_request:
             agent_type = pending_request.get("agent_type")
-            print(f"[DEBUG] Agente precedente: {agent_type}")
-            print(f"[DEBUG] Nuova informazione: {user_query}")
+            logger.debug("Agente precedente: %s", agent_type)
+            logger.debug("Nuova informazione: %s", user_query)
             
             # Completa la richiesta con la nuova informazione
-            completed_query = conversation_manager.complete_pending_request(user_query)
+            completed_query = conversation_manager.complete_pending_request(user_query, session_id)
             
             if completed_query:
-                print(f"[DEBUG] Query completata: {completed_query}")
+                logger.debug("Query completata: %s", completed_query)
                 state["user_query"] = completed_query
                 state["selected_agent"] = agent_type
                 
@@ -74,66 +228,58 @@ def supervisor_router(state: SupervisorState) -> SupervisorState:
                 )
                 return state
         else:
-            print("[DEBUG] pending_request è None!")
+            logger.warning("Richiesta in sospeso segnalata ma non recuperabile")
     
     # Aggiungiamo il messaggio dell'utente
     state["messages"].append(HumanMessage(content=user_query))
     
+    combined = combined_routing_enabled()
+    # Risposta di routing già calcolata (es. chiamate raggruppate dall'elaborazione batch)
+    routing_response = state.get("routing_response")
+    
+    # Estrazione speculativa per l'agente più probabile, in parallelo al routing
+    speculation = None
+    route_seconds = 0.0
+    if speculation_enabled() and not combined and routing_response is None:
+        speculation = start_speculation(user_query)
+    
     try:
-        # Inizializza il modello OpenAI
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        # Prompt per il routing
-        routing_prompt = f"""Sei un supervisore di un sistema multiagente. La tua responsabilità è decidere quale agente specializzato attivare.
-
-Agenti disponibili:
-1. WEATHER - Specializzato in: meteo, condizioni atmosferiche, pioggia, neve, temperatura, umidità, sole, vento, clima
-2. HOROSCOPE - Specializzato in: oroscopo, segni zodiacali, previsioni astrologiche
-3. WIKIPEDIA - Specializzato in: informazioni enciclopediche, domande su personaggi storici, eventi, definizioni, concetti scientifici, luoghi, cultura generale, fatti storici, biografie
-4. CALCULATOR - Specializzato in: calcoli matematici, aritmetica, percentuali, conversioni unità (km/miglia, kg/libbre, celsius/fahrenheit), equazioni
-5. TRANSLATOR - Specializzato in: traduzioni tra lingue, tradurre parole/frasi, "come si dice", "che significa"
-6. GENERAL - Specializzato in: saluti, presentazioni, small talk, conversazioni generiche, domande sull'assistente, ringraziamenti, calendario
-
-IMPORTANTE:
-- Usa TRANSLATOR per: "traduci [testo] in [lingua]", "come si dice [testo] in [lingua]", "che significa [testo]"
-- Usa CALCULATOR per: "quanto fa 2+2", "calcola il 20% di 100", "converti 10 km in miglia", "risolvi 2x+5=13"
-- Usa GENERAL per: saluti (ciao, buongiorno), presentazioni (chi sei, cosa fai), ringraziamenti, conversazioni generiche
-- Usa GENERAL come fallback per qualsiasi cosa non gestita dagli altri agenti
-- Non usare mai NONE, usa sempre GENERAL se nessun altro agente è appropriato
-
-Analizza la seguente query e decidi quale agente è il più appropriato.
-
-Query utente: {user_query}
-
-Rispondi in JSON con il seguente formato:
-{{
-    "agent": "WEATHER" | "HOROSCOPE" | "GENERAL" | "WIKIPEDIA" | "CALCULATOR" | "TRANSLATOR",
-    "confidence": 0.0-1.0,
-    "reason": "breve spiegazione"
-}}
-
-Usa GENERAL per tutto ciò che non è meteo, oroscopo, domande enciclopediche, calcoli matematici, traduzioni o funzionalità specifiche."""
-        
-        # Chiama OpenAI
-        response = llm.invoke([
-            SystemMessage(content="Sei un supervisore intelligente di un sistema multiagente."),
-            HumanMessage(content=routing_prompt)
-        ])
+        if routing_response is None:
+            # Inizializza il modello OpenAI
+            llm = get_llm(temperature=0)
+            
+            # Chiama OpenAI
+            route_start = time.perf_counter()
+            response = invoke_llm(llm, build_routing_messages(user_query), agent="SUPERVISOR", prompt=PROMPT_ROUTING)
+            route_seconds = time.perf_counter() - route_start
+            routing_response = response.content
         
         # Parsa la risposta JSON
         try:
-            decision = json.loads(response.content)
+            decision = json.loads(routing_response)
             selected_agent = decision.get("agent", "NONE").upper()
             confidence = decision.get("confidence", 0.0)
             reason = decision.get("reason", "")
             
             state["selected_agent"] = selected_agent
             
-            if selected_agent != "NONE":
+            # Query multipla: ogni sotto-richiesta va al proprio agente, in parallelo
+            intents = parse_intents(decision.get("intents"))
+            if len(intents) > 1:
+                state["selected_agent"] = "MULTI"
+                state["intents"] = intents
+                agents = ", ".join(intent["agent"] for intent in intents)
+                logger.debug("Sotto-richieste: %r", intents)
+                state["messages"].append(
+                    AIMessage(content=f"Ho analizzato la tua richiesta: {reason} (confidenza: {confidence*100:.0f}%). Attivo in parallelo gli agenti {agents}...")
+                )
+            elif selected_agent != "NONE":
+                # Routing combinato: l'agente userà questi slot senza una nuova chiamata LLM
+                slots = decision.get("slots")
+                if combined and selected_agent in SLOT_AGENTS and isinstance(slots, dict):
+                    state["slots"] = slots
+                    logger.debug("Slot estratti dal supervisore: %r", slots)
+                
                 state["messages"].append(
                     AIMessage(content=f"Ho analizzato la tua richiesta: {reason} (confidenza: {confidence*100:.0f}%). Attivo l'agente {selected_agent}...")
                 )
@@ -144,7 +290,8 @@ Usa GENERAL per tutto ciò che non è meteo, oroscopo, domande enciclopediche, c
                 
         except json.JSONDecodeError:
             # Se il parsing JSON fallisce, prova a estrarre manualmente
-            content_lower = response.content.lower()
+            logger.debug("Risposta di routing non in JSON: %r", routing_response)
+            content_lower = routing_response.lower()
             if "weather" in content_lower:
                 state["selected_agent"] = "WEATHER"
                 state["messages"].append(
@@ -164,11 +311,18 @@ Usa GENERAL per tutto ciò che non è meteo, oroscopo, domande enciclopediche, c
     
     except Exception as e:
         # In caso di errore, usa GENERAL come fallback
+        logger.warning("Errore nel routing, uso GENERAL: %s", e)
         state["selected_agent"] = "GENERAL"
         state["messages"].append(
             AIMessage(content=f"Errore nel routing: {str(e)}. Uso l'agente conversazionale.")
         )
     
+    # Se il routing conferma la previsione, l'agente userà gli slot già estratti
+    if speculation is not None:
+        slots = speculation.resolve(state.get("selected_agent"), route_seconds)
+        if slots is not None:
+            state["slots"] = slots
+    
     return state
 
 
@@ -178,7 +332,9 @@ def execute_weather_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_weather_agent(state["user_query"])
+        result = get_agent_runner("WEATHER")(
+            state["user_query"], session_id=state.get("session_id", "default"), slots=state.get("slots")
+        )
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente meteo
@@ -186,6 +342,7 @@ def execute_weather_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "WEATHER")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente METEO: {str(e)}")
         )
@@ -199,7 +356,9 @@ def execute_horoscope_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_horoscope_agent(state["user_query"])
+        result = get_agent_runner("HOROSCOPE")(
+            state["user_query"], session_id=state.get("session_id", "default"), slots=state.get("slots")
+        )
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente oroscopo
@@ -207,6 +366,7 @@ def execute_horoscope_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "HOROSCOPE")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente OROSCOPO: {str(e)}")
         )
@@ -220,7 +380,7 @@ def execute_general_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_general_agent(state["user_query"])
+        result = get_agent_runner("GENERAL")(state["user_query"])
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente general
@@ -228,6 +388,7 @@ def execute_general_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "GENERAL")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente CONVERSAZIONALE: {str(e)}")
         )
@@ -241,7 +402,7 @@ def execute_wikipedia_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_wikipedia_agent(state["user_query"])
+        result = get_agent_runner("WIKIPEDIA")(state["user_query"])
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente Wikipedia
@@ -249,6 +410,7 @@ def execute_wikipedia_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "WIKIPEDIA")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente WIKIPEDIA: {str(e)}")
         )
@@ -262,7 +424,7 @@ def execute_calculator_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_calculator_agent(state["user_query"])
+        result = get_agent_runner("CALCULATOR")(state["user_query"], slots=state.get("slots"))
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente calculator
@@ -270,6 +432,7 @@ def execute_calculator_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "CALCULATOR")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente CALCOLATORE: {str(e)}")
         )
@@ -283,7 +446,7 @@ def execute_translator_agent(state: SupervisorState) -> SupervisorState:
         return state
     
     try:
-        result = run_translator_agent(state["user_query"])
+        result = get_agent_runner("TRANSLATOR")(state["user_query"], slots=state.get("slots"))
         state["agent_result"] = result
         
         # Aggiungi i messaggi dell'agente translator
@@ -291,6 +454,7 @@ def execute_translator_agent(state: SupervisorState) -> SupervisorState:
             state["messages"].append(AIMessage(content=msg.content))
             
     except Exception as e:
+        logger.exception("Errore nell'esecuzione dell'agente %s", "TRANSLATOR")
         state["messages"].append(
             AIMessage(content=f"Errore nell'esecuzione dell'agente TRADUTTORE: {str(e)}")
         )
@@ -309,6 +473,156 @@ def handle_unsupported_agent(state: SupervisorState) -> SupervisorState:
     return state
 
 
+# Agente -> funzione del nodo che lo esegue, usata anche dai rami paralleli
+AGENT_EXECUTORS = {
+    "WEATHER": execute_weather_agent,
+    "HOROSCOPE": execute_horoscope_agent,
+    "WIKIPEDIA": execute_wikipedia_agent,
+    "CALCULATOR": execute_calculator_agent,
+    "TRANSLATOR": execute_translator_agent,
+    "GENERAL": execute_general_agent,
+}
+
+
+def execute_intent(intent: dict) -> dict:
+    """
+    Esegue una sotto-richiesta di una query multipla (un ramo del fan-out)
+    Riusa il nodo execute_*_agent dell'agente su uno stato dedicato, così i
+    rami paralleli non scrivono sugli stessi campi dello stato del supervisore
+    
+    Args:
+        intent: Dizionario con index, agent, query e session_id della sotto-richiesta
+        
+    Returns:
+        Aggiornamento parziale con il risultato del ramo in "agent_results"
+    """
+    agent = intent["agent"]
+    branch_state = {
+        "user_query": intent["query"],
+        "session_id": intent["session_id"],
+        "selected_agent": agent,
+        "slots": None,
+        "agent_result": None,
+        "messages": []
+    }
+    # I rami condividono la sessione: una sola richiesta in sospeso, quella del primo ramo che la chiede
+    with conversation_manager.parallel_branch(intent["index"]) as branch:
+        branch_state = AGENT_EXECUTORS[agent](branch_state)
+    
+    return {
+        "agent_results": [{
+            "index": intent["index"],
+            "agent": agent,
+            "query": intent["query"],
+            "result": branch_state["agent_result"],
+            "messages": branch_state["messages"],
+            "asked_follow_up": branch["asked"]
+        }]
+    }
+
+
+def merge_agent_results(state: SupervisorState) -> dict:
+    """
+    Unisce le risposte dei rami paralleli in un'unica risposta (fan-in)
+    
+    Args:
+        state: Lo stato del supervisore con i risultati in "agent_results"
+        
+    Returns:
+        Aggiornamento parziale con i messaggi dei rami e la risposta unificata
+    """
+    results = sorted(state.get("agent_results") or [], key=lambda r: r["index"])
+    # Se più rami hanno chiesto un'informazione mancante, la domanda resta solo per quello
+    # la cui richiesta in sospeso è stata conservata: gli altri vanno ripetuti dopo
+    pending = conversation_manager.get_pending_request(state.get("session_id", "default"))
+    follow_up_branch = pending.get("branch") if pending else None
+    
+    messages = []
+    answers = []
+    for result in results:
+        branch_messages = result["messages"]
+        # L'ultimo messaggio di ogni ramo è la risposta dell'agente, gli altri sono il reasoning
+        messages.extend(branch_messages[:-1])
+        if result.get("asked_follow_up") and result["index"] != follow_up_branch:
+            answers.append(DEFERRED_FOLLOW_UP.format(query=result["query"]))
+        elif branch_messages:
+            answers.append(branch_messages[-1].content)
+    
+    answer = "\n\n".join(answers) or "Mi dispiace, non ho potuto elaborare la tua richiesta."
+    messages.append(AIMessage(content=answer))
+    
+    return {
+        "agent_result": {"agents": [result["agent"] for result in results], "results": results},
+        "messages": messages
+    }
+
+
+def route_to_agents(state: SupervisorState):
+    """
+    Sceglie il nodo da eseguire dopo il router
+    
+    Returns:
+        Il nome del nodo dell'agente scelto oppure, per una query multipla,
+        un Send per ogni sotto-richiesta (eseguite in parallelo da LangGraph)
+    """
+    intents = state.get("intents")
+    if intents:
+        session_id = state.get("session_id", "default")
+        return [
+            Send("intent_agent", {"index": i, "session_id": session_id, **intent})
+            for i, intent in enumerate(intents)
+        ]
+    
+    selected_agent = state.get("selected_agent")
+    if selected_agent in ["BASIC"]:
+        return "unsupported"
+    # Default a GENERAL invece di END
+    return AGENT_NODES.get(selected_agent, "general_agent")
+
+
+def intent_timeout(intent: dict) -> dict:
+    """Risultato di un ramo parallelo non eseguito perché la scadenza del turno è passata"""
+    return {
+        "agent_results": [{
+            "index": intent["index"],
+            "agent": intent["agent"],
+            "query": intent["query"],
+            "result": None,
+            "messages": [AIMessage(content=f"{TIMEOUT_ANSWER} ({intent['query']})")]
+        }]
+    }
+
+
+def extract_final_response(result: dict, substantive_only: bool = False) -> str | None:
+    """
+    Estrae la risposta finale del turno (ultimo messaggio non di routing)
+    
+    Args:
+        result: Lo stato finale del supervisore
+        substantive_only: Se True salta anche i messaggi di errore dei nodi e restituisce None
+                          quando non c'è una risposta vera, altrimenti ripiega sull'ultimo messaggio
+        
+    Returns:
+        Il testo della risposta
+    """
+    contents = [
+        msg.content for msg in result.get("messages", [])
+        if msg.__class__.__name__ != "HumanMessage" and msg.content
+    ]
+    for content in reversed(contents):
+        lowered = content.lower()
+        if any(keyword in lowered for keyword in ROUTING_KEYWORDS):
+            continue
+        # Gli agenti restituiscono anche la domanda dell'utente, copiata come AIMessage
+        if substantive_only and (lowered.lstrip().startswith(ERROR_PREFIXES)
+                                 or content.strip() == result.get("user_query", "").strip()):
+            continue
+        return content
+    if substantive_only:
+        return None
+    return contents[-1] if contents else ""
+
+
 def should_execute_agent(state: SupervisorState) -> bool:
     """Determina se eseguire un agente o terminare"""
     return state.get("selected_agent") and state["selected_agent"] != "NONE"
@@ -324,29 +638,25 @@ def build_supervisor_agent():
     workflow = StateGraph(SupervisorState)
     
     # Aggiungiamo i nodi
-    workflow.add_node("router", supervisor_router)
-    workflow.add_node("weather_agent", execute_weather_agent)
-    workflow.add_node("horoscope_agent", execute_horoscope_agent)
-    workflow.add_node("general_agent", execute_general_agent)
-    workflow.add_node("wikipedia_agent", execute_wikipedia_agent)
-    workflow.add_node("calculator_agent", execute_calculator_agent)
-    workflow.add_node("translator_agent", execute_translator_agent)
-    workflow.add_node("unsupported", handle_unsupported_agent)
+    workflow.add_node("router", timed_node("SUPERVISOR", "router")(supervisor_router))
+    workflow.add_node("weather_agent", timed_node("SUPERVISOR", "weather_agent")(execute_weather_agent))
+    workflow.add_node("horoscope_agent", timed_node("SUPERVISOR", "horoscope_agent")(execute_horoscope_agent))
+    workflow.add_node("general_agent", timed_node("SUPERVISOR", "general_agent")(execute_general_agent))
+    workflow.add_node("wikipedia_agent", timed_node("SUPERVISOR", "wikipedia_agent")(execute_wikipedia_agent))
+    workflow.add_node("calculator_agent", timed_node("SUPERVISOR", "calculator_agent")(execute_calculator_agent))
+    workflow.add_node("translator_agent", timed_node("SUPERVISOR", "translator_agent")(execute_translator_agent))
+    workflow.add_node("unsupported", timed_node("SUPERVISOR", "unsupported")(handle_unsupported_agent))
+    workflow.add_node("intent_agent", timed_node("SUPERVISOR", "intent_agent", on_deadline=intent_timeout)(execute_intent))
+    # L'unione delle risposte va eseguita anche a scadenza passata, per restituire quelle pronte
+    workflow.add_node("merge_results", timed_node("SUPERVISOR", "merge_results", on_deadline=merge_agent_results)(merge_agent_results))
     
     # Definiamo il flusso
     workflow.add_edge(START, "router")
     
-    # Decisione: quale agente eseguire
+    # Decisione: quale agente eseguire, o quali in parallelo per una query multipla
     workflow.add_conditional_edges(
         "router",
-        lambda state: "weather_agent" if state.get("selected_agent") == "WEATHER" 
-                     else "horoscope_agent" if state.get("selected_agent") == "HOROSCOPE"
-                     else "wikipedia_agent" if state.get("selected_agent") == "WIKIPEDIA"
-                     else "calculator_agent" if state.get("selected_agent") == "CALCULATOR"
-                     else "translator_agent" if state.get("selected_agent") == "TRANSLATOR"
-                     else "general_agent" if state.get("selected_agent") == "GENERAL"
-                     else "unsupported" if state.get("selected_agent") in ["BASIC"]
-                     else "general_agent",  # Default a GENERAL invece di END
+        route_to_agents,
         {
             "weather_agent": "weather_agent",
             "horoscope_agent": "horoscope_agent",
@@ -354,10 +664,15 @@ def build_supervisor_agent():
             "calculator_agent": "calculator_agent",
             "translator_agent": "translator_agent",
             "general_agent": "general_agent",
-            "unsupported": "unsupported"
+            "unsupported": "unsupported",
+            "intent_agent": "intent_agent"
         }
     )
     
+    # I rami paralleli confluiscono in merge_results, eseguito una sola volta
+    workflow.add_edge("intent_agent", "merge_results")
+    workflow.add_edge("merge_results", END)
+    
     # Da weather_agent a END
     workflow.add_edge("weather_agent", END)
     
@@ -397,28 +712,17 @@ def visualize_supervisor_graph():
     graph = build_supervisor_agent()
     
     try:
-        # 1. Genera la rappresentazione Mermaid
-        mermaid_code = graph.get_graph().draw_mermaid()
-        
-        # Salva il diagramma Mermaid in un file .md
-        mermaid_path = "supervisor_graph.md"
-        with open(mermaid_path, "w", encoding="utf-8") as f:
-            f.write("# Grafo Supervisore Multiagente\n\n")
-            f.write("Questo grafo mostra il flusso del supervisore che coordina i vari agenti:\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-        print(f"✓ Diagramma Mermaid salvato in: {mermaid_path}")
-        
-        # 2. Prova a generare l'immagine PNG
-        try:
-            png_data = graph.get_graph().draw_mermaid_png()
-            png_path = "supervisor_graph.png"
-            with open(png_path, "wb") as f:
-                f.write(png_data)
-            print(f"✓ Grafo PNG salvato in: {png_path}")
-        except Exception as png_error:
-            print(f"⚠ PNG non generato: {png_error}")
+        # Diagramma Mermaid (.md) e immagine (.png) rigenerati solo se la struttura è cambiata
+        rendering = render_graph_files(
+            graph, "supervisor_graph", "Grafo Supervisore Multiagente",
+            "Questo grafo mostra il flusso del supervisore che coordina i vari agenti:"
+        )
+        mermaid_code = rendering["mermaid"]
+        print(f"✓ Diagramma Mermaid salvato in: {rendering['md_path']}")
+        if rendering["png_path"]:
+            print(f"✓ Grafo PNG {'già aggiornato' if rendering['cached'] else 'salvato'} in: {rendering['png_path']}")
+        else:
+            print("⚠ PNG non generato: controlla i log")
         
         # Stampa il diagramma in console
         print("\n" + "="*70)
@@ -441,26 +745,59 @@ def visualize_supervisor_graph():
     print("="*70 + "\n")
 
 
-def run_supervisor(query: str) -> dict:
+def run_supervisor(query: str, session_id: str = "default", routing_response: str | None = None,
+                   deadline_s: float | None = None) -> dict:
     """
     Esegue il supervisore con la query dell'utente
     
     Args:
         query: La domanda dell'utente
+        session_id: ID della conversazione (le richieste in sospeso sono separate per sessione)
+        routing_response: Risposta di routing già ottenuta dal modello, per saltare la chiamata del router
+        deadline_s: Budget di latenza del turno in secondi (default: ALEXA_TURN_DEADLINE_S)
         
     Returns:
-        Il risultato finale dello stato del supervisore
+        Il risultato finale dello stato del supervisore, con l'uso dei token del turno in "llm_usage"
+        e "deadline_exceeded" a True se la risposta è parziale per il superamento del budget
     """
     graph = build_supervisor_agent()
+    # La scadenza non fa parte dello stato: i nodi la leggono dal contesto del turno (deadline.py)
+    deadline = deadline_after(deadline_s if deadline_s is not None else turn_budget())
     
     initial_state = {
         "user_query": query,
+        "session_id": session_id,
         "selected_agent": None,
+        "slots": None,
+        "routing_response": routing_response,
         "agent_result": None,
+        "intents": None,
+        "agent_results": [],
         "messages": []
     }
     
-    result = graph.invoke(initial_state)
+    with log_context(request_id=new_request_id(), session_id=conversation_manager.get_session_id(session_id)), \
+            track_turn() as llm_calls, deadline_scope(deadline) as degraded:
+        start = time.perf_counter()
+        result = graph.invoke(initial_state)
+        # Uso dei token del turno, con dettaglio per agente e per prompt
+        result["llm_usage"] = summarize_records(llm_calls)
+        
+        # Budget esaurito: si restituisce quanto pronto, segnalando che la risposta è parziale
+        result["deadline_exceeded"] = bool(degraded)
+        if degraded:
+            partial = extract_final_response(result, substantive_only=True)
+            answer = f"{partial}\n\n{PARTIAL_ANSWER_NOTICE}" if partial else TIMEOUT_ANSWER
+            result["messages"].append(AIMessage(content=answer))
+            logger.warning(
+                "Scadenza del turno superata: %s",
+                ", ".join(f"{event['agent']}/{event['node']} ({event['reason']})" for event in degraded)
+            )
+        
+        logger.info(
+            "Turno completato",
+            extra={"agent": result.get("selected_agent"), "latency_ms": elapsed_ms(start)}
+        )
     
     return result
 
@@ -469,7 +806,28 @@ def main():
     """
     Funzione principale del sistema multiagente
     Implementa il supervisore intelligente
+    Con il sottocomando `batch` elabora un file JSONL di query invece della sessione interattiva
     """
+    parser = argparse.ArgumentParser(description="Sistema multiagente Alexa-like")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Elabora le query di un file JSONL")
+    batch_parser.add_argument("input", help="File JSONL delle query ('-' per lo standard input)")
+    batch_parser.add_argument("-o", "--output", default="-", help="File JSONL dei risultati ('-' per lo standard output)")
+    batch_parser.add_argument("--concurrency", type=int, default=4, help="Turni eseguiti contemporaneamente")
+    batch_parser.add_argument("--timeout", type=float, default=None, help="Tempo massimo in secondi per query")
+    batch_parser.add_argument("--resume", action="store_true", help="Salta le query già presenti nel file di output")
+    batch_parser.add_argument("--retry-failed", action="store_true",
+                              help="Con --resume, esegue di nuovo le query con esito diverso da ok")
+    args = parser.parse_args()
+    
+    if args.command == "batch":
+        from batch_processing import run_batch_file
+        summary = run_batch_file(
+            args.input, args.output, args.concurrency, args.timeout, args.resume, args.retry_failed
+        )
+        print(json.dumps(summary), file=sys.stderr)
+        return
+    
     print("=" * 70)
     print("BENVENUTO NEL SISTEMA MULTIAGENTE ALEXA-LIKE")
     print("=" * 70)
@@ -489,8 +847,13 @@ def main():
     print("   - 'grafo-general' - Visualizza il grafo dell'agente conversazionale")
     print("   - 'grafo-calculator' - Visualizza il grafo dell'agente calcolatore")
     print("   - 'grafo-translator' - Visualizza il grafo dell'agente traduttore")
+    print("   - 'metriche' - Mostra le latenze p50/p95/p99 per agente e per nodo")
+    print("   - 'consumi' - Mostra i token e i costi LLM per agente e per prompt")
     print("  - 'esci' - Esce dall'applicazione\n")
     
+    # Espone le metriche su /metrics (porta configurabile con ALEXA_METRICS_PORT)
+    start_metrics_server()
+    
     while True:
         user_query = input("Tu: ").strip()
         
@@ -504,9 +867,20 @@ def main():
             print("\n")
             continue
         
+        if user_query.lower() == "consumi":
+            print("\n" + format_usage_report() + "\n")
+            continue
+        
+        if user_query.lower() == "metriche":
+            print("\n" + format_latency_report() + "\n")
+            if speculation_enabled():
+                print(format_speculation_report() + "\n")
+            continue
+        
         if user_query.lower() == "grafo-meteo":
             print("\n")
-            visualize_graph()
+            from agents.weather_agent import visualize_graph as visualize_weather_graph
+            visualize_weather_graph()
             print("\n")
             continue
         
@@ -0,0 +1,59 @@
+"""
+Risposte parziali del turno verso l'interfaccia
+Un nodo che produce la risposta a blocchi (es. la traduzione di un testo lungo)
+la pubblica con publish_partial man mano che è pronta; chi ha aperto
+partial_listener (l'interfaccia Gradio) la riceve mentre il turno è in corso.
+La callback viaggia in una variabile di contesto, come la scadenza del turno
+"""
+
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from logging_manager import get_logger
+
+
+logger = get_logger("partial_response")
+
+# Callback che riceve il testo parziale del turno corrente, None = nessuno in ascolto.
+# Le variabili di contesto si propagano ai thread dei nodi di LangGraph
+_listener: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar(
+    "turn_partial_listener", default=None
+)
+
+
+@contextmanager
+def partial_listener(callback: Callable[[str], None]):
+    """
+    Riceve le risposte parziali pubblicate nel blocco (un turno di conversazione)
+
+    Args:
+        callback: Funzione chiamata con il testo parziale, dal thread che lo pubblica
+    """
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def streaming_enabled() -> bool:
+    """Indica se qualcuno è in ascolto delle risposte parziali del turno"""
+    return _listener.get() is not None
+
+
+def publish_partial(text: str):
+    """
+    Pubblica il testo parziale della risposta, se qualcuno è in ascolto
+
+    Args:
+        text: La risposta fin qui (sostituisce quella pubblicata in precedenza)
+    """
+    callback = _listener.get()
+    if callback is None:
+        return
+    try:
+        callback(text)
+    except Exception as e:
+        # Un'interfaccia che non riceve l'aggiornamento non deve far fallire il turno
+        logger.warning("Risposta parziale non consegnata: %s", e)
@@ -0,0 +1,320 @@
+"""
+Limitazione della frequenza delle chiamate esterne (token bucket) con coda a priorità
+Nominatim consente al massimo una richiesta al secondo: le richieste passano da
+una coda servita da un solo thread, che ne esegue una per gettone disponibile.
+Le richieste degli utenti precedono i prefetch, e le richieste identiche in
+coda vengono unite. Le richieste degli utenti sono eseguite nel contesto
+(variabili di contesto, compresa la scadenza del turno) di chi le ha messe in coda
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from deadline import DeadlineExceeded
+from metrics import metrics_registry, Gauge, Histogram
+from logging_manager import get_logger
+
+
+logger = get_logger("rate_limiter")
+
+# Priorità (valori più bassi sono serviti prima)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_PREFETCH: "prefetch"}
+
+# Richieste di prefetch accettate in coda: oltre, i nuovi prefetch vengono scartati
+MAX_PREFETCH_QUEUED = 32
+
+
+def queue_wait() -> Histogram:
+    """Attesa in coda prima dell'esecuzione, per coda e priorità"""
+    return metrics_registry.histogram(
+        "alexa_rate_limiter_wait_seconds",
+        "Attesa in coda delle richieste soggette a limite di frequenza",
+        ("queue", "priority")
+    )
+
+
+def queue_depth() -> Gauge:
+    """Richieste in attesa per coda"""
+    return metrics_registry.gauge(
+        "alexa_rate_limiter_queue_depth",
+        "Richieste in attesa nella coda con limite di frequenza",
+        ("queue",)
+    )
+
+
+class TokenBucket:
+    """Token bucket: `rate` gettoni al secondo, al più `burst` accumulati"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """Aggiunge i gettoni maturati (da chiamare con il lock acquisito)"""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """
+        Prova a prendere un gettone
+
+        Returns:
+            0 se il gettone è stato preso, altrimenti i secondi da attendere
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Attende e prende un gettone"""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            time.sleep(delay)
+
+
+class _QueuedRequest:
+    """Richiesta in coda condivisa da tutti i chiamanti con la stessa chiave"""
+
+    def __init__(self, key: Hashable, priority: int, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        self.key = key
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.waiters = 0
+        # Variabili di contesto con cui eseguire fn: quelle di chi attende la richiesta
+        # (scadenza del turno compresa), un contesto vuoto per i prefetch
+        self.context = contextvars.copy_context() if priority == PRIORITY_INTERACTIVE else contextvars.Context()
+
+
+class PriorityRequestQueue:
+    """
+    Coda a priorità servita da un thread che rispetta il token bucket
+    Le richieste con la stessa chiave già in coda sono unite (e ne viene alzata la
+    priorità se necessario); se tutti i chiamanti smettono di attendere, la
+    richiesta resta in coda come prefetch e il risultato è consegnato a on_late_result
+    """
+
+    def __init__(self, name: str, bucket: TokenBucket):
+        self.name = name
+        self.bucket = bucket
+        self._heap: list = []
+        self._pending: Dict[Hashable, _QueuedRequest] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def _push(self, request: _QueuedRequest):
+        """Inserisce la richiesta nello heap (da chiamare con il lock acquisito)"""
+        heapq.heappush(self._heap, (request.priority, next(self._sequence), request))
+
+    def _ensure_worker(self):
+        """Avvia il thread della coda al primo utilizzo (da chiamare con il lock acquisito)"""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name=f"rate-limiter-{self.name}", daemon=True)
+            self._worker.start()
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args,
+               priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Optional[Future]:
+        """
+        Mette in coda una richiesta, o si unisce a quella con la stessa chiave già in coda
+
+        Args:
+            key: Chiave che identifica la richiesta
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+            priority: PRIORITY_INTERACTIVE o PRIORITY_PREFETCH
+
+        Returns:
+            Il Future con il risultato, oppure None se un prefetch è stato scartato (coda piena)
+        """
+        with self._condition:
+            request = self._pending.get(key)
+            if request is not None:
+                if priority < request.priority:
+                    # Un utente attende una richiesta nata come prefetch: la si sposta avanti,
+                    # da eseguire entro la sua scadenza
+                    request.priority = priority
+                    request.context = contextvars.copy_context()
+                    self._push(request)
+                return request.future
+
+            if priority == PRIORITY_PREFETCH:
+                queued_prefetch = sum(1 for r in self._pending.values() if r.priority == PRIORITY_PREFETCH)
+                if queued_prefetch >= MAX_PREFETCH_QUEUED:
+                    return None
+
+            request = _QueuedRequest(key, priority, fn, args, kwargs)
+            self._pending[key] = request
+            self._push(request)
+            queue_depth().set(len(self._pending), queue=self.name)
+            self._ensure_worker()
+            self._condition.notify()
+            return request.future
+
+    def call(self, key: Hashable, fn: Callable[..., Any], *args, timeout: Optional[float] = None,
+             on_late_result: Optional[Callable[[Any], None]] = None, **kwargs) -> Any:
+        """
+        Esegue una richiesta utente attraverso la coda e ne attende il risultato
+
+        Args:
+            key: Chiave che identifica la richiesta
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+            timeout: Attesa massima in secondi (None = senza limite)
+            on_late_result: Se l'attesa scade, riceve il risultato quando la richiesta
+                viene completata (es. per salvarlo in cache)
+
+        Returns:
+            Il risultato di fn
+
+        Raises:
+            DeadlineExceeded: Se il risultato non arriva entro il timeout
+        """
+        future = self.submit(key, fn, *args, priority=PRIORITY_INTERACTIVE, **kwargs)
+        with self._condition:
+            request = self._pending.get(key)
+            if request is not None and request.future is future:
+                request.waiters += 1
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            if on_late_result is not None:
+                def deliver(done: Future):
+                    if done.exception() is None:
+                        on_late_result(done.result())
+                future.add_done_callback(deliver)
+            raise DeadlineExceeded(f"Richiesta {self.name} ancora in coda allo scadere del tempo") from None
+        finally:
+            with self._condition:
+                request = self._pending.get(key)
+                if request is not None and request.future is future:
+                    request.waiters -= 1
+                    if request.waiters <= 0 and request.priority == PRIORITY_INTERACTIVE:
+                        # Nessuno attende più: la richiesta lascia il posto a quelle degli utenti
+                        # e non è più legata alla scadenza del turno che l'ha messa in coda
+                        request.priority = PRIORITY_PREFETCH
+                        request.context = contextvars.Context()
+                        self._push(request)
+
+    def _next(self) -> _QueuedRequest:
+        """Attende ed estrae la prossima richiesta valida"""
+        with self._condition:
+            while True:
+                while self._heap:
+                    priority, _, request = heapq.heappop(self._heap)
+                    # Le voci con priorità superata (spostate avanti o indietro) o già servite si scartano
+                    if self._pending.get(request.key) is request and request.priority == priority:
+                        return request
+                self._condition.wait()
+
+    def _run(self):
+        """Ciclo del thread: un gettone, poi la richiesta più prioritaria"""
+        while True:
+            self.bucket.acquire()
+            request = self._next()
+            with self._condition:
+                del self._pending[request.key]
+                queue_depth().set(len(self._pending), queue=self.name)
+            queue_wait().observe(
+                time.monotonic() - request.enqueued_at,
+                queue=self.name, priority=PRIORITY_NAMES.get(request.priority, str(request.priority))
+            )
+            try:
+                result = request.context.run(request.fn, *request.args, **request.kwargs)
+            except BaseException as e:
+                request.future.set_exception(e)
+            else:
+                request.future.set_result(result)
+
+    def depth(self) -> int:
+        """Richieste in attesa"""
+        with self._condition:
+            return len(self._pending)
+
+
+# Policy di Nominatim: al più una richiesta al secondo (ALEXA_NOMINATIM_RATE)
+nominatim_queue = PriorityRequestQueue(
+    "nominatim",
+    TokenBucket(rate=float(os.getenv("ALEXA_NOMINATIM_RATE", "1.0")), burst=1)
+)
+
+
+if __name__ == "__main__":
+    # Verifica: frequenza rispettata, priorità, richieste identiche unite, attesa con timeout
+    bucket = TokenBucket(rate=20.0, burst=1)
+    limited = PriorityRequestQueue("selfcheck", bucket)
+    executed = []
+
+    def upstream(city: str) -> str:
+        executed.append((city, time.monotonic()))
+        return city.upper()
+
+    start = time.monotonic()
+    prefetches = [limited.submit(f"p{i}", upstream, f"prefetch-{i}", priority=PRIORITY_PREFETCH) for i in range(3)]
+    assert limited.call("roma", upstream, "roma") == "ROMA"
+    assert limited.call("roma", upstream, "roma") == "ROMA"
+    for future in prefetches:
+        future.result(timeout=2)
+
+    cities = [city for city, _ in executed]
+    # La richiesta utente passa davanti ai prefetch ancora in coda
+    assert cities.index("roma") <= 1, cities
+    gaps = [later - earlier for (_, earlier), (_, later) in zip(executed, executed[1:])]
+    assert all(gap >= 1 / bucket.rate * 0.9 for gap in gaps), gaps
+
+    # Richieste identiche in coda sono unite
+    executed.clear()
+    futures = [limited.submit("milano", upstream, "milano") for _ in range(5)]
+    assert len({id(future) for future in futures}) == 1
+    futures[0].result(timeout=2)
+    assert len(executed) == 1
+
+    # Con un timeout troppo breve l'attesa fallisce, ma la richiesta viene eseguita comunque
+    slow = PriorityRequestQueue("selfcheck-slow", TokenBucket(rate=2.0, burst=1))
+    slow.call("a", upstream, "a")
+    try:
+        slow.call("b", upstream, "b", timeout=0.05)
+        raise AssertionError("DeadlineExceeded attesa")
+    except DeadlineExceeded:
+        pass
+    time.sleep(0.6)
+    assert slow.depth() == 0 and executed[-1][0] == "b"
+
+    # Il risultato arrivato dopo la scadenza è consegnato a on_late_result
+    late = []
+    try:
+        slow.call("c", upstream, "c", timeout=0.05, on_late_result=late.append)
+        raise AssertionError("DeadlineExceeded attesa")
+    except DeadlineExceeded:
+        pass
+    time.sleep(0.6)
+    assert late == ["C"], late
+
+    # fn è eseguita con le variabili di contesto di chi attende, i prefetch con un contesto vuoto
+    caller = contextvars.ContextVar("selfcheck_caller", default=None)
+    caller.set("turno")
+    assert limited.call("contesto", caller.get) == "turno"
+    assert limited.submit("prefetch-contesto", caller.get, priority=PRIORITY_PREFETCH).result(timeout=2) is None
+
+    print(f"OK: {len(cities)} richieste in {time.monotonic() - start:.2f}s a 20 req/s, priorità e unione verificate")
@@ -0,0 +1,322 @@
+"""
+Cache semantica delle risposte LLM dell'agente Wikipedia
+Le risposte sono indicizzate per (titolo della pagina, domanda normalizzata).
+Le parafrasi della stessa domanda sulla stessa pagina ("chi era Leonardo?",
+"dimmi chi era Leonardo da Vinci") sono riconosciute con la similarità del
+coseno tra vettori TF-IDF di n-grammi di caratteri, calcolati in locale.
+Due domande sono equivalenti solo se hanno le stesse parole di contenuto:
+"quando è nato Leonardo?" e "quando è morto Leonardo?" sono simili come
+testo ma non hanno la stessa risposta
+"""
+
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter as TermCounts, OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from metrics import metrics_registry, Counter, Histogram
+from logging_manager import get_logger
+
+
+logger = get_logger("semantic_cache")
+
+# Similarità minima perché due domande sulla stessa pagina (con le stesse parole di contenuto)
+# siano considerate equivalenti
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("ALEXA_ANSWER_CACHE_THRESHOLD", "0.85"))
+
+# Validità delle risposte in secondi
+DEFAULT_TTL_S = float(os.getenv("ALEXA_ANSWER_CACHE_TTL_S", "86400"))
+
+# Risposte conservate prima di scartare le meno usate
+DEFAULT_MAX_ENTRIES = int(os.getenv("ALEXA_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Lunghezza degli n-grammi di caratteri
+NGRAM_SIZE = 3
+
+# Formule di cortesia che non cambiano il significato della domanda
+FILLER_WORDS = {
+    "dimmi", "dammi", "spiegami", "raccontami", "sai", "dirmi", "puoi", "potresti",
+    "mi", "per", "favore", "cortesia", "vorrei", "sapere", "ciao", "alexa", "dire",
+}
+
+# Articoli, preposizioni e ausiliari: le domande che differiscono solo per queste
+# parole sono parafrasi. Le parole interrogative (chi, quando, dove...) sono di contenuto
+STOPWORDS = {
+    "il", "lo", "la", "i", "gli", "le", "l", "un", "uno", "una",
+    "di", "del", "dello", "della", "dei", "degli", "delle", "dell", "d",
+    "a", "al", "allo", "alla", "ai", "agli", "alle", "all",
+    "da", "dal", "dallo", "dalla", "dai", "dagli", "dalle", "dall",
+    "in", "nel", "nello", "nella", "nei", "negli", "nelle", "nell",
+    "con", "su", "sul", "sullo", "sulla", "sui", "sugli", "sulle", "sull", "tra", "fra",
+    "e", "ed", "o", "che", "ci", "si", "ne",
+    "era", "sono", "erano", "sia", "stato", "stata", "ha", "hanno", "aveva", "avevano",
+}
+
+# Segnaposto delle parole di contenuto per una menzione del titolo della pagina
+TITLE_MARKER = "<titolo>"
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def answer_cache_lookups() -> Counter:
+    """Ricerche nella cache per esito: exact, similar o miss"""
+    return metrics_registry.counter(
+        "alexa_answer_cache_total",
+        "Ricerche nella cache semantica delle risposte per esito",
+        ("cache", "outcome")
+    )
+
+
+def answer_cache_latency() -> Histogram:
+    """Durata delle ricerche nella cache per esito"""
+    return metrics_registry.histogram(
+        "alexa_answer_cache_lookup_seconds",
+        "Durata delle ricerche nella cache semantica delle risposte",
+        ("cache", "outcome")
+    )
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizza una domanda per il confronto
+
+    Args:
+        question: La domanda dell'utente
+
+    Returns:
+        La domanda in minuscolo, senza accenti, punteggiatura e formule di cortesia
+    """
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _NON_WORD.sub(" ", text)
+    words = [word for word in text.split() if word not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def _stem(word: str) -> str:
+    """Toglie la vocale finale, così singolare e plurale o maschile e femminile coincidono"""
+    return word[:-1] if len(word) > 3 and word[-1] in "aeio" else word
+
+
+def content_words(normalized: str, page_title: str) -> Tuple[frozenset, str]:
+    """
+    Parole di contenuto di una domanda normalizzata
+
+    Args:
+        normalized: La domanda normalizzata con normalize_question
+        page_title: Titolo della pagina Wikipedia
+
+    Returns:
+        Tupla (parole di contenuto, testo senza le parole del titolo). Le parole del titolo
+        sono sostituite da un unico segnaposto: "chi era Leonardo" e "chi era Leonardo
+        da Vinci" hanno le stesse parole di contenuto, "quando è nato?" no
+    """
+    title_words = set(normalize_question(page_title).split())
+    words, rest = set(), []
+    for word in normalized.split():
+        if word in title_words:
+            words.add(TITLE_MARKER)
+            continue
+        rest.append(word)
+        if word not in STOPWORDS:
+            words.add(_stem(word))
+    return frozenset(words), " ".join(rest)
+
+
+def char_ngrams(text: str, size: int = NGRAM_SIZE) -> TermCounts:
+    """Conta gli n-grammi di caratteri di ogni parola (con gli spazi ai bordi)"""
+    grams = TermCounts()
+    for word in text.split():
+        padded = f" {word} "
+        if len(padded) <= size:
+            grams[padded] += 1
+            continue
+        for i in range(len(padded) - size + 1):
+            grams[padded[i:i + size]] += 1
+    return grams
+
+
+class SemanticAnswerCache:
+    """
+    Cache delle risposte per (titolo, domanda) con ricerca delle domande simili
+    L'IDF è calcolato sulle domande presenti in cache e aggiornato a ogni inserimento
+    """
+
+    def __init__(self, name: str, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl: float = DEFAULT_TTL_S, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (titolo, domanda normalizzata) -> (risposta, n-grammi, istante di inserimento, parole di contenuto)
+        self._entries: OrderedDict = OrderedDict()
+        # Numero di domande in cache che contengono ciascun n-gramma
+        self._document_frequency: TermCounts = TermCounts()
+        # Titolo -> domande in cache per la pagina (la ricerca confronta solo queste)
+        self._pages: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def _idf(self, gram: str) -> float:
+        """IDF con smoothing (da chiamare con il lock acquisito)"""
+        documents = len(self._entries)
+        return math.log((1 + documents) / (1 + self._document_frequency[gram])) + 1
+
+    def _vector(self, grams: TermCounts) -> Dict[str, float]:
+        """Vettore TF-IDF normalizzato (da chiamare con il lock acquisito)"""
+        weights = {gram: count * self._idf(gram) for gram, count in grams.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {gram: weight / norm for gram, weight in weights.items()}
+
+    def _remove(self, key: Hashable):
+        """Elimina un elemento aggiornando le frequenze (da chiamare con il lock acquisito)"""
+        _, grams, _, _ = self._entries.pop(key)
+        for gram in grams:
+            self._document_frequency[gram] -= 1
+            if not self._document_frequency[gram]:
+                del self._document_frequency[gram]
+        questions = self._pages[key[0]]
+        questions.discard(key)
+        if not questions:
+            del self._pages[key[0]]
+
+    def _find(self, page_title: str, normalized: str) -> Tuple[Optional[str], str, float]:
+        """Cerca la risposta (da chiamare con il lock acquisito)"""
+        now = time.monotonic()
+        exact = self._entries.get((page_title, normalized))
+        if exact is not None and now - exact[2] < self.ttl:
+            self._entries.move_to_end((page_title, normalized))
+            return exact[0], "exact", 1.0
+
+        words, rest = content_words(normalized, page_title)
+        query_vector = self._vector(char_ngrams(rest))
+        best_key, best_score = None, 0.0
+        for key in self._pages.get(page_title, ()):
+            _, grams, stored_at, stored_words = self._entries[key]
+            # Le parafrasi differiscono solo per formule di cortesia, articoli e preposizioni
+            if now - stored_at >= self.ttl or stored_words != words:
+                continue
+            vector = self._vector(grams)
+            score = sum(weight * vector.get(gram, 0.0) for gram, weight in query_vector.items())
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is not None and best_score >= self.threshold:
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][0], "similar", best_score
+        return None, "miss", best_score
+
+    def get(self, page_title: str, question: str) -> Optional[str]:
+        """
+        Cerca la risposta a una domanda uguale o simile sulla stessa pagina
+
+        Args:
+            page_title: Titolo della pagina Wikipedia usata per rispondere
+            question: La domanda dell'utente
+
+        Returns:
+            La risposta in cache, oppure None
+        """
+        start = time.perf_counter()
+        normalized = normalize_question(question)
+        with self._lock:
+            answer, outcome, score = self._find(page_title, normalized)
+
+        answer_cache_lookups().inc(cache=self.name, outcome=outcome)
+        answer_cache_latency().observe(time.perf_counter() - start, cache=self.name, outcome=outcome)
+        if outcome == "similar":
+            logger.debug("Domanda simile in cache per '%s' (similarità %.2f): %r", page_title, score, question)
+        return answer
+
+    def put(self, page_title: str, question: str, answer: str):
+        """
+        Salva la risposta a una domanda
+
+        Args:
+            page_title: Titolo della pagina Wikipedia usata per rispondere
+            question: La domanda dell'utente
+            answer: La risposta generata
+        """
+        normalized = normalize_question(question)
+        key = (page_title, normalized)
+        words, rest = content_words(normalized, page_title)
+        grams = char_ngrams(rest)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, grams, time.monotonic(), words)
+            self._document_frequency.update(grams.keys())
+            self._pages.setdefault(page_title, set()).add(key)
+
+            # Scarta prima le risposte scadute, poi le meno usate
+            now = time.monotonic()
+            for expired_key in [k for k, (_, _, stored_at, _) in self._entries.items() if now - stored_at >= self.ttl]:
+                self._remove(expired_key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Svuota la cache (usato dai benchmark)"""
+        with self._lock:
+            self._entries.clear()
+            self._document_frequency.clear()
+            self._pages.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Cache condivisa delle risposte dell'agente Wikipedia
+wikipedia_answer_cache = SemanticAnswerCache("wikipedia")
+
+
+if __name__ == "__main__":
+    # Verifica: parafrasi riconosciute, domande diverse sulla stessa pagina e altre pagine no
+    cache = SemanticAnswerCache("selfcheck")
+    cache.put("Leonardo da Vinci", "chi era Leonardo?", "Un artista e inventore del Rinascimento.")
+    cache.put("Leonardo da Vinci", "quando è morto Leonardo da Vinci?", "Nel 1519.")
+    cache.put("Leonardo da Vinci", "quando è nato Leonardo?", "Nato nel 1452.")
+    cache.put("Torre di Pisa", "quanto è alta la torre di Pisa?", "Circa 56 metri.")
+
+    paraphrases = [
+        "Dimmi chi era Leonardo da Vinci",
+        "chi era leonardo",
+        "Mi sai dire chi era Leonardo, per favore?",
+    ]
+    for question in paraphrases:
+        assert cache.get("Leonardo da Vinci", question) == "Un artista e inventore del Rinascimento.", question
+
+    assert cache.get("Leonardo da Vinci", "Quando è morto Leonardo?") == "Nel 1519."
+    assert cache.get("Leonardo da Vinci", "Dimmi quando è nato Leonardo da Vinci") == "Nato nel 1452."
+
+    # Domande simili come testo ma con un'altra risposta
+    negatives = [
+        "quando è morto Leonardo?",
+        "quando è nato?",
+        "dove è nato Leonardo?",
+        "quando è nato il padre di Leonardo?",
+    ]
+    for question in negatives:
+        assert cache.get("Leonardo da Vinci", question) != "Nato nel 1452.", question
+    assert cache.get("Leonardo da Vinci", "Quali opere ha dipinto Leonardo?") is None
+    # Un verbo diverso non è riconosciuto: meglio una chiamata LLM in più che una risposta sbagliata
+    assert cache.get("Leonardo da Vinci", "Quando morì Leonardo?") is None
+    assert cache.get("Michelangelo", "chi era Leonardo?") is None
+
+    # Scadenza ed eliminazione delle meno usate
+    short = SemanticAnswerCache("selfcheck-ttl", ttl=0.05, max_entries=2)
+    short.put("A", "prima domanda", "1")
+    time.sleep(0.06)
+    assert short.get("A", "prima domanda") is None
+    short.put("A", "seconda domanda", "2")
+    short.put("B", "terza domanda", "3")
+    short.put("C", "quarta domanda", "4")
+    assert len(short) == 2 and short.get("A", "seconda domanda") is None
+
+    lookups = answer_cache_lookups()
+    print({outcome: lookups.value(cache="selfcheck", outcome=outcome) for outcome in ("exact", "similar", "miss")})
+    print("OK: parafrasi riconosciute, domande con altre parole di contenuto e pagine diverse escluse")
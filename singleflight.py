@@ -0,0 +1,172 @@
+"""
+Coalescenza delle chiamate esterne identiche in corso (single-flight)
+Se più turni concorrenti chiedono la stessa cosa (es. "meteo Roma oggi"),
+solo il primo effettua la chiamata verso Nominatim, Open-Meteo, l'API
+Horoscope, Wikipedia o l'LLM: gli altri attendono e ne condividono il risultato
+"""
+
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from metrics import metrics_registry, Counter
+from deadline import stage_timeout, DeadlineExceeded
+from logging_manager import get_logger
+
+
+logger = get_logger("singleflight")
+
+
+def singleflight_calls() -> Counter:
+    """Chiamate per gruppo: executed (chiamata effettiva) o coalesced (risultato condiviso)"""
+    return metrics_registry.counter(
+        "alexa_singleflight_total",
+        "Chiamate esterne eseguite o unite a una chiamata identica già in corso",
+        ("group", "outcome")
+    )
+
+
+class SingleFlight:
+    """
+    Gruppo di chiamate coalescenti: per ogni chiave è in corso al più una chiamata
+    Il risultato è condiviso tra tutti i chiamanti e non deve essere modificato
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Esegue fn, oppure attende la chiamata con la stessa chiave già in corso
+
+        Args:
+            key: Chiave che identifica la richiesta
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+
+        Returns:
+            Tupla (risultato, coalesced); coalesced è True se il risultato è di un'altra chiamata.
+            Se la chiamata fallisce l'eccezione viene sollevata a tutti i chiamanti
+
+        Raises:
+            DeadlineExceeded: Se la scadenza del turno passa mentre si attende la chiamata in corso
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            singleflight_calls().inc(group=self.group, outcome="coalesced")
+            logger.debug("Chiamata %s unita a quella in corso: %r", self.group, key)
+            # Chi attende rispetta la scadenza del proprio turno, non quella di chi esegue la chiamata
+            try:
+                return future.result(timeout=stage_timeout()), True
+            except FutureTimeout:
+                if future.done():
+                    # Timeout sollevato dalla chiamata stessa: è il suo esito
+                    raise
+                raise DeadlineExceeded(f"Chiamata {self.group} ancora in corso allo scadere del tempo") from None
+
+        singleflight_calls().inc(group=self.group, outcome="executed")
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            # La chiave viene liberata a chiamata conclusa: le richieste successive rifanno la chiamata
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Numero di chiamate attualmente in corso"""
+        with self._lock:
+            return len(self._calls)
+
+
+# Gruppi condivisi dagli agenti
+geocoding_flight = SingleFlight("nominatim")
+forecast_flight = SingleFlight("open_meteo")
+hourly_forecast_flight = SingleFlight("open_meteo_hourly")
+horoscope_flight = SingleFlight("horoscope")
+wikipedia_flight = SingleFlight("wikipedia")
+llm_flight = SingleFlight("llm")
+
+
+if __name__ == "__main__":
+    # Verifica: N richieste identiche in parallelo producono una sola chiamata
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    parallel = 16
+    upstream_calls = []
+    barrier = threading.Barrier(parallel)
+    flight = SingleFlight("selfcheck")
+
+    def upstream(city: str) -> dict:
+        upstream_calls.append(city)
+        time.sleep(0.1)
+        return {"city": city}
+
+    def request(_):
+        barrier.wait()
+        return flight.do(("geocode", "roma"), upstream, "Roma")
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(request, range(parallel)))
+
+    coalesced = sum(shared for _, shared in results)
+    assert len(upstream_calls) == 1, upstream_calls
+    assert coalesced == parallel - 1
+    assert all(result is results[0][0] for result, _ in results)
+    assert flight.in_flight() == 0
+
+    # Gli errori sono propagati a tutti i chiamanti e la chiave viene liberata
+    def failing():
+        time.sleep(0.05)
+        raise ConnectionError("servizio non raggiungibile")
+
+    errors = []
+
+    def failing_request(_):
+        try:
+            flight.do("errore", failing)
+        except ConnectionError as e:
+            errors.append(e)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(failing_request, range(4)))
+    assert len(errors) == 4 and flight.in_flight() == 0
+
+    # Chi si unisce a una chiamata lenta smette di attendere alla scadenza del proprio turno
+    from deadline import deadline_scope, deadline_after
+
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return "lenta"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "lenta", slow)
+        started.wait()
+        begin = time.monotonic()
+        with deadline_scope(deadline_after(0.05)):
+            try:
+                flight.do("lenta", slow)
+                raise AssertionError("DeadlineExceeded attesa")
+            except DeadlineExceeded:
+                pass
+        assert time.monotonic() - begin < 0.2
+        assert leader.result() == ("lenta", False)
+
+    print(f"OK: {parallel} richieste parallele, 1 chiamata esterna, {coalesced} coalescenti")
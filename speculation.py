@@ -0,0 +1,210 @@
+"""
+Esecuzione speculativa dell'estrazione degli slot in parallelo al routing
+Un predittore a parole chiave indovina l'agente più probabile e ne avvia
+l'estrazione mentre il supervisore decide: se il routing conferma l'agente
+gli slot vengono usati, altrimenti il risultato viene scartato. Le speculazioni
+non ancora avviate alla fine del routing vengono annullate, e l'attesa di quelle
+confermate non supera il tempo rimanente del turno
+"""
+
+import os
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import Optional
+
+from agents import get_slot_extractor
+from metrics import metrics_registry, Counter, Histogram
+from logging_manager import get_logger
+from deadline import stage_timeout
+
+
+logger = get_logger("speculation")
+
+# Parole chiave per agente: ogni occorrenza vale un punto
+AGENT_KEYWORDS = {
+    "WEATHER": (
+        "meteo", "tempo fa", "che tempo", "piove", "pioverà", "pioggia", "neve", "nevica",
+        "temperatura", "vento", "soleggiato", "nuvoloso", "previsioni", "caldo", "freddo",
+    ),
+    "HOROSCOPE": (
+        "oroscopo", "segno zodiacale", "ariete", "toro", "gemelli", "cancro", "leone", "vergine",
+        "bilancia", "scorpione", "sagittario", "capricorno", "acquario", "pesci",
+    ),
+    "CALCULATOR": (
+        "quanto fa", "calcola", "converti", "risolvi", "percentuale", "%", "radice",
+        "equazione", "miglia", "chilometri", "fahrenheit", "celsius", "libbre",
+    ),
+    "TRANSLATOR": (
+        "traduci", "tradurre", "traduzione", "come si dice", "che significa", "in inglese",
+        "in francese", "in spagnolo", "in tedesco",
+    ),
+}
+
+# Un'operazione aritmetica esplicita (es. "23 * 45") indica il calcolatore
+ARITHMETIC_PATTERN = re.compile(r"\d\s*[-+*/x^]\s*\d")
+
+# Punteggio minimo per avviare una speculazione
+MIN_SCORE = 1
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculation")
+
+
+def speculation_enabled() -> bool:
+    """Indica se l'estrazione speculativa è attiva (variabile ALEXA_SPECULATIVE_ROUTING)"""
+    return os.getenv("ALEXA_SPECULATIVE_ROUTING", "").lower() in ("1", "true", "yes")
+
+
+def speculation_outcomes() -> Counter:
+    """Esito delle speculazioni: committed, discarded, cancelled (non avviate in tempo) o failed"""
+    return metrics_registry.counter(
+        "alexa_speculation_total",
+        "Estrazioni speculative per agente previsto ed esito",
+        ("agent", "outcome")
+    )
+
+
+def speculation_saved() -> Histogram:
+    """Latenza risparmiata dalle speculazioni confermate"""
+    return metrics_registry.histogram(
+        "alexa_speculation_saved_seconds",
+        "Latenza risparmiata sovrapponendo estrazione e routing",
+        ("agent",)
+    )
+
+
+def predict_agent(query: str) -> Optional[str]:
+    """
+    Predice l'agente più probabile con un punteggio a parole chiave
+
+    Args:
+        query: La domanda dell'utente
+
+    Returns:
+        Il nome dell'agente, oppure None se nessun agente raggiunge il punteggio minimo
+    """
+    q = query.lower()
+    scores = {agent: sum(keyword in q for keyword in keywords) for agent, keywords in AGENT_KEYWORDS.items()}
+    if ARITHMETIC_PATTERN.search(q):
+        scores["CALCULATOR"] += 1
+
+    agent, score = max(scores.items(), key=lambda item: item[1])
+    return agent if score >= MIN_SCORE else None
+
+
+class Speculation:
+    """Estrazione speculativa in corso per l'agente previsto"""
+
+    def __init__(self, agent: str, future: Future):
+        self.agent = agent
+        self.future = future
+
+    def resolve(self, routed_agent: str, route_seconds: float) -> Optional[dict]:
+        """
+        Conferma o scarta la speculazione in base alla decisione del supervisore
+
+        Args:
+            routed_agent: Agente scelto dal routing
+            route_seconds: Durata della chiamata di routing
+
+        Returns:
+            Gli slot estratti se la previsione era corretta e l'estrazione è terminata
+            entro la scadenza del turno, altrimenti None (l'agente estrae gli slot da sé)
+        """
+        if routed_agent != self.agent:
+            # Il risultato non serve: se non è ancora partita la speculazione libera subito
+            # il worker, altrimenti termina in background (entro la scadenza del turno) e viene ignorata
+            self.future.cancel()
+            speculation_outcomes().inc(agent=self.agent, outcome="discarded")
+            logger.debug("Speculazione scartata: previsto %s, scelto %s", self.agent, routed_agent)
+            return None
+
+        if self.future.cancel():
+            # Ancora in coda dietro altre speculazioni: non si risparmia nulla, l'agente
+            # esegue il proprio nodo di estrazione
+            speculation_outcomes().inc(agent=self.agent, outcome="cancelled")
+            logger.debug("Speculazione per %s non avviata prima della fine del routing", self.agent)
+            return None
+
+        try:
+            slots, extract_seconds = self.future.result(timeout=stage_timeout())
+        except FutureTimeout:
+            speculation_outcomes().inc(agent=self.agent, outcome="failed")
+            logger.warning("Estrazione speculativa per %s non terminata entro la scadenza del turno", self.agent)
+            return None
+        except Exception as e:
+            speculation_outcomes().inc(agent=self.agent, outcome="failed")
+            logger.warning("Estrazione speculativa fallita per %s: %s", self.agent, e)
+            return None
+
+        # Le due chiamate si sovrappongono: si risparmia la più breve delle due
+        speculation_outcomes().inc(agent=self.agent, outcome="committed")
+        speculation_saved().observe(min(extract_seconds, route_seconds), agent=self.agent)
+        return slots
+
+
+def _timed_extraction(extractor, query: str):
+    """Esegue l'estrazione misurandone la durata"""
+    start = time.perf_counter()
+    slots = extractor(query)
+    return slots, time.perf_counter() - start
+
+
+def start_speculation(query: str) -> Optional[Speculation]:
+    """
+    Avvia in background l'estrazione degli slot dell'agente più probabile
+
+    Args:
+        query: La domanda dell'utente
+
+    Returns:
+        La speculazione avviata, oppure None se nessun agente è stato previsto
+    """
+    agent = predict_agent(query)
+    if agent is None:
+        return None
+
+    try:
+        extractor = get_slot_extractor(agent)
+    except Exception as e:
+        logger.warning("Impossibile avviare la speculazione per %s: %s", agent, e)
+        return None
+    if extractor is None:
+        return None
+
+    # Copia il contesto per conservare request_id nei log e il conteggio dei token del turno
+    context = contextvars.copy_context()
+    future = _executor.submit(context.run, _timed_extraction, extractor, query)
+    logger.debug("Avviata estrazione speculativa per %s", agent)
+    return Speculation(agent, future)
+
+
+def format_speculation_report() -> str:
+    """
+    Riepilogo delle speculazioni: esiti, tasso di spreco e latenza risparmiata
+
+    Returns:
+        Il report formattato come tabella
+    """
+    outcomes = speculation_outcomes()
+    saved = speculation_saved().stats()
+    lines = [
+        f"{'AGENTE':<12} {'CONFERMATE':>10} {'SCARTATE':>9} {'ANNULLATE':>9} {'FALLITE':>8} "
+        f"{'SPRECO':>7} {'RISPARMIO p50 ms':>17}"
+    ]
+
+    for agent in AGENT_KEYWORDS:
+        committed = outcomes.value(agent=agent, outcome="committed")
+        discarded = outcomes.value(agent=agent, outcome="discarded")
+        cancelled = outcomes.value(agent=agent, outcome="cancelled")
+        failed = outcomes.value(agent=agent, outcome="failed")
+        total = committed + discarded + cancelled + failed
+        if not total:
+            continue
+        saved_p50 = saved.get((agent,), {}).get("p50", 0.0) * 1000
+        lines.append(
+            f"{agent:<12} {committed:>10.0f} {discarded:>9.0f} {cancelled:>9.0f} {failed:>8.0f} "
+            f"{discarded / total:>7.0%} {saved_p50:>17.1f}"
+        )
+    return "\n".join(lines)
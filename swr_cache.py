@@ -0,0 +1,296 @@
+"""
+Cache stale-while-revalidate per i dati meteo e gli oroscopi
+Un dato scaduto da poco (entro la finestra di tolleranza) viene restituito
+subito e aggiornato in background: una previsione di 50 minuti fa è meglio di
+800 ms di attesa. Oltre la tolleranza il dato viene richiesto di nuovo
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional, Set
+
+from singleflight import SingleFlight, forecast_flight, hourly_forecast_flight, horoscope_flight, geocoding_flight
+from metrics import metrics_registry, Counter
+from logging_manager import get_logger
+
+
+logger = get_logger("swr_cache")
+
+# Elementi conservati per cache prima di scartare i meno usati
+DEFAULT_MAX_ENTRIES = 512
+
+# Thread dedicati agli aggiornamenti in background (condivisi da tutte le cache)
+REVALIDATION_WORKERS = 4
+
+
+def cache_lookups() -> Counter:
+    """Letture per cache ed esito: hit (dato fresco), stale (dato scaduto restituito) o miss"""
+    return metrics_registry.counter(
+        "alexa_swr_cache_total",
+        "Letture delle cache stale-while-revalidate per esito",
+        ("cache", "outcome")
+    )
+
+
+def cache_revalidations() -> Counter:
+    """Aggiornamenti in background: refreshed, failed o deduplicated (già in corso)"""
+    return metrics_registry.counter(
+        "alexa_swr_revalidations_total",
+        "Aggiornamenti in background delle cache stale-while-revalidate",
+        ("cache", "outcome")
+    )
+
+
+_revalidation_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_revalidation_pool() -> ThreadPoolExecutor:
+    """Crea al primo utilizzo il pool degli aggiornamenti in background"""
+    global _revalidation_pool
+    if _revalidation_pool is None:
+        with _pool_lock:
+            if _revalidation_pool is None:
+                _revalidation_pool = ThreadPoolExecutor(
+                    max_workers=REVALIDATION_WORKERS, thread_name_prefix="swr-revalidate"
+                )
+    return _revalidation_pool
+
+
+class SWRCache:
+    """
+    Cache in memoria con tempo di validità (ttl) e finestra di tolleranza (grace)
+    Età < ttl: hit. Età < ttl + grace: stale, restituito subito e aggiornato in
+    background (un solo aggiornamento per chiave). Oltre: miss, chiamata sincrona
+    """
+
+    def __init__(self, name: str, ttl: float, grace: float, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 flight: Optional[SingleFlight] = None):
+        self.name = name
+        self.ttl = ttl
+        self.grace = grace
+        self.max_entries = max_entries
+        self.flight = flight
+        self._entries: OrderedDict = OrderedDict()
+        self._revalidating: Set[Hashable] = set()
+        self._lock = threading.Lock()
+
+    def _load(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Esegue la chiamata (condivisa con quelle identiche in corso, se c'è un gruppo) e salva il risultato"""
+        if self.flight is not None:
+            value, _ = self.flight.do(key, fn, *args, **kwargs)
+        else:
+            value = fn(*args, **kwargs)
+        self.put(key, value)
+        return value
+
+    def _revalidate(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs):
+        """Aggiorna in background un elemento scaduto"""
+        try:
+            self._load(key, fn, *args, **kwargs)
+            cache_revalidations().inc(cache=self.name, outcome="refreshed")
+        except Exception as e:
+            # Il dato scaduto resta valido fino alla fine della tolleranza
+            cache_revalidations().inc(cache=self.name, outcome="failed")
+            logger.warning("Aggiornamento in background di %s %r non riuscito: %s", self.name, key, e)
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _lookup(self, key: Hashable) -> tuple:
+        """
+        Cerca la chiave e ne determina l'esito, prenotando l'aggiornamento dei dati scaduti
+
+        Returns:
+            (esito, dato, aggiornamento da avviare, età del dato)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return "miss", None, False, None
+            value, stored_at = entry
+            age = now - stored_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return "hit", value, False, age
+            if age < self.ttl + self.grace:
+                self._entries.move_to_end(key)
+                revalidate = key not in self._revalidating
+                if revalidate:
+                    self._revalidating.add(key)
+                return "stale", value, revalidate, age
+            return "miss", None, False, age
+
+    def _serve_stale(self, key: Hashable, age: float, revalidate: bool, fn: Callable[..., Any], *args, **kwargs):
+        """Avvia l'aggiornamento in background di un dato scaduto, se non è già in corso"""
+        if revalidate:
+            logger.debug("Dato %s %r scaduto da %.0fs: aggiornamento in background", self.name, key, age - self.ttl)
+            _get_revalidation_pool().submit(self._revalidate, key, fn, *args, **kwargs)
+        else:
+            cache_revalidations().inc(cache=self.name, outcome="deduplicated")
+
+    def get(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Restituisce il dato della chiave, richiedendolo o aggiornandolo se necessario
+
+        Args:
+            key: Chiave del dato (es. le coordinate o l'URL)
+            fn: Funzione che effettua la chiamata esterna
+            *args, **kwargs: Argomenti di fn
+
+        Returns:
+            Il dato, eventualmente scaduto da meno di `grace` secondi
+        """
+        outcome, value, revalidate, age = self._lookup(key)
+        cache_lookups().inc(cache=self.name, outcome=outcome)
+        if outcome == "hit":
+            return value
+        if outcome == "stale":
+            self._serve_stale(key, age, revalidate, fn, *args, **kwargs)
+            return value
+
+        return self._load(key, fn, *args, **kwargs)
+
+    def get_many(self, keys: list, fn: Callable[[list], list]) -> list:
+        """
+        Restituisce i dati di più chiavi richiedendo quelli mancanti con una sola chiamata
+
+        Args:
+            keys: Le chiavi dei dati
+            fn: Funzione che riceve una lista di chiavi e restituisce i dati nello stesso ordine
+                (usata anche, con una sola chiave, per aggiornare i dati scaduti)
+
+        Returns:
+            I dati nell'ordine delle chiavi
+        """
+        values = [None] * len(keys)
+        missing = []
+        for index, key in enumerate(keys):
+            outcome, value, revalidate, age = self._lookup(key)
+            cache_lookups().inc(cache=self.name, outcome=outcome)
+            if outcome == "miss":
+                missing.append(index)
+                continue
+            if outcome == "stale":
+                self._serve_stale(key, age, revalidate, self._first, fn, [key])
+            values[index] = value
+
+        if missing:
+            loaded = fn([keys[index] for index in missing])
+            for index, value in zip(missing, loaded):
+                self.put(keys[index], value)
+                values[index] = value
+        return values
+
+    @staticmethod
+    def _first(fn: Callable[[list], list], keys: list) -> Any:
+        """Adatta una funzione per più chiavi all'aggiornamento di una sola"""
+        return fn(keys)[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Salva un dato appena ottenuto, scartando i meno usati oltre il limite"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Secondi trascorsi dal salvataggio del dato, oppure None se la chiave non è in cache"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[1]
+
+    def clear(self):
+        """Svuota la cache (usato dai benchmark)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Previsioni per coordinate: fresche per 30 minuti, servite scadute fino a un'ora dopo
+forecast_cache = SWRCache(
+    "forecast",
+    ttl=float(os.getenv("ALEXA_FORECAST_TTL_S", "1800")),
+    grace=float(os.getenv("ALEXA_FORECAST_GRACE_S", "3600")),
+    flight=forecast_flight
+)
+
+# Previsioni orarie per coordinate: stessa validità, sono richieste una volta e poi sezionate
+hourly_forecast_cache = SWRCache(
+    "hourly_forecast",
+    ttl=float(os.getenv("ALEXA_FORECAST_TTL_S", "1800")),
+    grace=float(os.getenv("ALEXA_FORECAST_GRACE_S", "3600")),
+    flight=hourly_forecast_flight
+)
+
+# Oroscopi per URL (segno e periodo): freschi per un'ora, serviti scaduti fino a tre ore dopo
+horoscope_cache = SWRCache(
+    "horoscope",
+    ttl=float(os.getenv("ALEXA_HOROSCOPE_TTL_S", "3600")),
+    grace=float(os.getenv("ALEXA_HOROSCOPE_GRACE_S", "10800")),
+    flight=horoscope_flight
+)
+
+# Coordinate per località: valide una settimana, senza tolleranza perché le località
+# più richieste vengono aggiornate in anticipo (vedi prefetch_trending_locations)
+geocoding_cache = SWRCache(
+    "geocoding",
+    ttl=float(os.getenv("ALEXA_GEOCODING_TTL_S", "604800")),
+    grace=0.0,
+    max_entries=int(os.getenv("ALEXA_GEOCODING_MAX_ENTRIES", "4096")),
+    flight=geocoding_flight
+)
+
+
+if __name__ == "__main__":
+    # Verifica: hit, dato scaduto restituito subito con un solo aggiornamento in background, miss
+    upstream_calls = []
+    cache = SWRCache("selfcheck", ttl=0.3, grace=0.5)
+
+    def upstream(city: str) -> dict:
+        upstream_calls.append(city)
+        time.sleep(0.2)
+        return {"city": city, "version": len(upstream_calls)}
+
+    assert cache.get("roma", upstream, "Roma")["version"] == 1
+    assert cache.get("roma", upstream, "Roma")["version"] == 1 and len(upstream_calls) == 1
+
+    time.sleep(0.35)
+    start = time.perf_counter()
+    stale = [cache.get("roma", upstream, "Roma") for _ in range(8)]
+    assert time.perf_counter() - start < 0.05, "il dato scaduto deve essere restituito subito"
+    assert all(value["version"] == 1 for value in stale)
+
+    time.sleep(0.3)
+    assert len(upstream_calls) == 2, upstream_calls
+    assert cache.get("roma", upstream, "Roma")["version"] == 2
+
+    time.sleep(0.9)
+    assert cache.get("roma", upstream, "Roma")["version"] == 3
+
+    lookups = cache_lookups()
+    counts = {outcome: lookups.value(cache="selfcheck", outcome=outcome) for outcome in ("hit", "stale", "miss")}
+    assert counts == {"hit": 2, "stale": 8, "miss": 2}, counts
+    assert cache_revalidations().value(cache="selfcheck", outcome="deduplicated") == 7
+
+    # Più chiavi: quelle mancanti sono richieste con una sola chiamata
+    batches = []
+
+    def upstream_many(cities: list) -> list:
+        batches.append(list(cities))
+        return [city.upper() for city in cities]
+
+    many = SWRCache("selfcheck-many", ttl=60, grace=0)
+    many.put("roma", "ROMA")
+    assert many.get_many(["milano", "roma", "napoli"], upstream_many) == ["MILANO", "ROMA", "NAPOLI"]
+    assert many.get_many(["napoli", "milano"], upstream_many) == ["NAPOLI", "MILANO"]
+    assert batches == [["milano", "napoli"]], batches
+    print("OK: dati scaduti restituiti subito, un solo aggiornamento in background per chiave")
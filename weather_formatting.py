@@ -0,0 +1,257 @@
+"""
+Tabelle e modelli di formattazione delle risposte dell'agente meteo
+Sono preparati una volta all'import: i codici WMO sono una tupla indicizzata
+dal codice, le etichette dei giorni una tupla indicizzata dai giorni da oggi e
+le risposte sono modelli printf (%) con i campi in ordine fisso. Più righe
+(località, giorni o ore) sono formattate per colonna: ogni array numpy è
+convertito con un solo tolist() e i float entrano direttamente nel modello
+della riga, senza stringhe intermedie (misure in benchmarks/formatting.py)
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+
+# Descrizioni dei codici meteo WMO restituiti da Open-Meteo
+_WMO_CODES = {
+    0: "Cielo sereno",
+    1: "Prevalentemente sereno",
+    2: "Parzialmente nuvoloso",
+    3: "Nuvoloso",
+    45: "Nebbia",
+    48: "Nebbia con brina",
+    51: "Pioviggine leggera",
+    53: "Pioviggine moderata",
+    55: "Pioviggine intensa",
+    61: "Pioggia leggera",
+    63: "Pioggia moderata",
+    65: "Pioggia forte",
+    71: "Neve leggera",
+    73: "Neve moderata",
+    75: "Neve intensa",
+    80: "Rovesci leggeri",
+    81: "Rovesci moderati",
+    82: "Rovesci violenti",
+    95: "Temporale",
+    96: "Temporale con grandine leggera",
+    99: "Temporale con grandine"
+}
+
+# Tabella immutabile indicizzata dal codice WMO (0-99), "Codice N" per i codici senza descrizione
+WMO_DESCRIPTIONS = tuple(_WMO_CODES.get(code, f"Codice {code}") for code in range(100))
+
+# Etichette dei giorni indicizzate dai giorni da oggi (0-7)
+DAY_LABELS = ("oggi", "domani", "dopodomani") + tuple(f"tra {days} giorni" for days in range(3, 8))
+
+# Campi dei dati meteo giornalieri: (campo, variabile di Open-Meteo, formato), nell'ordine dei modelli
+DAILY_FIELDS = (
+    ("temperature_min", "temperature_2m_min", "%.1f°C"),
+    ("temperature_max", "temperature_2m_max", "%.1f°C"),
+    ("precipitation", "precipitation_sum", "%.1f mm"),
+    ("precipitation_probability", "precipitation_probability_max", "%.0f%%"),
+    ("windspeed", "windspeed_10m_max", "%.1f km/h"),
+)
+
+# Formato dei campi delle previsioni orarie (riassunto di una fascia)
+HOURLY_FORMATS = {
+    "temperature_min": "%.1f°C",
+    "temperature_max": "%.1f°C",
+    "precipitation": "%.1f mm",
+    "precipitation_probability": "%.0f%%",
+    "windspeed": "%.1f km/h",
+}
+
+SOURCE = "\nFonte: Open-Meteo API\n"
+
+# Località, giorno, data, latitudine, longitudine, condizione, poi i campi di DAILY_FIELDS
+DAILY_REPORT = (
+    "METEO A %s\n"
+    "%s (%s)\n"
+    "Coordinate: %.4f°N, %.4f°E\n\n"
+    "Condizione: %s\n"
+    "Temperatura: Min %s / Max %s\n"
+    "Precipitazioni: %s (probabilità %s)\n"
+    "Vento: %s\n"
+    + SOURCE
+)
+
+# Località, periodo, data, ore, latitudine, longitudine, pioggia, probabilità, precipitazioni,
+# condizione, temperature, vento, dettaglio orario
+HOURLY_REPORT = (
+    "METEO A %s\n"
+    "%s (%s, %s)\n"
+    "Coordinate: %.4f°N, %.4f°E\n\n"
+    "Pioggia: %s (probabilità massima %s, %s)\n"
+    "Condizione: %s\n"
+    "Temperatura: %s\n"
+    "Vento: fino a %s\n"
+    "%s"
+    + SOURCE
+)
+
+# Etichetta, condizione, poi i valori numerici di DAILY_FIELDS
+FORECAST_ROW = "%s: %s, Min %.1f°C / Max %.1f°C, precipitazioni %.1f mm (probabilità %.0f%%), vento %.1f km/h\n"
+
+# Ora, condizione, temperatura, probabilità di precipitazione
+HOUR_ROW = "%s  %s, %.1f°C, pioggia %.0f%%\n"
+
+COMPARISON_HEADER = "METEO A CONFRONTO: %s\n%s (%s)\n\n"
+
+# Estremo del confronto -> (variabile, modello della riga)
+COMPARISON_EXTREMES = (
+    ("warmest", "temperature_2m_max", "Più caldo: %s (%.1f°C)\n"),
+    ("coldest", "temperature_2m_min", "Più freddo: %s (%.1f°C)\n"),
+    ("wettest", "precipitation_probability_max", "Più probabile la pioggia: %s (%.0f%%)\n"),
+)
+
+
+def describe_weathercode(code: int) -> str:
+    """Descrizione in italiano di un codice WMO"""
+    return WMO_DESCRIPTIONS[code] if 0 <= code < len(WMO_DESCRIPTIONS) else f"Codice {code}"
+
+
+def describe_weathercodes(codes) -> List[str]:
+    """Descrizioni di una colonna di codici WMO (array numpy)"""
+    return [describe_weathercode(int(code)) for code in codes.tolist()]
+
+
+def day_label(days_offset: int) -> str:
+    """Descrizione leggibile del giorno (oggi, domani, dopodomani, tra N giorni)"""
+    return DAY_LABELS[days_offset] if 0 <= days_offset < len(DAY_LABELS) else f"tra {days_offset} giorni"
+
+
+def format_day(forecast: Dict[str, object], days_offset: int) -> Dict[str, str]:
+    """
+    Formatta i campi di un giorno delle previsioni giornaliere
+
+    Args:
+        forecast: Dizionario variabile -> array numpy degli 8 giorni
+        days_offset: Giorni da oggi
+
+    Returns:
+        Campo -> testo con l'unità di misura, nell'ordine di DAILY_FIELDS
+    """
+    # item() legge il valore come float Python, senza creare uno scalare numpy
+    return {field: pattern % forecast[variable].item(days_offset) for field, variable, pattern in DAILY_FIELDS}
+
+
+def format_summary(summary: Dict[str, float]) -> Dict[str, str]:
+    """Formatta i campi del riassunto di una fascia oraria"""
+    return {field: HOURLY_FORMATS[field] % value for field, value in summary.items() if field in HOURLY_FORMATS}
+
+
+def daily_report(location: str, period: str, date: Optional[str], latitude: float, longitude: float,
+                 condition: str, fields: Dict[str, str]) -> str:
+    """
+    Compone la risposta per una località e un giorno
+
+    Args:
+        location: Nome della località
+        period: Etichetta del giorno (es. "domani")
+        date: Data (gg/mm/aaaa)
+        latitude: Latitudine
+        longitude: Longitudine
+        condition: Descrizione del codice meteo
+        fields: I campi formattati da format_day
+
+    Returns:
+        Il testo della risposta
+    """
+    return DAILY_REPORT % (location.upper(), period.capitalize(), date, latitude, longitude, condition, *fields.values())
+
+
+def forecast_rows(labels: Sequence[str], columns: Dict[str, object]) -> str:
+    """
+    Formatta più righe (località o giorni) una colonna alla volta
+
+    Args:
+        labels: Etichetta di ogni riga (nome della località o del giorno)
+        columns: Variabile giornaliera -> array numpy con un valore per riga
+
+    Returns:
+        Le righe di testo, una per etichetta
+    """
+    values = [columns[variable].tolist() for _, variable, _ in DAILY_FIELDS]
+    conditions = describe_weathercodes(columns["weathercode"])
+    return "".join([FORECAST_ROW % row for row in zip(labels, conditions, *values)])
+
+
+def hour_rows(hours: Sequence[str], window: Dict[str, object]) -> str:
+    """
+    Formatta il dettaglio ora per ora di una fascia, una colonna alla volta
+
+    Args:
+        hours: Etichetta di ogni ora (es. "18:00")
+        window: Variabile oraria -> slice dell'array numpy della fascia
+
+    Returns:
+        Le righe di testo, una per ora
+    """
+    conditions = describe_weathercodes(window["weathercode"])
+    return "".join([
+        HOUR_ROW % row
+        for row in zip(hours, conditions, window["temperature_2m"].tolist(), window["precipitation_probability"].tolist())
+    ])
+
+
+def hourly_report(location: str, period: str, date: Optional[str], hours: str, latitude: float, longitude: float,
+                  rain_likely: bool, condition: str, fields: Dict[str, str], detail: str) -> str:
+    """
+    Compone la risposta per una fascia oraria
+
+    Args:
+        location: Nome della località
+        period: Etichetta del periodo (es. "stasera")
+        date: Data (gg/mm/aaaa)
+        hours: Orario della fascia (es. "18:00-00:00")
+        latitude: Latitudine
+        longitude: Longitudine
+        rain_likely: Se la pioggia è probabile
+        condition: Descrizione del codice meteo più severo
+        fields: I campi formattati da format_summary
+        detail: Il dettaglio ora per ora (vuoto per una sola ora)
+
+    Returns:
+        Il testo della risposta
+    """
+    temperatures = (
+        fields["temperature_min"] if fields["temperature_min"] == fields["temperature_max"]
+        else f"da {fields['temperature_min']} a {fields['temperature_max']}"
+    )
+    return HOURLY_REPORT % (
+        location.upper(), period.capitalize(), date, hours, latitude, longitude,
+        "probabile" if rain_likely else "improbabile", fields["precipitation_probability"], fields["precipitation"],
+        condition, temperatures, fields["windspeed"], detail
+    )
+
+
+def comparison_report(labels: Sequence[str], period: str, date: Optional[str], day: Dict[str, object],
+                      extremes: Dict[str, Optional[int]], missing: Sequence[str]) -> str:
+    """
+    Compone la risposta del confronto tra località
+
+    Args:
+        labels: Nomi delle località confrontate
+        period: Etichetta del giorno
+        date: Data (gg/mm/aaaa)
+        day: Variabile giornaliera -> array numpy con un valore per località
+        extremes: "warmest"/"coldest"/"wettest" -> indice della località (None se tutte uguali)
+        missing: Località senza coordinate
+
+    Returns:
+        Il testo della risposta
+    """
+    parts = [
+        COMPARISON_HEADER % (", ".join(label.upper() for label in labels), period.capitalize(), date),
+        forecast_rows(labels, day)
+    ]
+    lines = [
+        pattern % (labels[extremes[key]], day[variable].item(extremes[key]))
+        for key, variable, pattern in COMPARISON_EXTREMES if extremes[key] is not None
+    ]
+    if lines:
+        parts.append("\n")
+        parts.extend(lines)
+    if missing:
+        parts.append(f"\nCoordinate non trovate per: {', '.join(missing)}\n")
+    parts.append(SOURCE)
+    return "".join(parts)